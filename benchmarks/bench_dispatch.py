@@ -0,0 +1,81 @@
+"""
+Micro-benchmark: per-call tool dispatch overhead.
+
+Per tool call the agent finds the called tool by name and validates its
+arguments. The legacy path rebuilt the name index every step and ran the
+pydantic model plus model_dump() on every call; the current path uses the
+index built once per tool list and skips pydantic for primitive-only
+signatures whose arguments already have the right types (tools/registry.py).
+OpenAI schemas, which were rebuilt on every run, are now built once per tool.
+
+    python benchmarks/bench_dispatch.py [--tools 8] [--calls 20000]
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from tools.registry import Tool  # noqa: E402
+
+
+def search(query: str, max_results: int = 5, fresh: bool = False):
+    return None
+
+
+def tag(items: List[str], label: str = "x"):
+    return None
+
+
+def make_tools(count: int) -> List[Tool]:
+    tools = [Tool(f"tool_{i}", search, "Filler tool.") for i in range(count - 2)]
+    return tools + [Tool("search", search, "Search."), Tool("tag", tag, "Tag items.")]
+
+
+def legacy_dispatch(tools, name, arguments):
+    tool = {t.name: t for t in tools}[name]
+    return tool.model(**arguments).model_dump()
+
+
+def current_dispatch(index, name, arguments):
+    return index[name].validate_arguments(arguments)
+
+
+def per_call_us(func, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - start) * 1e6 / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tools", type=int, default=8, help="Tools the agent has (at least 2)")
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    tools = make_tools(max(args.tools, 2))
+    index = {tool.name: tool for tool in tools}
+    cases = [
+        ("primitive args", "search", {"query": "agents", "max_results": 3}),
+        ("coerced args", "search", {"query": "agents", "max_results": "3"}),
+        ("list args", "tag", {"items": ["a", "b"], "label": "y"}),
+    ]
+
+    print(f"{'case':<16}{'legacy µs':>12}{'current µs':>13}{'speedup':>10}")
+    for label, name, arguments in cases:
+        assert legacy_dispatch(tools, name, arguments) == current_dispatch(index, name, arguments)
+        legacy = per_call_us(lambda: legacy_dispatch(tools, name, arguments), args.calls)
+        current = per_call_us(lambda: current_dispatch(index, name, arguments), args.calls)
+        print(f"{label:<16}{legacy:>12.2f}{current:>13.2f}{legacy / current:>9.1f}x")
+
+    runs = max(args.calls // 100, 1)
+    legacy = per_call_us(lambda: [tool._build_openai_schema() for tool in tools], runs)
+    current = per_call_us(lambda: [tool.to_openai_schema() for tool in tools], runs)
+    print(f"\nschemas per run ({len(tools)} tools): legacy {legacy:.1f} µs, current {current:.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
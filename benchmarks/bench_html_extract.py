@@ -0,0 +1,109 @@
+"""
+Micro-benchmark: read_webpage text extraction.
+
+Compares the previous implementation (full BeautifulSoup tree, then keep
+the first N chars) with the bounded streaming extractor in
+tools/html_extract.py.
+
+    python benchmarks/bench_html_extract.py [--corpus DIR] [--max-chars 8000]
+
+DIR holds saved pages (*.html / *.htm). Without it a synthetic corpus of
+small, medium and multi-megabyte pages is generated in memory.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from bs4 import BeautifulSoup  # noqa: E402
+from tools.html_extract import StreamingTextExtractor, extract_text, _selectolax_available  # noqa: E402
+
+CHUNK_SIZE = 16 * 1024
+
+
+def legacy_extract(html: str, max_chars: int) -> str:
+    """The read_webpage body before the streaming extractor."""
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    text = "\n".join(line.strip() for line in soup.get_text().splitlines() if line.strip())
+    return text[:max_chars]
+
+
+def streaming_extract(html: str, max_chars: int) -> str:
+    """Feed the page in network-sized chunks, as extract_text_from_response does."""
+    extractor = StreamingTextExtractor(max_chars)
+    for start in range(0, len(html), CHUNK_SIZE):
+        if extractor.feed(html[start:start + CHUNK_SIZE]):
+            break
+    return extractor.text()
+
+
+def synthetic_page(paragraphs: int) -> str:
+    nav = "<nav>" + "".join(f'<a href="/s{i}">Section {i}</a>' for i in range(200)) + "</nav>"
+    script = "<script>" + "var x = 1;" * 2000 + "</script>"
+    body = "".join(
+        f"<p>Paragraph {i}: multi-agent systems coordinate specialised agents "
+        f"to research, analyse and write. <b>Detail</b> {i * 7}.</p>"
+        for i in range(paragraphs)
+    )
+    return f"<html><head><title>Synthetic</title>{script}</head><body>{nav}<article>{body}</article></body></html>"
+
+
+def load_corpus(directory):
+    if directory:
+        pages = {}
+        for path in sorted(glob.glob(os.path.join(directory, "*.htm*"))):
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                pages[os.path.basename(path)] = f.read()
+        if not pages:
+            raise SystemExit(f"No *.html files in {directory}")
+        return pages
+    return {
+        "small (50 paragraphs)": synthetic_page(50),
+        "medium (2k paragraphs)": synthetic_page(2_000),
+        "large (30k paragraphs)": synthetic_page(30_000),
+    }
+
+
+def measure(func, html, max_chars, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(html, max_chars)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(html, max_chars)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of saved HTML pages")
+    parser.add_argument("--max-chars", type=int, default=8000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    implementations = [("legacy bs4", legacy_extract), ("streaming", streaming_extract)]
+    if _selectolax_available():
+        implementations.append(
+            ("selectolax", lambda html, n: extract_text(html, n, backend="selectolax"))
+        )
+
+    print(f"{'page':<28}{'size':>10}  " + "".join(f"{name + ' ms / MiB':>26}" for name, _ in implementations))
+    for name, html in load_corpus(args.corpus).items():
+        row = f"{name:<28}{len(html) / 1024:>8.0f}KB  "
+        for _, func in implementations:
+            ms, mib = measure(func, html, args.max_chars, args.repeat)
+            row += f"{ms:>16.1f} / {mib:>6.1f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark: AdvancedLoopDetector per-call cost vs history length.
+
+Compares the previous detector (linear scan of the whole tool history,
+re-tokenizing on every comparison, O(w²) stagnation window) with the
+current one in observability/loop_detector.py. The current detector's
+per-call cost should stay flat as the history grows.
+
+    python benchmarks/bench_loop_detector.py [--sizes 100,1000,10000,50000] [--window 10]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from observability.loop_detector import AdvancedLoopDetector  # noqa: E402
+
+WORDS = [f"term{i}" for i in range(400)]
+
+
+class LegacyLoopDetector:
+    """The detector before the rework (same thresholds, unbounded history)."""
+
+    def __init__(self, exact_threshold=2, fuzzy_threshold=0.8, stagnation_window=3):
+        self.exact_threshold = exact_threshold
+        self.fuzzy_threshold = fuzzy_threshold
+        self.stagnation_window = stagnation_window
+        self.tool_history = []
+        self.output_history = []
+
+    def _jaccard_similarity(self, s1, s2):
+        tokens1, tokens2 = set(s1.lower().split()), set(s2.lower().split())
+        if not tokens1 and not tokens2:
+            return 1.0
+        if not tokens1 or not tokens2:
+            return 0.0
+        return len(tokens1 & tokens2) / len(tokens1 | tokens2)
+
+    def check_tool_call(self, tool_name, tool_input):
+        current = (tool_name, tool_input.strip())
+        exact = sum(1 for t, i in self.tool_history if (t, i.strip()) == current)
+        fuzzy = sum(
+            1 for t, i in self.tool_history[-5:]
+            if t == tool_name and self._jaccard_similarity(tool_input, i) >= self.fuzzy_threshold
+        )
+        self.tool_history.append(current)
+        return exact >= self.exact_threshold or fuzzy >= self.exact_threshold
+
+    def check_output_stagnation(self, output):
+        self.output_history.append(output)
+        recent = self.output_history[-self.stagnation_window:]
+        sims = [
+            self._jaccard_similarity(recent[i], recent[j])
+            for i in range(len(recent)) for j in range(i + 1, len(recent))
+        ]
+        return bool(sims) and sum(sims) / len(sims) >= self.fuzzy_threshold
+
+
+def random_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def per_call_us(detector, size, calls, rng):
+    # Fill the history, then time `calls` more checks of each kind
+    for _ in range(size):
+        detector.check_tool_call("search_web", random_text(rng, 6))
+        detector.check_output_stagnation(random_text(rng, 80))
+    inputs = [random_text(rng, 6) for _ in range(calls)]
+    outputs = [random_text(rng, 80) for _ in range(calls)]
+
+    start = time.perf_counter()
+    for text in inputs:
+        detector.check_tool_call("search_web", text)
+    tool_us = (time.perf_counter() - start) * 1e6 / calls
+
+    start = time.perf_counter()
+    for text in outputs:
+        detector.check_output_stagnation(text)
+    output_us = (time.perf_counter() - start) * 1e6 / calls
+    return tool_us, output_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000,50000")
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--window", type=int, default=10, help="Stagnation window")
+    args = parser.parse_args()
+
+    print(f"{'history':>10}{'legacy tool µs':>18}{'new tool µs':>14}{'legacy output µs':>20}{'new output µs':>16}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        legacy = per_call_us(LegacyLoopDetector(stagnation_window=args.window), size, args.calls, random.Random(0))
+        new = per_call_us(AdvancedLoopDetector(stagnation_window=args.window), size, args.calls, random.Random(0))
+        print(f"{size:>10}{legacy[0]:>18.1f}{new[0]:>14.1f}{legacy[1]:>20.1f}{new[1]:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark: CLI startup cost.
+
+Reports wall-clock time for `python -m src.main --help` and an
+`-X importtime` breakdown of the heaviest modules pulled in by the CLI
+and by the agent pipeline.
+
+    python benchmarks/bench_startup.py [--repeat 5] [--top 15] [--max-help-ms 800]
+
+With --max-help-ms the script exits non-zero when the median `--help`
+time exceeds the budget, so it can guard against import-time regressions.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ENV = {**os.environ, "PYTHONPATH": os.path.join(ROOT, "src"), "WARMUP_ENABLED": "false"}
+
+
+def time_help(repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "src.main", "--help"],
+            cwd=ROOT, env=ENV, check=True, stdout=subprocess.DEVNULL,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def import_times(module: str) -> list:
+    """(cumulative µs, self µs, module) for every module imported by `import module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=ENV, check=True, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return rows
+
+
+def report_imports(module: str, top: int):
+    rows = import_times(module)
+    total = next((cum for cum, _, name in rows if name == module), 0)
+    print(f"\nimport {module}: {total / 1000:.1f} ms total, {len(rows)} modules")
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for cum, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cum / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-help-ms", type=float, help="Fail if the median --help time exceeds this")
+    args = parser.parse_args()
+
+    timings = time_help(args.repeat)
+    median = statistics.median(timings)
+    print(f"python -m src.main --help: median {median:.0f} ms, min {min(timings):.0f} ms ({args.repeat} runs)")
+
+    report_imports("main", args.top)
+    report_imports("pipeline", args.top)
+
+    if args.max_help_ms is not None and median > args.max_help_ms:
+        print(f"\nFAIL: --help took {median:.0f} ms, budget {args.max_help_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: TechVectorStore index engines, recall@k vs query latency.
+
+The exact flat index gives the ground truth. HNSW is swept over efSearch
+and IVF over nprobe.
+
+    python benchmarks/bench_vector_index.py [--store DIR] [--n 100000] [--dim 384] [--k 10]
+
+DIR is an existing TechVectorStore directory (its segments are used as the
+corpus, with queries drawn from it). Without it, clustered random vectors
+are generated, roughly the shape of sentence embeddings.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from tools.segment_store import SegmentStore  # noqa: E402
+from tools.vector_index import VectorIndex  # noqa: E402
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_corpus(args) -> np.ndarray:
+    if args.store:
+        store = SegmentStore(args.store)
+        if not store.count:
+            raise SystemExit(f"No vectors in {args.store}")
+        return np.concatenate([np.asarray(seg) for seg in store.segments()])
+    return synthetic_corpus(args.n, args.dim)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def timed_search(index: VectorIndex, queries: np.ndarray, k: int):
+    # One query at a time, as TechVectorStore.query issues them
+    start = time.perf_counter()
+    found = np.vstack([index.search(q[None, :], k)[1] for q in queries])
+    return found, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def build(index: VectorIndex, vectors: np.ndarray, batch: int = 10_000) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(vectors), batch):
+        index.add(vectors[i:i + batch])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--store", help="Existing vector store directory")
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = load_corpus(args)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(n, args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    flat = VectorIndex(dim, "flat")
+    flat_build = build(flat, vectors)
+    truth, flat_ms = timed_search(flat, queries, args.k)
+
+    print(f"{n} vectors, dim {dim}, {args.queries} queries, k={args.k}\n")
+    print(f"{'index':<24}{'build s':>10}{'ms/query':>12}{f'recall@{args.k}':>12}")
+    print(f"{'flat (exact)':<24}{flat_build:>10.2f}{flat_ms:>12.3f}{1.0:>12.3f}")
+
+    hnsw = VectorIndex(dim, "hnsw")
+    hnsw_build = build(hnsw, vectors)
+    for ef in (16, 32, 64, 128, 256):
+        hnsw.ef_search = ef
+        found, ms = timed_search(hnsw, queries, args.k)
+        print(f"{f'hnsw efSearch={ef}':<24}{hnsw_build:>10.2f}{ms:>12.3f}{recall_at_k(found, truth):>12.3f}")
+
+    ivf = VectorIndex(dim, "ivf", train_min=min(n, 50_000))
+    ivf_build = build(ivf, vectors)
+    for nprobe in (1, 4, 8, 16, 64):
+        ivf.nprobe = nprobe
+        found, ms = timed_search(ivf, queries, args.k)
+        print(f"{f'ivf nprobe={nprobe}':<24}{ivf_build:>10.2f}{ms:>12.3f}{recall_at_k(found, truth):>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+import structlog
+
+from config import Config
+from observability.tracer import tracer
+from tools.cache import PersistentCache
+
+logger = structlog.get_logger()
+
+
+# ======================================
+# Canonicalization
+# ======================================
+def _message_to_dict(message: Any) -> dict:
+    if isinstance(message, dict):
+        return message
+    if hasattr(message, "model_dump"):
+        return message.model_dump(exclude_none=True)
+    return dict(vars(message))
+
+
+def canonicalize_message(message: Any) -> dict:
+    """
+    Stable form of one chat message.
+    Tool call ids are random per response, so they are dropped;
+    tool arguments are re-serialized with sorted keys.
+    """
+    data = _message_to_dict(message)
+    canonical = {"role": data.get("role"), "content": data.get("content")}
+
+    tool_calls = data.get("tool_calls")
+    if tool_calls:
+        canonical["tool_calls"] = []
+        for call in tool_calls:
+            call = _message_to_dict(call)
+            function = _message_to_dict(call.get("function", {}))
+            try:
+                arguments = json.dumps(json.loads(function.get("arguments") or "{}"), sort_keys=True)
+            except (TypeError, json.JSONDecodeError):
+                arguments = function.get("arguments")
+            canonical["tool_calls"].append({"name": function.get("name"), "arguments": arguments})
+    return canonical
+
+
+def _digest(payload: Any) -> str:
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def completion_key(model: str, messages: list, tools: Optional[list]) -> str:
+    return _digest({
+        "model": model,
+        "messages": [canonicalize_message(m) for m in messages],
+        "tools": tools or [],
+    })
+
+
+def _semantic_context_key(model: str, messages: list, tools: Optional[list]) -> str:
+    # Everything except the final user prompt must match exactly
+    return _digest({
+        "model": model,
+        "messages": [canonicalize_message(m) for m in messages[:-1]],
+        "tools": tools or [],
+    })
+
+
+# ======================================
+# Completion Cache
+# ======================================
+class CompletionCache:
+    """
+    Cache in front of the chat completion endpoint.
+    - exact tier: hash of model + canonical messages + tool schemas (SQLite, TTL/LRU)
+    - semantic tier (optional): embedding of the final user prompt, served
+      when cosine similarity to a cached prompt is above a threshold
+    """
+
+    def __init__(
+        self,
+        store: PersistentCache = None,
+        ttl: float = Config.COMPLETION_CACHE_TTL,
+        similarity_threshold: float = Config.SEMANTIC_CACHE_THRESHOLD,
+        max_semantic_entries: int = Config.SEMANTIC_CACHE_MAX_ENTRIES,
+        embed_fn: Callable[[List[str]], Any] = None,
+    ):
+        self.store = store or PersistentCache(
+            path=Config.COMPLETION_CACHE_PATH,
+            max_entries=Config.COMPLETION_CACHE_MAX_ENTRIES,
+            name="completion_cache",
+        )
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.max_semantic_entries = max_semantic_entries
+        self._embed_fn = embed_fn
+        # context_key -> OrderedDict[exact_key, normalized embedding]
+        self._semantic: OrderedDict[str, OrderedDict] = OrderedDict()
+        self._semantic_size = 0
+
+    # ---------------------------
+    # Embeddings
+    # ---------------------------
+    def _embed(self, text: str) -> np.ndarray:
+        if self._embed_fn is None:
+            # Same model the TechVectorStore uses; loaded only when the semantic tier is on
+            from tools.vector_store import get_tech_vector_store
+            self._embed_fn = get_tech_vector_store().embedder.encode
+        vector = np.asarray(self._embed_fn([text]), dtype="float32")[0]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _semantic_prompt(messages: list) -> Optional[str]:
+        last = _message_to_dict(messages[-1]) if messages else {}
+        if last.get("role") != "user" or not isinstance(last.get("content"), str):
+            return None
+        return last["content"]
+
+    def _semantic_lookup(self, context_key: str, vector: np.ndarray) -> Optional[str]:
+        entries = self._semantic.get(context_key)
+        if not entries:
+            return None
+        keys = list(entries.keys())
+        matrix = np.stack(list(entries.values()))
+        scores = matrix @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            entries.move_to_end(keys[best])
+            self._semantic.move_to_end(context_key)
+            return keys[best]
+        return None
+
+    def _semantic_add(self, context_key: str, exact_key: str, vector: np.ndarray):
+        entries = self._semantic.setdefault(context_key, OrderedDict())
+        if exact_key not in entries:
+            self._semantic_size += 1
+        entries[exact_key] = vector
+        self._semantic.move_to_end(context_key)
+
+        # Evict least recently used prompts until within bounds
+        while self._semantic_size > self.max_semantic_entries and self._semantic:
+            oldest_context, oldest_entries = next(iter(self._semantic.items()))
+            oldest_entries.popitem(last=False)
+            self._semantic_size -= 1
+            if not oldest_entries:
+                del self._semantic[oldest_context]
+            tracer.increment("completion_cache.semantic_eviction")
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    async def get(self, model: str, messages: list, tools: Optional[list], semantic: bool = False) -> Optional[dict]:
+        """Return a cached response as a dict (ChatCompletion.model_dump()), or None."""
+        exact_key = completion_key(model, messages, tools)
+        # SQLite + zlib work runs in a thread so it never stalls the event loop
+        cached = await asyncio.to_thread(self.store.get, exact_key)
+        if cached is not None:
+            return json.loads(cached)
+
+        prompt = self._semantic_prompt(messages) if semantic else None
+        if prompt is None:
+            return None
+
+        vector = await asyncio.to_thread(self._embed, prompt)
+        context_key = _semantic_context_key(model, messages, tools)
+        match_key = self._semantic_lookup(context_key, vector)
+        if match_key is None:
+            return None
+
+        cached = await asyncio.to_thread(self.store.get, match_key)
+        if cached is None:
+            return None
+        tracer.increment("completion_cache.semantic_hit")
+        return json.loads(cached)
+
+    async def put(self, model: str, messages: list, tools: Optional[list], response: Any, semantic: bool = False):
+        if not hasattr(response, "model_dump"):
+            return
+        exact_key = completion_key(model, messages, tools)
+        data = json.dumps(response.model_dump(), default=str)
+        await asyncio.to_thread(self.store.set, exact_key, data, self.ttl)
+
+        prompt = self._semantic_prompt(messages) if semantic else None
+        if prompt is not None:
+            vector = await asyncio.to_thread(self._embed, prompt)
+            self._semantic_add(_semantic_context_key(model, messages, tools), exact_key, vector)
+
+
+# Module-level cache shared by all agents; swap with set_completion_cache()
+completion_cache = CompletionCache()
+
+
+def set_completion_cache(cache: CompletionCache):
+    global completion_cache
+    completion_cache = cache
+
+
+def get_completion_cache() -> CompletionCache:
+    return completion_cache
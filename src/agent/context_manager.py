@@ -0,0 +1,200 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+from config import Config
+
+logger = structlog.get_logger()
+
+# Prompt budget per model (tokens); unknown models use Config.CONTEXT_TOKEN_BUDGET
+MODEL_CONTEXT_BUDGETS: Dict[str, int] = {
+    "z-ai/glm-4.5-air:free": 24000,
+    "gpt-4o": 32000,
+    "gpt-4o-mini": 32000,
+}
+
+STRATEGIES = ("truncate", "summarize", "evict")
+RECALL_TOOL_NAME = "recall_tool_output"
+
+
+# ======================================
+# Local token counting
+# ======================================
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """tiktoken when installed, otherwise the ~4 chars/token heuristic."""
+    global _encoding
+    if not text:
+        return 0
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def _get(message: Any, key: str):
+    return message.get(key) if isinstance(message, dict) else getattr(message, key, None)
+
+
+def message_text(message: Any) -> str:
+    text = _get(message, "content") or ""
+    for call in _get(message, "tool_calls") or []:
+        function = _get(call, "function")
+        text += f"{_get(function, 'name')}{_get(function, 'arguments')}"
+    return text
+
+
+@dataclass
+class CompactionReport:
+    tokens_before: int
+    tokens_after: int
+    compacted_messages: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+# ======================================
+# Context Manager
+# ======================================
+class ContextManager:
+    """
+    Keeps the prompt of a ReAct loop under a token budget.
+    Runs before every completion and compacts the oldest tool results first:
+    - truncate: keep the head of the output
+    - summarize: keep the lines most relevant to the user query
+    - evict: move the output to a side store the agent can re-fetch
+    Tool results of the last `keep_recent` steps (assistant turns), and always
+    those of the current step, are never touched.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        token_budget: Optional[int] = None,
+        strategy: str = Config.CONTEXT_STRATEGY,
+        keep_recent: int = 2,
+        compacted_chars: int = 800,
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown context strategy '{strategy}', expected one of {STRATEGIES}")
+        self.token_budget = token_budget or MODEL_CONTEXT_BUDGETS.get(model, Config.CONTEXT_TOKEN_BUDGET)
+        self.strategy = strategy
+        self.keep_recent = keep_recent
+        self.compacted_chars = compacted_chars
+
+        self._side_store: Dict[str, str] = {}
+        self._compacted: set = set()
+        self._token_cache: Dict[int, tuple] = {}
+
+    def reset(self):
+        self._side_store.clear()
+        self._compacted.clear()
+        self._token_cache.clear()
+
+    # ---------------------------
+    # Token accounting
+    # ---------------------------
+    def _message_tokens(self, message: Any) -> int:
+        # Re-count only when the content object changed
+        content = _get(message, "content")
+        cached = self._token_cache.get(id(message))
+        if cached is not None and cached[0] is content:
+            return cached[1]
+        tokens = count_tokens(message_text(message)) + 4  # role/format overhead
+        self._token_cache[id(message)] = (content, tokens)
+        return tokens
+
+    def count(self, messages: List[Any]) -> int:
+        return sum(self._message_tokens(m) for m in messages)
+
+    # ---------------------------
+    # Strategies
+    # ---------------------------
+    def _truncate(self, content: str) -> str:
+        dropped = len(content) - self.compacted_chars
+        return f"{content[:self.compacted_chars]}\n...[truncated {dropped} chars of older tool output]"
+
+    def _summarize(self, content: str, query: str) -> str:
+        terms = set(re.findall(r"\w+", query.lower()))
+        lines = [line.strip() for line in content.splitlines() if line.strip()]
+        ranked = sorted(
+            range(len(lines)),
+            key=lambda i: -len(terms & set(re.findall(r"\w+", lines[i].lower()))),
+        )
+        keep, size = [], 0
+        for i in ranked:
+            if size + len(lines[i]) > self.compacted_chars:
+                continue
+            keep.append(i)
+            size += len(lines[i])
+        summary = "\n".join(lines[i] for i in sorted(keep))
+        return f"[extract of older tool output, {len(content)} chars originally]\n{summary}"
+
+    def _evict(self, tool_call_id: str, content: str) -> str:
+        self._side_store[tool_call_id] = content
+        return (
+            f"[Older tool output evicted to save context ({len(content)} chars). "
+            f"Call {RECALL_TOOL_NAME} with tool_call_id='{tool_call_id}' to read it again.]"
+        )
+
+    def recall(self, tool_call_id: str) -> str:
+        """Return a tool output previously evicted from the context."""
+        return self._side_store.get(tool_call_id, f"No evicted output for tool_call_id '{tool_call_id}'.")
+
+    # ---------------------------
+    # Compaction
+    # ---------------------------
+    def compact(self, messages: List[Any], query: str = "") -> CompactionReport:
+        """Compact `messages` in place until they fit the budget."""
+        tokens_before = self.count(messages)
+        total = tokens_before
+        compacted = 0
+
+        if total > self.token_budget:
+            # Everything after the keep_recent-th last assistant turn stays whole
+            assistant_indexes = [i for i, m in enumerate(messages) if _get(m, "role") == "assistant"]
+            recent = max(self.keep_recent, 1)
+            boundary = assistant_indexes[-recent] if len(assistant_indexes) >= recent else 0
+            candidates = [
+                i for i, m in enumerate(messages[:boundary])
+                if isinstance(m, dict) and m.get("role") == "tool"
+            ]
+
+            for i in candidates:
+                if total <= self.token_budget:
+                    break
+                message = messages[i]
+                content = message.get("content") or ""
+                key = message.get("tool_call_id")
+                if key in self._compacted or len(content) <= self.compacted_chars:
+                    continue
+
+                before = self._message_tokens(message)
+                if self.strategy == "truncate":
+                    new_content = self._truncate(content)
+                elif self.strategy == "summarize":
+                    new_content = self._summarize(content, query)
+                else:
+                    new_content = self._evict(key, content)
+
+                messages[i] = {**message, "content": new_content}
+                self._compacted.add(key)
+                total += self._message_tokens(messages[i]) - before
+                compacted += 1
+
+        if compacted:
+            logger.info("context_compacted", strategy=self.strategy,
+                        tokens_before=tokens_before, tokens_after=total, messages=compacted)
+        return CompactionReport(tokens_before, total, compacted)
+
@@ -0,0 +1,40 @@
+"""
+Deadlines carried through the call stack.
+
+A per-query deadline is set around the pipeline; each agent step narrows it
+further. The LLM gateway bounds timeouts, retries and hedges by whatever
+deadline is current. Nested deadlines only ever tighten.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)  # time.monotonic()
+
+
+class DeadlineExceeded(TimeoutError):
+    """The current deadline passed before the work finished."""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Run the enclosed code under a deadline `seconds` from now (None/0: keep the current one)."""
+    if not seconds:
+        yield _deadline.get()
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        at = min(at, current)
+    token = _deadline.set(at)
+    try:
+        yield at
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds until the current deadline (negative once passed), or None without one."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
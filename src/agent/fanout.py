@@ -0,0 +1,334 @@
+"""
+Fan-out research: a drop-in replacement for the Researcher.
+
+1. Plan: one completion splits the query into up to `width` sub-questions.
+2. Research: a short-lived Researcher per sub-question (at most `worker_steps`
+   steps each), `max_concurrency` of them at a time, under an optional deadline.
+3. Merge: the findings are combined for the Analyst, with sources (pages read
+   and URLs cited) deduplicated across workers.
+
+The fan-out trace records the plan and each worker as steps. Its counters
+hold the wall-clock time, the serial estimate (the same work back to back)
+and the tokens used. With compare_serial, the serial Researcher also runs on
+the query and its wall-clock time and tokens are recorded next to them.
+"""
+import asyncio
+import json
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+import structlog
+
+from agent.deadline import deadline
+from agent.observable_agent import ObservableAgent
+from agent.specialists import DEFAULT_MODEL, create_researcher
+from config import Config
+from observability.pricing import Budget
+from observability.spans import span
+from observability.tracer import AgentStep, ToolCallRecord, tracer
+from tools.cache import normalize_url
+from tools.http_client import http_client
+
+logger = structlog.get_logger()
+
+PLAN_PROMPT = (
+    "You split research questions into independent sub-questions that can be researched in parallel.\n"
+    "Reply with a JSON array of at most {width} short, self-contained questions and nothing else."
+)
+_URL = re.compile(r"https?://[^\s<>\"')\]]+")
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def parse_subquestions(text: str, limit: int) -> List[str]:
+    """Sub-questions from the planner's reply: a JSON array, else one per line. Duplicates dropped."""
+    text = (text or "").strip()
+    items = None
+    match = re.search(r"\[.*\]", text, re.S)
+    if match:
+        try:
+            items = json.loads(match.group(0))
+        except ValueError:
+            items = None
+    if not isinstance(items, list):
+        items = [_LIST_MARKER.sub("", line) for line in text.splitlines()]
+
+    questions, seen = [], set()
+    for item in items:
+        question = str(item).strip()
+        key = " ".join(question.lower().split())
+        if question and key not in seen:
+            seen.add(key)
+            questions.append(question)
+    return questions[:limit]
+
+
+def dedupe_sources(urls) -> List[str]:
+    """URLs in first-seen order, one per normalized URL."""
+    sources, seen = [], set()
+    for url in urls:
+        url = url.rstrip(".,;:")
+        key = normalize_url(url)
+        if key not in seen:
+            seen.add(key)
+            sources.append(url)
+    return sources
+
+
+@dataclass
+class WorkerResult:
+    question: str
+    answer: Optional[str] = None
+    trace_id: Optional[str] = None
+    duration_ms: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+    sources: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+# ======================================
+# Fan-out Researcher
+# ======================================
+class FanOutResearcher:
+    """Plan → concurrent Researcher workers → merge; run() returns an agent-style result."""
+
+    def __init__(
+        self,
+        model: str = None,
+        width: int = None,
+        worker_steps: int = None,
+        max_concurrency: int = None,
+        deadline_seconds: float = None,
+        compare_serial: bool = None,
+        **agent_kwargs,
+    ):
+        self.model = model or DEFAULT_MODEL
+        self.agent_name = "Researcher"
+        self.width = Config.FANOUT_WIDTH if width is None else width
+        self.worker_steps = Config.FANOUT_WORKER_STEPS if worker_steps is None else worker_steps
+        self.max_concurrency = Config.FANOUT_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        self.deadline_seconds = Config.FANOUT_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds
+        self.compare_serial = Config.FANOUT_COMPARE_SERIAL if compare_serial is None else compare_serial
+        self.agent_kwargs = agent_kwargs
+        self.verbose = agent_kwargs.get("verbose", True)
+        self.last_result: dict = None
+
+    async def __aenter__(self):
+        http_client.attach()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await http_client.detach()
+
+    # ---------------------------
+    # Plan
+    # ---------------------------
+    async def _plan(self, query: str, budget: Optional[Budget]) -> tuple:
+        """(sub_questions, planner result or None)."""
+        if self.width <= 1:
+            return [query], None
+        kwargs = {k: v for k, v in self.agent_kwargs.items() if k != "routing"}
+        kwargs["verbose"] = False
+        planner = ObservableAgent(
+            model=self.model,
+            max_steps=1,
+            agent_name="Planner",
+            system_prompt=PLAN_PROMPT.format(width=self.width),
+            **kwargs,
+        )
+        result = await planner.run(query, budget=budget)
+        return parse_subquestions(result["answer"], self.width) or [query], result
+
+    # ---------------------------
+    # Research
+    # ---------------------------
+    async def _research(self, question: str, semaphore: asyncio.Semaphore, budget: Optional[Budget]) -> tuple:
+        """(WorkerResult, the worker's result dict or None)."""
+        async with semaphore:
+            worker = create_researcher(model=self.model, max_steps=self.worker_steps, **self.agent_kwargs)
+            started = time.perf_counter()
+            try:
+                result = await worker.run(question, budget=budget)
+            except Exception as e:
+                logger.error("fanout_worker_failed", question=question, error=str(e))
+                return WorkerResult(question, duration_ms=(time.perf_counter() - started) * 1000, error=str(e)), None
+
+        outcome = WorkerResult(
+            question=question,
+            answer=result["answer"],
+            trace_id=result["trace_id"],
+            duration_ms=(time.perf_counter() - started) * 1000,
+            input_tokens=result["total_input_tokens"],
+            output_tokens=result["total_output_tokens"],
+            cost_usd=result["run_cost_usd"],
+            sources=self._sources(result),
+        )
+        return outcome, result
+
+    def _sources(self, result: dict) -> List[str]:
+        """Pages the worker read, then URLs its answer cites."""
+        read = []
+        trace = tracer.get_trace(result["trace_id"])
+        for step in trace.steps if trace else []:
+            for call in step.tool_calls:
+                if call.tool_name == "read_webpage" and isinstance(call.tool_input, dict) and call.tool_input.get("url"):
+                    read.append(call.tool_input["url"])
+        return dedupe_sources(read + _URL.findall(result["answer"] or ""))
+
+    # ---------------------------
+    # Merge
+    # ---------------------------
+    def _merge(self, query: str, workers: List[WorkerResult]) -> tuple:
+        """(combined findings for the Analyst, deduplicated sources)."""
+        sections = [f"Research findings for: {query}"]
+        for i, worker in enumerate(workers, start=1):
+            findings = worker.answer or f"(no findings: {worker.error or 'no answer before the limit'})"
+            sections.append(f"### {i}. {worker.question}\n{findings.strip()}")
+        sources = dedupe_sources(url for worker in workers for url in worker.sources)
+        if sources:
+            sections.append("### Sources\n" + "\n".join(f"- {url}" for url in sources))
+        return "\n\n".join(sections), sources
+
+    # ---------------------------
+    # Run
+    # ---------------------------
+    async def run(self, user_query: str, budget: Budget = None) -> dict:
+        trace_id = tracer.start_trace("Researcher (fan-out)", user_query, self.model)
+        started = time.perf_counter()
+        try:
+            with span("fanout.run", **{"fanout.width": self.width, "agent.trace_id": trace_id}):
+                result = await self._run(user_query, trace_id, budget)
+        except Exception as e:
+            tracer.end_trace(trace_id, None, status="failed", error=str(e))
+            raise
+        except BaseException as e:
+            # Cancelled (astream consumer gone, fan-out deadline) or interrupted
+            tracer.end_trace(trace_id, None, status="cancelled", error=type(e).__name__)
+            raise
+        result["fanout"]["wall_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        tracer.increment("fanout.wall_ms", result["fanout"]["wall_ms"], trace_id=trace_id)
+
+        if self.compare_serial:
+            result["fanout"]["serial"] = await self._compare_serial(user_query, trace_id)
+
+        tracer.end_trace(trace_id, result["answer"])
+        result["trace_id"] = trace_id
+        self.last_result = result
+        return result
+
+    async def _run(self, user_query: str, trace_id: str, budget: Optional[Budget]) -> dict:
+        with deadline(self.deadline_seconds):
+            plan_started = time.perf_counter()
+            questions, plan = await self._plan(user_query, budget)
+            plan_ms = (time.perf_counter() - plan_started) * 1000
+            if self.verbose:
+                print(f"🔀 Fan-out: {len(questions)} sub-questions")
+                for question in questions:
+                    print(f"   • {question}")
+
+            semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+            outcomes = await asyncio.gather(*(self._research(q, semaphore, budget) for q in questions))
+
+        answer, sources = self._merge(user_query, [worker for worker, _ in outcomes])
+        runs = ([plan] if plan else []) + [result for _, result in outcomes if result]
+        workers = [worker for worker, _ in outcomes]
+
+        # Trace: the plan and each worker as steps
+        if plan:
+            tracer.log_step(trace_id, AgentStep(
+                step_number=0,
+                reasoning=plan["answer"],
+                input_tokens=plan["total_input_tokens"],
+                output_tokens=plan["total_output_tokens"],
+                cost_usd=plan["run_cost_usd"],
+                duration_ms=plan_ms,
+                model=self.model,
+            ))
+        for i, worker in enumerate(workers, start=1):
+            tracer.log_step(trace_id, AgentStep(
+                step_number=i,
+                reasoning=worker.question,
+                tool_calls=[ToolCallRecord(
+                    tool_name="research_worker",
+                    tool_input={"question": worker.question, "trace_id": worker.trace_id},
+                    tool_output=worker.answer or worker.error or "",
+                    duration_ms=worker.duration_ms,
+                )],
+                input_tokens=worker.input_tokens,
+                output_tokens=worker.output_tokens,
+                cost_usd=worker.cost_usd,
+                duration_ms=worker.duration_ms,
+                model=self.model,
+            ))
+
+        input_tokens = sum(run["total_input_tokens"] for run in runs)
+        output_tokens = sum(run["total_output_tokens"] for run in runs)
+        serial_estimate_ms = plan_ms + sum(worker.duration_ms for worker in workers)
+        failures = sum(1 for worker in workers if worker.error)
+        sources_cited = sum(len(worker.sources) for worker in workers)
+        for name, value in (
+            ("fanout.sub_questions", len(questions)),
+            ("fanout.worker_failures", failures),
+            ("fanout.serial_estimate_ms", round(serial_estimate_ms, 1)),
+            ("fanout.input_tokens", input_tokens),
+            ("fanout.output_tokens", output_tokens),
+            ("fanout.sources", len(sources)),
+            ("fanout.sources_deduplicated", sources_cited - len(sources)),
+        ):
+            tracer.increment(name, value, trace_id=trace_id)
+
+        cost_by_model = {}
+        for run in runs:
+            for model, usage in run["cost_by_model"].items():
+                total = cost_by_model.setdefault(model, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+                for key in total:
+                    total[key] += usage[key]
+        run_cost = sum(run["run_cost_usd"] for run in runs)
+
+        return {
+            "agent_name": self.agent_name,
+            "model_used": self.model,
+            "answer": answer,
+            "partial": any(run.get("partial") for run in runs),
+            "total_input_tokens": input_tokens,
+            "total_output_tokens": output_tokens,
+            "estimated_cost_usd": round(run_cost, 6),
+            "run_cost_usd": round(run_cost, 6),
+            "cost_by_model": {model: {**usage, "cost_usd": round(usage["cost_usd"], 6)} for model, usage in cost_by_model.items()},
+            "budget": {
+                "query": budget.to_dict() if budget is not None else None,
+                "actions": [action for run in runs for action in run["budget"]["actions"]],
+                "exhausted": any(run["budget"]["exhausted"] for run in runs),
+                "deadline_exceeded": any(run["budget"]["deadline_exceeded"] for run in runs),
+            },
+            "fanout": {
+                "sub_questions": questions,
+                "workers": [asdict(worker) for worker in workers],
+                "sources": sources,
+                "serial_estimate_ms": round(serial_estimate_ms, 1),
+                "serial": None,
+            },
+        }
+
+    async def _compare_serial(self, user_query: str, trace_id: str) -> dict:
+        """Run the serial Researcher on the same query and record its wall-clock time and tokens."""
+        researcher = create_researcher(model=self.model, **{**self.agent_kwargs, "verbose": False})
+        started = time.perf_counter()
+        try:
+            result = await researcher.run(user_query)
+        except Exception as e:
+            logger.error("fanout_serial_comparison_failed", error=str(e))
+            return {"error": str(e)}
+        serial = {
+            "trace_id": result["trace_id"],
+            "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+            "input_tokens": result["total_input_tokens"],
+            "output_tokens": result["total_output_tokens"],
+            "cost_usd": result["run_cost_usd"],
+        }
+        for name in ("wall_ms", "input_tokens", "output_tokens"):
+            tracer.increment(f"fanout.serial_{name}", serial[name], trace_id=trace_id)
+        return serial
@@ -0,0 +1,424 @@
+"""
+Shared gateway for chat-completion calls.
+
+Every ObservableAgent sends its completions through one LLMGateway:
+- token buckets for requests/minute and tokens/minute (AsyncRateLimiter)
+- a semaphore capping in-flight requests (held until a stream is drained)
+- jittered exponential retry (tenacity) for 429 / 5xx / connection errors
+  and timeouts, waiting at least as long as the server's Retry-After
+- a per-attempt timeout
+- queueing-delay metrics (gateway.stats and llm.* tracer counters)
+- hedging: a call still unanswered after a percentile of recent latency is
+  duplicated (optionally to a fallback model / base URL); the first answer
+  wins and the other request is cancelled
+- deadlines (agent/deadline.py) bound every timeout, retry and hedge
+
+The OpenAI client itself should not retry (max_retries=0); the gateway does.
+"""
+import asyncio
+import email.utils
+import json
+import os
+import time
+import weakref
+from collections import deque
+from typing import Any, Dict, Optional
+
+import structlog
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from agent.deadline import DeadlineExceeded, remaining_time
+from agent.rate_limiter import AsyncRateLimiter
+from config import Config
+from observability.spans import set_attribute
+from observability.tracer import tracer
+
+logger = structlog.get_logger()
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMTimeoutError(TimeoutError):
+    """A completion attempt exceeded the gateway's per-call timeout."""
+
+
+class LLMDeadlineExceeded(LLMTimeoutError, DeadlineExceeded):
+    """The caller's deadline passed; never retried."""
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    return getattr(exc, "status_code", None)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    if isinstance(exc, LLMTimeoutError):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    import openai
+    return isinstance(exc, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Delay requested by the server (retry-after-ms, or Retry-After in seconds or as an HTTP date)."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _RetryAfterWait:
+    """Jittered exponential backoff, but never shorter than the server's Retry-After."""
+
+    def __init__(self, base: float, maximum: float):
+        self.maximum = maximum
+        self.backoff = wait_random_exponential(multiplier=base, max=maximum)
+
+    def __call__(self, retry_state) -> float:
+        delay = self.backoff(retry_state)
+        exc = retry_state.outcome.exception() if retry_state.outcome else None
+        requested = retry_after_seconds(exc) if exc is not None else None
+        if requested is not None:
+            delay = max(delay, min(requested, self.maximum))
+        return delay
+
+
+def _stop_at_deadline(retry_state) -> bool:
+    """Give up when the next backoff would end past the deadline."""
+    remaining = remaining_time()
+    return remaining is not None and retry_state.upcoming_sleep >= remaining
+
+
+def _percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class _LoopState:
+    """asyncio primitives bind to one event loop, so each loop gets its own set."""
+
+    def __init__(self, gateway: "LLMGateway"):
+        self.semaphore = asyncio.Semaphore(gateway.max_concurrency)
+        self.requests = AsyncRateLimiter(gateway.requests_per_minute)
+        # A minute's worth of burst, so one large prompt never exceeds the bucket
+        self.tokens = AsyncRateLimiter(gateway.tokens_per_minute, capacity=max(1.0, gateway.tokens_per_minute))
+
+
+class _GatedStream:
+    """Holds the concurrency slot until the stream is drained; settles token usage from the final chunk."""
+
+    def __init__(self, stream, on_done):
+        self._stream = stream
+        self._on_done = on_done
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        usage = None
+        try:
+            async for chunk in self._stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                yield chunk
+        finally:
+            self._on_done(usage)
+
+    async def aclose(self):
+        """Abandon the stream (e.g. a hedge that lost) and free its slot."""
+        close = getattr(self._stream, "close", None)
+        if close is not None:
+            await close()
+        self._on_done(None)
+
+    def __del__(self):
+        # Dropped without being drained or closed: free the slot (on_done runs once)
+        self._on_done(None)
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        requests_per_minute: float = None,
+        tokens_per_minute: float = None,
+        max_concurrency: int = None,
+        max_retries: int = None,
+        timeout: float = None,
+        backoff_base: float = None,
+        backoff_max: float = None,
+        hedge_percentile: float = None,
+        hedge_min_samples: int = None,
+        hedge_model: str = None,
+        hedge_base_url: str = None,
+    ):
+        self.requests_per_minute = Config.LLM_RPM if requests_per_minute is None else requests_per_minute
+        self.tokens_per_minute = Config.LLM_TPM if tokens_per_minute is None else tokens_per_minute
+        self.max_concurrency = max_concurrency or Config.LLM_MAX_CONCURRENCY
+        self.max_retries = Config.LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or Config.LLM_TIMEOUT_SECONDS
+        self.backoff_base = Config.LLM_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = Config.LLM_BACKOFF_MAX if backoff_max is None else backoff_max
+        # Hedging (percentile 0 = off)
+        self.hedge_percentile = Config.LLM_HEDGE_PERCENTILE if hedge_percentile is None else hedge_percentile
+        self.hedge_min_samples = Config.LLM_HEDGE_MIN_SAMPLES if hedge_min_samples is None else hedge_min_samples
+        self.hedge_model = Config.LLM_HEDGE_MODEL if hedge_model is None else hedge_model
+        self.hedge_base_url = Config.LLM_HEDGE_BASE_URL if hedge_base_url is None else hedge_base_url
+        self._hedge_client = None
+        # (model, stream) -> recent seconds until the response (or stream) arrived
+        self._latencies: Dict[tuple, deque] = {}
+
+        self._states: "weakref.WeakKeyDictionary[Any, _LoopState]" = weakref.WeakKeyDictionary()
+        self.stats: Dict[str, float] = {
+            "requests": 0, "attempts": 0, "retries": 0, "rate_limited": 0,
+            "timeouts": 0, "failures": 0, "in_flight": 0,
+            "queue_ms_total": 0.0, "queue_ms_max": 0.0,
+            "hedged": 0, "hedge_won": 0, "hedge_extra_tokens": 0, "deadline_exceeded": 0,
+        }
+
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState(self)
+        return state
+
+    def _estimate_tokens(self, kwargs: dict, output: int = None) -> int:
+        prompt = len(json.dumps(kwargs.get("messages", []), default=str)) // 4
+        if output is None:
+            output = kwargs.get("max_tokens") or Config.LLM_EXPECTED_OUTPUT_TOKENS
+        return prompt + output
+
+    def _settle_tokens(self, state: _LoopState, charged: int, usage):
+        """Charge the token bucket for the difference between what was acquired and real usage."""
+        total = getattr(usage, "total_tokens", None) if usage is not None else None
+        if charged and total:
+            state.tokens.adjust(total - charged)
+
+    def _record(self, name: str, value: float = 1):
+        self.stats[name] += value
+        tracer.increment(f"llm.{name}", value)
+
+    async def create(self, client, **kwargs):
+        """
+        client.chat.completions.create(**kwargs) through the limits and retries.
+        Streams are returned wrapped; only opening them is retried.
+        """
+        self._record("requests")
+        delay = self.hedge_delay(kwargs)
+        try:
+            if delay is None:
+                return await self._create_with_retries(client, kwargs)
+            return await self._hedged(client, kwargs, delay)
+        except DeadlineExceeded:
+            self._record("deadline_exceeded")
+            raise
+        except Exception as e:
+            self._record("failures")
+            logger.error("llm_request_failed", model=kwargs.get("model"), error=str(e), status=_status_code(e))
+            raise
+
+    async def _create_with_retries(self, client, kwargs: dict):
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.max_retries + 1) | _stop_at_deadline,
+            wait=_RetryAfterWait(self.backoff_base, self.backoff_max),
+            retry=retry_if_exception(is_retryable),
+            before_sleep=self._before_retry,
+            reraise=True,
+        )
+        async for attempt in retrying:
+            with attempt:
+                return await self._attempt(client, kwargs)
+
+    # ---------------------------
+    # Hedging
+    # ---------------------------
+    def hedge_delay(self, kwargs: dict) -> Optional[float]:
+        """Seconds to wait before hedging this call, or None to not hedge."""
+        if self.hedge_percentile <= 0:
+            return None
+        samples = self._latencies.get((kwargs.get("model"), bool(kwargs.get("stream"))))
+        if not samples or len(samples) < self.hedge_min_samples:
+            return None
+        delay = _percentile(samples, self.hedge_percentile)
+        remaining = remaining_time()
+        if remaining is not None and remaining <= delay:
+            return None  # the hedge could not answer in time anyway
+        return delay
+
+    def _record_latency(self, kwargs: dict, seconds: float):
+        key = (kwargs.get("model"), bool(kwargs.get("stream")))
+        samples = self._latencies.get(key)
+        if samples is None:
+            samples = self._latencies[key] = deque(maxlen=Config.LLM_HEDGE_WINDOW)
+        samples.append(seconds)
+
+    def _hedge_target(self, client, kwargs: dict):
+        hedge_kwargs = dict(kwargs)
+        if self.hedge_model:
+            hedge_kwargs["model"] = self.hedge_model
+        if not self.hedge_base_url:
+            return client, hedge_kwargs
+        if self._hedge_client is None:
+            from openai import AsyncOpenAI
+
+            self._hedge_client = AsyncOpenAI(
+                api_key=os.getenv("LLM_HEDGE_API_KEY") or getattr(client, "api_key", None),
+                base_url=self.hedge_base_url,
+                max_retries=0,
+            )
+        return self._hedge_client, hedge_kwargs
+
+    async def _hedged(self, client, kwargs: dict, delay: float):
+        primary = asyncio.ensure_future(self._create_with_retries(client, kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except BaseException:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+
+        hedge_client, hedge_kwargs = self._hedge_target(client, kwargs)
+        hedge = asyncio.ensure_future(self._create_with_retries(hedge_client, hedge_kwargs))
+        self._record("hedged")
+        logger.info("llm_hedged", model=kwargs.get("model"), hedge_model=hedge_kwargs.get("model"), after_s=round(delay, 3))
+
+        pending = {primary, hedge}
+        winner, error = None, None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and winner is None:
+                        winner = task
+                    elif task.exception() is not None:
+                        error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if winner is None:
+            raise error
+        if winner is hedge:
+            self._record("hedge_won")
+        loser = primary if winner is hedge else hedge
+        await self._discard(loser, kwargs)
+        return winner.result()
+
+    async def _discard(self, loser, kwargs: dict):
+        """Account for the losing request: its usage if it finished, else its prompt estimate."""
+        extra_tokens = self._estimate_tokens(kwargs, output=0)
+        if loser.done() and not loser.cancelled() and loser.exception() is None:
+            response = loser.result()
+            if isinstance(response, _GatedStream):
+                await response.aclose()
+            else:
+                extra_tokens = getattr(getattr(response, "usage", None), "total_tokens", None) or extra_tokens
+        self._record("hedge_extra_tokens", extra_tokens)
+
+    def _before_retry(self, retry_state):
+        self._record("retries")
+        exc = retry_state.outcome.exception()
+        logger.warning(
+            "llm_retry",
+            attempt=retry_state.attempt_number,
+            wait_s=round(retry_state.next_action.sleep, 3),
+            status=_status_code(exc),
+            error=type(exc).__name__,
+        )
+
+    async def _attempt(self, client, kwargs: dict):
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise LLMDeadlineExceeded("Deadline passed before the LLM call")
+        state = self._state()
+        # What is taken from the token bucket; usage is settled against this, not the raw estimate
+        charged = min(self._estimate_tokens(kwargs), state.tokens.capacity) if self.tokens_per_minute > 0 else 0
+
+        queued_at = time.perf_counter()
+        await state.requests.acquire()
+        if charged:
+            await state.tokens.acquire(charged)
+        await state.semaphore.acquire()
+        queue_ms = (time.perf_counter() - queued_at) * 1000
+        self._record("attempts")
+        self._record("queue_ms_total", queue_ms)
+        self.stats["queue_ms_max"] = max(self.stats["queue_ms_max"], queue_ms)
+        set_attribute("llm.queue_ms", round(queue_ms, 1))
+
+        self.stats["in_flight"] += 1
+        released = False
+
+        def release(usage=None):
+            nonlocal released
+            if not released:
+                released = True
+                self.stats["in_flight"] -= 1
+                state.semaphore.release()
+                self._settle_tokens(state, charged, usage)
+
+        timeout = self.timeout
+        remaining = remaining_time()
+        deadline_bound = remaining is not None and remaining < timeout
+        if deadline_bound:
+            timeout = max(0.0, remaining)
+
+        sent_at = time.perf_counter()
+        try:
+            try:
+                response = await asyncio.wait_for(client.chat.completions.create(**kwargs), timeout)
+            except asyncio.TimeoutError:
+                if deadline_bound:
+                    raise LLMDeadlineExceeded(f"LLM call hit the deadline after {timeout:.2f}s")
+                self._record("timeouts")
+                raise LLMTimeoutError(f"LLM call exceeded {self.timeout}s")
+        except BaseException as e:
+            if _status_code(e) == 429:
+                self._record("rate_limited")
+            release()
+            raise
+
+        self._record_latency(kwargs, time.perf_counter() - sent_at)
+        if kwargs.get("stream"):
+            return _GatedStream(response, release)
+        release(getattr(response, "usage", None))
+        return response
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    """The process-wide gateway shared by all agents."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway()
+    return _gateway
+
+
+def configure_llm_gateway(**kwargs) -> LLMGateway:
+    """Replace the shared gateway (e.g. batch mode limits, tests)."""
+    global _gateway
+    _gateway = LLMGateway(**kwargs)
+    return _gateway
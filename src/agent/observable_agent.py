@@ -2,25 +2,119 @@ import asyncio
 import json
 import os
 import time
-from typing import List, Dict, Any
+from contextvars import ContextVar
+from dataclasses import asdict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 
 import structlog
-from openai import AsyncOpenAI
+
+from agent import completion_cache as completion_cache_module
+from agent.context_manager import RECALL_TOOL_NAME, ContextManager
+from agent.deadline import DeadlineExceeded, deadline, remaining_time
+from agent.llm_gateway import LLMGateway, get_llm_gateway
+from agent.routing import RoutingRule
+from agent.streaming import consume_stream
+from agent.tool_executor import ToolCallResult, ToolExecutor
+from config import Config
+from observability.loop_detector import AdvancedLoopDetector
+from observability.pricing import (
+    BUDGET_FINAL, BUDGET_SHRINK, BUDGET_STOP, Budget, cached_prompt_tokens, get_price_table, plan_step,
+)
+from observability.profiler import profiled_run
+from observability.spans import KIND_CLIENT, current_span, span, use_span
+from observability.tracer import tracer, AgentStep, LoopIntervention, ToolCallRecord
+from tools.http_client import http_client
+from tools.registry import Tool
 
 logger = structlog.get_logger()
 
+# Set while a run streams its output, so verbose prints do not interleave with it
+_streaming_run: ContextVar[bool] = ContextVar("streaming_run", default=False)
+
 
 # ==============================
-# OpenRouter Client
+# OpenRouter Client (created on first use)
 # ==============================
-client = AsyncOpenAI(
-    api_key=os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY"),
-    base_url="https://openrouter.ai/api/v1",
-    default_headers={
-        "HTTP-Referer": "http://localhost:3000",
-        "X-Title": "AI Agents Project",
-    },
+def get_client():
+    """The shared AsyncOpenAI client; openai is imported and the client built on first call."""
+    if "client" not in globals():
+        from openai import AsyncOpenAI
+
+        globals()["client"] = AsyncOpenAI(
+            api_key=os.getenv("OPENROUTER_API_KEY") or os.getenv("OPENAI_API_KEY"),
+            base_url="https://openrouter.ai/api/v1",
+            max_retries=0,  # retries, backoff and limits live in the LLM gateway
+            default_headers={
+                "HTTP-Referer": "http://localhost:3000",
+                "X-Title": "AI Agents Project",
+            },
+        )
+    return globals()["client"]
+
+
+def __getattr__(name):
+    # `observable_agent.client` keeps working (and stays patchable)
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+LOOP_POLICIES = ("short_circuit", "inject", "abort")
+
+# Completion tokens assumed for a step before the run has its own average
+DEFAULT_STEP_OUTPUT_TOKENS = 256
+BUDGET_FINAL_PROMPT = (
+    "[Budget] The time or spending limit for this task is nearly reached. Do not call any more tools; "
+    "give your best final answer now using the information you already have."
 )
+PARTIAL_ANSWER_NOTE = "[Partial result: the {limit} limit was reached before a final answer; this is the last intermediate output.]"
+
+
+def _partial_answer(last_content: Optional[str], limit: str) -> Optional[str]:
+    """The last text the model produced, marked as partial (None if it produced none)."""
+    if not last_content:
+        return None
+    return f"{PARTIAL_ANSWER_NOTE.format(limit=limit)}\n\n{last_content}"
+
+
+def _loop_signature(arguments: str) -> str:
+    """Tool arguments as stable "key: value" text (key order ignored) for the loop detector."""
+    try:
+        args = json.loads(arguments or "{}")
+    except json.JSONDecodeError:
+        return (arguments or "").strip()
+    if not isinstance(args, dict):
+        return json.dumps(args)
+    return " ".join(
+        f"{key}: {value if isinstance(value, str) else json.dumps(value)}"
+        for key, value in sorted(args.items())
+    ).strip()
+
+
+def _completion_from_cache(cached: dict):
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate(cached)
+
+
+def _completion_from_stream(message, usage, model: str):
+    """A streamed message as a ChatCompletion, so it is cached like a plain response."""
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate({
+        "id": "streamed",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "finish_reason": "tool_calls" if message.tool_calls else "stop",
+            "message": message.to_dict(),
+        }],
+        "usage": {
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "total_tokens": usage.prompt_tokens + usage.completion_tokens,
+        } if usage else None,
+    })
 
 
 class ObservableAgent:
@@ -28,10 +122,20 @@ class ObservableAgent:
     Production-ready Observable Agent
     Supports:
     - ReAct loop
-    - Tool calling
+    - Shared LLM gateway: rate limits, concurrency cap, retries, timeouts
+    - Token streaming (astream) with incremental tool-call assembly
+    - Tool calling (concurrent, off the event loop)
     - Token tracking
-    - Cost estimation
-    - Loop detection
+    - Completion caching (exact / semantic, opt-in per agent)
+    - Token-budgeted context compaction
+    - Model cascade (optional): steps try a fast model and escalate to
+      this agent's model for final answers and invalid tool calls
+    - Cost tracking from a per-model price table
+    - Spend budgets (per run and per query): fewer steps, no more tools,
+      a forced final answer, or a stop as the limit gets close
+    - Deadlines: each step gets a share of the query deadline (agent/deadline.py)
+    - Loop detection (repeated tool calls, stagnating outputs):
+      short-circuit the repeat, inject a correction, or abort
     """
 
     def __init__(
@@ -42,6 +146,16 @@ class ObservableAgent:
         verbose: bool = True,
         system_prompt: str = None,
         tools: list = None,
+        max_tool_concurrency: int = 8,
+        per_tool_concurrency: int = 4,
+        cache_completions: bool = None,
+        semantic_cache: bool = None,
+        context_budget: int = None,
+        context_strategy: str = None,
+        loop_policy: str = None,
+        budget_usd: float = None,
+        routing: RoutingRule = None,
+        gateway: LLMGateway = None,
     ):
         self.model = model or os.getenv("MODEL_NAME", "z-ai/glm-4.5-air:free")
         self.max_steps = max_steps
@@ -49,138 +163,718 @@ class ObservableAgent:
         self.system_prompt = system_prompt or f"You are {agent_name}."
         self.tools = tools or []
         self.verbose = verbose
+        self.tool_executor = ToolExecutor(
+            max_concurrency=max_tool_concurrency,
+            per_tool_concurrency=per_tool_concurrency,
+        )
+        self.cache_completions = (
+            Config.COMPLETION_CACHE_ENABLED if cache_completions is None else cache_completions
+        )
+        self.semantic_cache = (
+            Config.SEMANTIC_CACHE_ENABLED if semantic_cache is None else semantic_cache
+        )
+
+        # Context compaction before every completion
+        self.context_manager = ContextManager(
+            self.model,
+            token_budget=context_budget,
+            strategy=context_strategy or Config.CONTEXT_STRATEGY,
+        )
+        if self.context_manager.strategy == "evict":
+            self.tools = self.tools + [
+                Tool(
+                    name=RECALL_TOOL_NAME,
+                    func=self.context_manager.recall,
+                    description="Re-read an older tool output that was evicted from the context.",
+                )
+            ]
+
+        # Rate limits, retries and timeouts shared by every agent (None: the process-wide gateway)
+        self._gateway = gateway
 
         # Observability
         self.trace_log: List[Dict[str, Any]] = []
-        self.loop_detector = set()
+        self.loop_policy = loop_policy or Config.LOOP_POLICY
+        if self.loop_policy not in LOOP_POLICIES:
+            raise ValueError(f"Unknown loop policy '{self.loop_policy}', expected one of {LOOP_POLICIES}")
+        self.loop_detector = AdvancedLoopDetector(
+            exact_threshold=Config.LOOP_EXACT_THRESHOLD,
+            fuzzy_threshold=Config.LOOP_FUZZY_THRESHOLD,
+            stagnation_window=Config.LOOP_STAGNATION_WINDOW,
+        )
+        # (tool_name, signature) -> (step, ToolCallResult) for short-circuiting repeats
+        self._tool_results: Dict[tuple, tuple] = {}
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        # Usage of responses served from the completion cache (not billed)
+        self.cached_input_tokens = 0
+        self.cached_output_tokens = 0
+        self.cache_hits = 0
+        self.total_cost_usd = 0.0
+        # model -> billed calls, tokens and cost (models differ per step when routing)
+        self.usage_by_model: Dict[str, Dict[str, float]] = {}
+        # Cascade rule (agent/routing.py); None: every step uses self.model
+        self.routing = routing
+        # Spend limit for one run of this agent (0 = unlimited)
+        self.budget_usd = Config.AGENT_BUDGET_USD if budget_usd is None else budget_usd
+        self.last_result: Dict[str, Any] = None
+
+    # ======================================
+    # Lifecycle (shared HTTP pool)
+    # ======================================
+    async def __aenter__(self):
+        http_client.attach()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Release this agent's hold on the shared HTTP connection pool."""
+        await http_client.detach()
+
+    @property
+    def gateway(self) -> LLMGateway:
+        return self._gateway or get_llm_gateway()
+
+    # ======================================
+    # Tools: name index + OpenAI schemas
+    # ======================================
+    @property
+    def tools(self) -> List[Tool]:
+        return self._tools
+
+    @tools.setter
+    def tools(self, tools: List[Tool]):
+        """Assign a new list to change tools: the index and schemas are built here, not per step."""
+        self._tools = list(tools)
+        self._tool_index: Dict[str, Tool] = {tool.name: tool for tool in self._tools}
+        self._openai_tools = [tool.to_openai_schema() for tool in self._tools]
+
+    # ======================================
+    # Cost Estimation - from token counts and the price table (observability/pricing.py)
+    # ======================================
+    def _estimate_cost(self, input_tokens: int = None, output_tokens: int = None, cached_input_tokens: int = 0, model: str = None) -> float:
+        if input_tokens is None:
+            input_tokens = self.total_input_tokens
+        if output_tokens is None:
+            output_tokens = self.total_output_tokens
+
+        cost = get_price_table().cost(model or self.model, input_tokens, output_tokens, cached_input_tokens)
+        return round(cost, 6)
+
+    @property
+    def _verbose(self) -> bool:
+        """Verbose, unless this run is streaming its output."""
+        return self.verbose and not _streaming_run.get()
+
+    def _budget_action(self, trace_id, step, action, actions: list, kind: str = "budget"):
+        """Record a spend (kind="budget") or time (kind="deadline") limit action."""
+        actions.append({"step": step, "kind": kind, "action": action})
+        tracer.increment(f"{kind}.{action}", trace_id=trace_id)
+        if self._verbose:
+            print(f"💰 {kind.capitalize()}: {action} at step {step}")
 
     # ======================================
-    # Convert Tools → OpenAI Schema
+    # Completion (with cache layer)
     # ======================================
-    def _convert_tools_to_openai_schema(self):
-        return [tool.to_openai_schema() for tool in self.tools]
+    async def _create_completion(self, messages: list, openai_tools: list, model: str = None):
+        """Returns (response, cache_hit)."""
+        model = model or self.model
+        cache = completion_cache_module.get_completion_cache() if self.cache_completions else None
+
+        if cache is not None:
+            cached = await cache.get(model, messages, openai_tools, semantic=self.semantic_cache)
+            if cached is not None:
+                return _completion_from_cache(cached), True
+
+        response = await self.gateway.create(
+            get_client(),
+            model=model,
+            messages=messages,
+            tools=openai_tools if openai_tools else None,
+            tool_choice="auto" if openai_tools else None,
+        )
+
+        if cache is not None:
+            await cache.put(model, messages, openai_tools, response, semantic=self.semantic_cache)
+        return response, False
 
     # ======================================
-    # Cost Estimation (Approximate) - note : note api call for cost tracking, just estimation based on token counts
+    # Tracer
     # ======================================
-    def _estimate_cost(self) -> float:
-        input_cost_per_1k = 0.0003
-        output_cost_per_1k = 0.0006
+    def _log_trace_step(self, trace_id, step, message, start_time, tool_results=(), context=None, interventions=(), budget_action=None, **usage):
+        """usage: the step's token, cost and model fields of AgentStep."""
+        tracer.log_step(
+            trace_id,
+            AgentStep(
+                step_number=step,
+                reasoning=message.content,
+                tool_calls=[
+                    ToolCallRecord(
+                        tool_name=r.tool_name,
+                        tool_input=r.arguments,
+                        tool_output=r.output,
+                        duration_ms=r.duration_ms,
+                    )
+                    for r in tool_results
+                ],
+                duration_ms=(time.time() - start_time) * 1000,
+                context_tokens=context.tokens_after if context else 0,
+                context_tokens_saved=context.tokens_saved if context else 0,
+                loop_interventions=list(interventions),
+                budget_action=budget_action,
+                **usage,
+            ),
+        )
+        for intervention in interventions:
+            tracer.log_intervention(trace_id, intervention)
+
+    # ======================================
+    # Loop Detection
+    # ======================================
+    def _should_abort(self, interventions) -> bool:
+        return self.loop_policy == "abort" and bool(interventions)
+
+    def _intervention(self, step, detection, tool_name=None, **saved) -> LoopIntervention:
+        if self._verbose:
+            print(f"⚠️ {detection.message} [{self.loop_policy}]")
+        return LoopIntervention(
+            step_number=step,
+            strategy=detection.strategy,
+            action=self.loop_policy,
+            message=detection.message,
+            tool_name=tool_name,
+            **saved,
+        )
+
+    def _check_tool_call(self, tool_call, step, interventions) -> Optional[ToolCallResult]:
+        """
+        Check a tool call before it runs.
+        Returns the result to use instead of executing it, or None to execute.
+        """
+        name = tool_call.function.name
+        signature = _loop_signature(tool_call.function.arguments)
+        detection = self.loop_detector.check_tool_call(name, signature)
+        if not detection.is_looping:
+            return None
+
+        if self.loop_policy == "inject":
+            # Runs as usual; the correction is added to the conversation after the step
+            interventions.append(self._intervention(step, detection, name))
+            return None
+
+        earlier = self._tool_results.get((name, signature))
+        if self.loop_policy == "short_circuit" and earlier is not None:
+            earlier_step, earlier_result = earlier
+            interventions.append(
+                self._intervention(step, detection, name, tool_ms_saved=earlier_result.duration_ms)
+            )
+            output = (
+                f"[Loop detector] {detection.message} Same call as step {earlier_step}; "
+                f"its result is repeated here.\n\n{earlier_result.output}"
+            )
+        else:
+            # abort, or no identical earlier result to serve: the tool is not run
+            interventions.append(self._intervention(step, detection, name))
+            output = f"[Loop detector] {detection.message}"
+
+        return ToolCallResult(
+            tool_call_id=tool_call.id,
+            tool_name=name,
+            arguments=earlier[1].arguments if earlier else {},
+            output=output,
+            duration_ms=0.0,
+        )
+
+    async def _execute_tool_call(self, tool_call, tools, step_semaphore, step, interventions, parent_span=None) -> ToolCallResult:
+        # The check runs before the first await, so calls are checked in start order
+        served = self._check_tool_call(tool_call, step, interventions)
+        if served is not None:
+            return served
+        # Tools started mid-stream belong to the agent span, not the completion span
+        with use_span(parent_span or current_span()):
+            result = await self.tool_executor.execute_call(tool_call, tools, step_semaphore)
+        self._tool_results[(result.tool_name, _loop_signature(tool_call.function.arguments))] = (step, result)
+        return result
 
-        input_cost = (self.total_input_tokens / 1000) * input_cost_per_1k
-        output_cost = (self.total_output_tokens / 1000) * output_cost_per_1k
+    # ======================================
+    # Streaming Completion
+    # ======================================
+    async def _stream_completion(self, messages: list, openai_tools: list, on_delta, execute_tool, model: str = None):
+        """
+        Stream one completion. Content deltas are forwarded to on_delta and
+        each tool call starts executing as soon as its arguments are complete.
+        Only content of a step without tool calls is forwarded: while tools are
+        offered, content is held back (Config.STREAM_HOLDBACK_CHARS) until it is
+        clear the step answers. The assembled response is written to the cache.
+        Returns (message, usage, tool_tasks, cache_hit).
+        """
+        model = model or self.model
+        cache = completion_cache_module.get_completion_cache() if self.cache_completions else None
+        if cache is not None:
+            cached = await cache.get(model, messages, openai_tools, semantic=self.semantic_cache)
+            if cached is not None:
+                response = _completion_from_cache(cached)
+                message = response.choices[0].message
+                if message.content and not message.tool_calls:
+                    on_delta(message.content)
+                return message, response.usage, [], True
+
+        stream = await self.gateway.create(
+            get_client(),
+            model=model,
+            messages=messages,
+            tools=openai_tools if openai_tools else None,
+            tool_choice="auto" if openai_tools else None,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        tool_tasks = []
+
+        def start_tool(tool_call):
+            tool_tasks.append(asyncio.create_task(execute_tool(tool_call)))
+
+        try:
+            holdback = Config.STREAM_HOLDBACK_CHARS if openai_tools else 0
+            message, usage = await consume_stream(stream, on_delta, start_tool, holdback)
+        except BaseException:
+            for task in tool_tasks:
+                task.cancel()
+            raise
+
+        if cache is not None:
+            await cache.put(model, messages, openai_tools, _completion_from_stream(message, usage, model), semantic=self.semantic_cache)
+        return message, usage, tool_tasks, False
+
+    async def _call_model(self, model: str, messages: list, openai_tools: list, step: int, on_delta=None, execute_tool=None):
+        """
+        One completion on `model`, streamed when on_delta is given.
+        Returns (message, usage, tool_tasks, cache_hit).
+        """
+        tool_tasks = []
+        llm_attributes = {"llm.model": model, "llm.stream": on_delta is not None, "agent.step": step}
+        with span("llm.completion", KIND_CLIENT, **llm_attributes) as llm_span:
+            if on_delta is not None:
+                message, usage, tool_tasks, cache_hit = await self._stream_completion(
+                    messages, openai_tools, on_delta, execute_tool, model
+                )
+            else:
+                response, cache_hit = await self._create_completion(messages, openai_tools, model)
+                message, usage = response.choices[0].message, response.usage
+            llm_span.set_attribute("llm.cache_hit", cache_hit)
+            if usage:
+                llm_span.set_attribute("llm.input_tokens", usage.prompt_tokens)
+                llm_span.set_attribute("llm.output_tokens", usage.completion_tokens)
+        return message, usage, tool_tasks, cache_hit
+
+    async def _complete_step(self, trace_id, step, messages, step_tools, tools_by_name, on_delta, execute_tool):
+        """
+        The step's completion: on the fast model first when routing, redone on
+        self.model when the fast output is not kept.
+        Returns (message, calls, tool_tasks, cache_hit, model, escalation, streamed);
+        calls lists (model, usage, cache_hit) for every completion made.
+        """
+        streaming = on_delta is not None
+        model = self.model if self.routing is None else self.routing.first_model(self.model, final_only=not step_tools)
+        # A fast step is not streamed: its content is only shown if it is kept
+        streamed = streaming and model == self.model
+        message, usage, tool_tasks, cache_hit = await self._call_model(
+            model, messages, step_tools, step, on_delta if streamed else None, execute_tool
+        )
+        calls = [(model, usage, cache_hit)]
+
+        escalation = None
+        if model != self.model:
+            escalation = self.routing.escalation(message, tools_by_name)
+            if escalation:
+                tracer.increment(f"routing.escalated.{escalation}", trace_id=trace_id)
+                if self._verbose:
+                    print(f"↗️ {model} → {self.model} ({escalation})")
+                model, streamed = self.model, streaming
+                message, usage, tool_tasks, cache_hit = await self._call_model(
+                    model, messages, step_tools, step, on_delta if streamed else None, execute_tool
+                )
+                calls.append((model, usage, cache_hit))
+            else:
+                tracer.increment("routing.fast_kept", trace_id=trace_id)
+                if streaming and message.content and not message.tool_calls:
+                    on_delta(message.content)
+        return message, calls, tool_tasks, cache_hit, model, escalation, streamed
+
+    def _track_usage(self, calls: list, step_usage: dict):
+        """Add each (model, usage, cache_hit) of a step to the agent's and the step's totals."""
+        for model, usage, cache_hit in calls:
+            if not usage:
+                continue
+            if cache_hit:
+                self.cache_hits += 1
+                self.cached_input_tokens += usage.prompt_tokens
+                self.cached_output_tokens += usage.completion_tokens
+                step_usage["cached_input_tokens"] += usage.prompt_tokens
+                step_usage["cached_output_tokens"] += usage.completion_tokens
+                continue
 
-        return round(input_cost + output_cost, 6)
+            prompt_cache_tokens = cached_prompt_tokens(usage)
+            cost = self._estimate_cost(usage.prompt_tokens, usage.completion_tokens, prompt_cache_tokens, model)
+            self.total_input_tokens += usage.prompt_tokens
+            self.total_output_tokens += usage.completion_tokens
+            self.total_cost_usd += cost
+            step_usage["input_tokens"] += usage.prompt_tokens
+            step_usage["output_tokens"] += usage.completion_tokens
+            step_usage["prompt_cache_tokens"] += prompt_cache_tokens
+            step_usage["cost_usd"] += cost
+
+            by_model = self.usage_by_model.setdefault(
+                model, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+            )
+            by_model["calls"] += 1
+            by_model["input_tokens"] += usage.prompt_tokens
+            by_model["output_tokens"] += usage.completion_tokens
+            by_model["cost_usd"] += cost
 
     # ======================================
     # Main Agent Loop
     # ======================================
-    async def run(self, user_query: str) -> dict:
+    async def run(self, user_query: str, on_delta: Callable[[str], Any] = None, profile: bool = None, budget: Budget = None) -> dict:
+        """
+        Run the ReAct loop to completion.
+        With on_delta, completions are streamed and every content delta is passed to it.
+        profile=True records cProfile stats on the trace (None: sampled at Config.PROFILE_SAMPLE_RATE).
+        budget is a shared (per-query) Budget charged with this run's cost, on top of budget_usd.
+        """
+        trace_id = tracer.start_trace(self.agent_name, user_query, self.model)
+        attributes = {"agent.name": self.agent_name, "agent.model": self.model, "agent.trace_id": trace_id}
+        streaming = _streaming_run.set(on_delta is not None)
+        try:
+            with profiled_run(trace_id, profile), span("agent.run", **attributes):
+                result = await self._run_loop(user_query, trace_id, on_delta, budget)
+        except Exception as e:
+            tracer.end_trace(trace_id, None, status="failed", error=str(e))
+            raise
+        except BaseException as e:
+            # Cancelled (astream consumer gone, fan-out deadline) or interrupted
+            tracer.end_trace(trace_id, None, status="cancelled", error=type(e).__name__)
+            raise
+        finally:
+            _streaming_run.reset(streaming)
+
+        tracer.end_trace(trace_id, result["answer"])
+        result["trace_id"] = trace_id
+        self.last_result = result
+        return result
+
+    async def astream(self, user_query: str, budget: Budget = None) -> AsyncIterator[str]:
+        """
+        Run the agent, yielding content deltas as they arrive.
+        The full result dict is available as `self.last_result` afterwards.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+
+        async def produce():
+            try:
+                await self.run(user_query, on_delta=queue.put_nowait, budget=budget)
+            finally:
+                queue.put_nowait(done)
+
+        task = asyncio.create_task(produce())
+        try:
+            while True:
+                delta = await queue.get()
+                if delta is done:
+                    break
+                yield delta
+            await task  # surface errors from the run
+        finally:
+            if not task.done():
+                task.cancel()
+
+    async def _run_loop(self, user_query: str, trace_id: str, on_delta=None, budget: Budget = None) -> dict:
         messages = [
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": user_query},
         ]
 
-        openai_tools = self._convert_tools_to_openai_schema()
+        openai_tools = self._openai_tools
         final_answer = None
+        streaming = on_delta is not None
+        self.context_manager.reset()
+        self.loop_detector.reset()
+        self._tool_results.clear()
+        run_tokens = 0
+        run_interventions: List[LoopIntervention] = []
+
+        run_budget = Budget(self.budget_usd)
+        budgets = [b for b in (run_budget, budget) if b is not None]
+        budgeted = any(b.limited for b in budgets)
+        budget_actions: List[dict] = []
+        run_cost = 0.0
+        run_output_tokens = 0
+        last_step = self.max_steps
+        forced_final = False
+        budget_exhausted = False
+        deadline_exceeded = False
+        last_content = None
+        run_started = time.time()
 
         for step in range(1, self.max_steps + 1):
+            if step > last_step:
+                break
             start_time = time.time()
 
-            response = await client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=openai_tools if openai_tools else None,
-                tool_choice="auto" if openai_tools else None,
-            )
+            # ======================
+            # Context Compaction
+            # ======================
+            context = self.context_manager.compact(messages, user_query)
+            if context.tokens_saved:
+                tracer.increment("context.tokens_saved", context.tokens_saved)
+
+            # ======================
+            # Budget
+            # ======================
+            budget_action = None
+            final_kind = None
+            step_tools = openai_tools
+            if budgeted:
+                expected_output = run_output_tokens / (step - 1) if step > 1 else DEFAULT_STEP_OUTPUT_TOKENS
+                # Priced at the model routing will try first (the last step always answers)
+                step_model = self.model if self.routing is None else self.routing.first_model(
+                    self.model, final_only=not step_tools or step == last_step
+                )
+                estimated_cost = self._estimate_cost(context.tokens_after, round(expected_output), model=step_model)
+                action, affordable = plan_step(budgets, estimated_cost, last_step - step + 1)
+
+                if action == BUDGET_STOP:
+                    self._budget_action(trace_id, step, action, budget_actions)
+                    final_answer = _partial_answer(last_content, "spending")
+                    budget_exhausted = True
+                    break
+                if action == BUDGET_SHRINK:
+                    last_step = step + affordable - 1
+                    budget_action = action
+                    self._budget_action(trace_id, step, action, budget_actions)
+                if action == BUDGET_FINAL or step == last_step:
+                    # Under a budget the last step always answers instead of calling tools
+                    final_kind = "budget"
+
+            # ======================
+            # Deadline
+            # ======================
+            step_seconds = None
+            remaining = remaining_time()
+            if remaining is not None:
+                if remaining <= 0:
+                    self._budget_action(trace_id, step, BUDGET_STOP, budget_actions, kind="deadline")
+                    final_answer = _partial_answer(last_content, "time")
+                    deadline_exceeded = True
+                    break
+                steps_left = last_step - step + 1
+                average_step = (time.time() - run_started) / (step - 1) if step > 1 else 0.0
+                if steps_left > 1 and remaining < 2 * average_step:
+                    final_kind = final_kind or "deadline"
+                    steps_left = 1
+                # An even share of what is left, but never less than the minimum (capped by the query deadline)
+                step_seconds = max(remaining / steps_left, min(remaining, Config.STEP_DEADLINE_MIN_SECONDS))
+
+            if final_kind is not None:
+                step_tools = []
+                if not forced_final:
+                    forced_final = True
+                    budget_action = BUDGET_FINAL
+                    self._budget_action(trace_id, step, BUDGET_FINAL, budget_actions, kind=final_kind)
+                    messages.append({"role": "user", "content": BUDGET_FINAL_PROMPT})
+                last_step = step
+
+            interventions: List[LoopIntervention] = []
+            tools_by_name = self._tool_index
+            step_semaphore = self.tool_executor.step_semaphore()
+
+            agent_span = current_span()
+
+            def execute_tool(tool_call, step=step, interventions=interventions):
+                return self._execute_tool_call(tool_call, tools_by_name, step_semaphore, step, interventions, agent_span)
 
-            message = response.choices[0].message
+            # ======================
+            # Completion (bounded by the step deadline)
+            # ======================
+            completion = self._complete_step(trace_id, step, messages, step_tools, tools_by_name, on_delta, execute_tool)
+            try:
+                with deadline(step_seconds) as step_deadline:
+                    if step_seconds is None:
+                        completed = await completion
+                    else:
+                        completed = await asyncio.wait_for(completion, step_seconds)
+            except TimeoutError as e:
+                if not isinstance(e, DeadlineExceeded) and (step_deadline is None or time.monotonic() < step_deadline - 0.05):
+                    raise  # an ordinary LLM timeout after retries, not the deadline
+                self._budget_action(trace_id, step, "exceeded", budget_actions, kind="deadline")
+                final_answer = _partial_answer(last_content, "time")
+                deadline_exceeded = True
+                break
+            message, usage_calls, tool_tasks, cache_hit, model, escalation, streamed = completed
 
             # ======================
-            # Token Tracking
+            # Token & Cost Tracking
             # ======================
-            if response.usage:
-                self.total_input_tokens += response.usage.prompt_tokens
-                self.total_output_tokens += response.usage.completion_tokens
+            step_usage = {
+                "model": model, "escalation": escalation, "cache_hit": cache_hit,
+                "input_tokens": 0, "output_tokens": 0, "cached_input_tokens": 0, "cached_output_tokens": 0,
+                "prompt_cache_tokens": 0, "cost_usd": 0.0,
+            }
+            self._track_usage(usage_calls, step_usage)
+            step_tokens = sum(step_usage[k] for k in ("input_tokens", "output_tokens", "cached_input_tokens", "cached_output_tokens"))
+            run_tokens += step_tokens
+            run_output_tokens += step_usage["output_tokens"] + step_usage["cached_output_tokens"]
+
+            step_cost = step_usage["cost_usd"]
+            for b in budgets:
+                b.charge(step_cost)
+            run_cost += step_cost
+            if message.content:
+                last_content = message.content
 
             step_record = {
                 "step": step,
                 "model_response": message.content,
                 "tools_called": [],
                 "latency_sec": round(time.time() - start_time, 3),
+                "cache_hit": cache_hit,
+                "context_tokens": context.tokens_after,
+                "context_tokens_saved": context.tokens_saved,
+                "model": model,
+                "escalation": escalation,
+                "cost_usd": step_cost,
+                "budget_action": budget_action,
             }
 
-            if self.verbose:
+            if self._verbose:
                 print(f"\n[{self.agent_name} - Step {step}]")
                 print("Response:", message.content)
 
             # ======================
-            # Loop Detection
+            # Loop Detection (outputs)
             # ======================
-            if message.content and message.content in self.loop_detector:
-                if self.verbose:
-                    print("⚠️ Loop detected. Stopping execution.")
-                break
-
+            # A stagnating final answer still ends the run; only intermediate steps are acted on
             if message.content:
-                self.loop_detector.add(message.content)
+                detection = self.loop_detector.check_output_stagnation(message.content)
+                if detection.is_looping and message.tool_calls:
+                    interventions.append(self._intervention(step, detection))
 
             # ======================
             # Tool Calling
             # ======================
-            if message.tool_calls:
-                messages.append(message)
-
-                for tool_call in message.tool_calls:
-                    tool_name = tool_call.function.name
-                    arguments = json.loads(tool_call.function.arguments)
-
-                    tool = next((t for t in self.tools if t.name == tool_name), None)
-
-                    if not tool:
-                        continue
-
-                    try:
-                        result = tool.execute(**arguments)
-                    except Exception as e:
-                        result = f"Tool execution failed: {str(e)}"
-
+            results = []
+            if message.tool_calls and not self._should_abort(interventions):
+                messages.append(message.to_dict() if streamed else message)
+
+                # Tools share the step deadline with the completion (the query deadline without one).
+                # Tasks already started while the completion was streaming are reused.
+                if not tool_tasks:
+                    tool_tasks = [asyncio.create_task(execute_tool(tc)) for tc in message.tool_calls]
+                tool_seconds = None if step_deadline is None else step_deadline - time.monotonic()
+                try:
+                    with deadline(tool_seconds):
+                        if tool_seconds is None:
+                            results = await asyncio.gather(*tool_tasks)
+                        else:
+                            results = await asyncio.wait_for(asyncio.gather(*tool_tasks), max(tool_seconds, 0))
+                except TimeoutError as e:
+                    if not isinstance(e, DeadlineExceeded) and (step_deadline is None or time.monotonic() < step_deadline - 0.05):
+                        raise
+                    for task in tool_tasks:
+                        task.cancel()
+                    self._budget_action(trace_id, step, "exceeded", budget_actions, kind="deadline")
+                    final_answer = _partial_answer(last_content, "time")
+                    deadline_exceeded = True
+                    self.trace_log.append(step_record)
+                    self._log_trace_step(trace_id, step, message, start_time, context=context, interventions=interventions, budget_action=budget_action, **step_usage)
+                    break
+
+                for result in results:
                     step_record["tools_called"].append(
-                        {tool_name: result}
+                        {result.tool_name: result.output}
                     )
 
                     messages.append(
                         {
                             "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "content": str(result),
+                            "tool_call_id": result.tool_call_id,
+                            "content": result.output,
                         }
                     )
 
-                    if self.verbose:
-                        print(f"🔧 Tool executed: {tool_name}")
+                    if self._verbose:
+                        print(f"🔧 Tool executed: {result.tool_name} ({result.duration_ms:.0f} ms)")
+
+            run_interventions.extend(interventions)
+            step_record["loop_interventions"] = [asdict(i) for i in interventions]
+
+            if self._should_abort(interventions):
+                for task in tool_tasks:
+                    task.cancel()
+                # Estimate what the remaining steps would have cost at this run's average
+                steps_saved = self.max_steps - step
+                interventions[-1].steps_saved = steps_saved
+                interventions[-1].tokens_saved = round(run_tokens / step * steps_saved)
+                step_record["loop_interventions"] = [asdict(i) for i in interventions]
+                if self._verbose:
+                    print("⚠️ Loop detected. Stopping execution.")
+                self.trace_log.append(step_record)
+                self._log_trace_step(trace_id, step, message, start_time, results, context=context, interventions=interventions, budget_action=budget_action, **step_usage)
+                break
+
+            if message.tool_calls:
+                # Corrections not already delivered through a tool result
+                notes = [
+                    i.message for i in interventions
+                    if self.loop_policy == "inject" or i.tool_name is None
+                ]
+                if notes:
+                    messages.append({
+                        "role": "user",
+                        "content": "[Loop detector] " + " ".join(dict.fromkeys(notes)),
+                    })
 
                 self.trace_log.append(step_record)
+                self._log_trace_step(trace_id, step, message, start_time, results, context=context, interventions=interventions, budget_action=budget_action, **step_usage)
                 continue
 
             # ======================
             # Final Answer
             # ======================
             final_answer = message.content
-            messages.append(message)
+            messages.append(message.to_dict() if streamed else message)
             self.trace_log.append(step_record)
+            self._log_trace_step(trace_id, step, message, start_time, context=context, interventions=interventions, budget_action=budget_action, **step_usage)
             break
 
         return {
             "agent_name": self.agent_name,
             "model_used": self.model,
             "answer": final_answer,
+            "partial": budget_exhausted or deadline_exceeded,
             "trace_log": self.trace_log,
             "total_input_tokens": self.total_input_tokens,
             "total_output_tokens": self.total_output_tokens,
-            "estimated_cost_usd": self._estimate_cost(),
+            "cached_input_tokens": self.cached_input_tokens,
+            "cached_output_tokens": self.cached_output_tokens,
+            "cache_hits": self.cache_hits,
+            "loop_interventions": [asdict(i) for i in run_interventions],
+            "estimated_cost_usd": round(self.total_cost_usd, 6),
+            "run_cost_usd": round(run_cost, 6),
+            "cost_by_model": {
+                name: {**usage, "cost_usd": round(usage["cost_usd"], 6)}
+                for name, usage in self.usage_by_model.items()
+            },
+            "budget": {
+                "agent": run_budget.to_dict(),
+                "query": budget.to_dict() if budget is not None else None,
+                "actions": budget_actions,
+                "exhausted": budget_exhausted,
+                "deadline_exceeded": deadline_exceeded,
+            },
         }
 
 
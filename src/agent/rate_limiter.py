@@ -0,0 +1,51 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class AsyncRateLimiter:
+    """
+    Token bucket limiter shared by concurrent coroutines.
+    `rate_per_minute` tokens refill continuously; bursts up to `capacity`.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 60)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity,
+            self._tokens + (now - self._updated_at) * self.rate_per_minute / 60,
+        )
+        self._updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Wait until `amount` tokens are available; returns seconds waited."""
+        if self.rate_per_minute <= 0:
+            return 0.0
+
+        waited = 0.0
+        # The lock keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) * 60 / self.rate_per_minute
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def adjust(self, amount: float):
+        """
+        Take `amount` more tokens (or give back, if negative) without waiting,
+        e.g. once the real cost of a request is known. The balance may go
+        negative; later callers then wait for it to refill.
+        """
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens - amount)
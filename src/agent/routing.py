@@ -0,0 +1,100 @@
+"""
+Model cascade for agent steps.
+
+Steps run on a fast model first. The agent's own (strong) model is used when
+the fast model's output is not kept:
+- final_answer: the fast model answered instead of calling a tool
+- invalid_tool_json / unknown_tool: malformed tool call
+- empty_output: neither content nor tool calls
+
+Rules are per specialist (SPECIALIST_RULES), overridable with a JSON file
+(Config.ROUTING_FILE), e.g.
+
+    {"Analyst": {"fast_model": "openai/gpt-4.1-nano"}, "Writer": {"enabled": false}}
+
+Routing is off unless a fast model is configured (ROUTING_FAST_MODEL or per rule).
+"""
+import json
+import os
+from dataclasses import dataclass, replace
+from typing import Optional
+
+import structlog
+
+from config import Config
+
+logger = structlog.get_logger()
+
+ESCALATE_FINAL = "final_answer"
+ESCALATE_INVALID_JSON = "invalid_tool_json"
+ESCALATE_UNKNOWN_TOOL = "unknown_tool"
+ESCALATE_EMPTY = "empty_output"
+
+
+@dataclass(frozen=True)
+class RoutingRule:
+    enabled: bool = True
+    fast_model: Optional[str] = None  # None: Config.ROUTING_FAST_MODEL
+    escalate_final: bool = True
+    escalate_invalid: bool = True
+    escalate_empty: bool = True
+
+    def first_model(self, strong_model: str, final_only: bool = False) -> str:
+        """Model to try first; steps that must answer skip straight to the strong model."""
+        if final_only and self.escalate_final:
+            return strong_model
+        return self.fast_model or strong_model
+
+    def escalation(self, message, tool_names) -> Optional[str]:
+        """Why the fast model's message should be redone on the strong model (None: keep it)."""
+        if message.tool_calls:
+            if not self.escalate_invalid:
+                return None
+            for call in message.tool_calls:
+                if call.function.name not in tool_names:
+                    return ESCALATE_UNKNOWN_TOOL
+                try:
+                    arguments = json.loads(call.function.arguments or "{}")
+                except json.JSONDecodeError:
+                    return ESCALATE_INVALID_JSON
+                if not isinstance(arguments, dict):
+                    return ESCALATE_INVALID_JSON
+            return None
+        if not (message.content or "").strip():
+            return ESCALATE_EMPTY if self.escalate_empty else None
+        return ESCALATE_FINAL if self.escalate_final else None
+
+
+# Tool choice is cheap for the Researcher and Analyst; the Writer's whole output is the product
+SPECIALIST_RULES = {
+    "Researcher": RoutingRule(),
+    "Analyst": RoutingRule(),
+    "Writer": RoutingRule(enabled=False),
+}
+
+
+def _load_overrides(path: str) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("routing_file_invalid", path=path, error=str(e))
+        return {}
+
+
+def rule_for(agent_name: str, path: str = None) -> Optional[RoutingRule]:
+    """The agent's routing rule with the fast model resolved, or None when it does not route."""
+    rule = SPECIALIST_RULES.get(agent_name, RoutingRule())
+    override = _load_overrides(path or Config.ROUTING_FILE).get(agent_name)
+    if override:
+        try:
+            rule = replace(rule, **override)
+        except TypeError as e:
+            logger.warning("routing_rule_invalid", agent_name=agent_name, error=str(e))
+
+    fast_model = rule.fast_model or Config.ROUTING_FAST_MODEL
+    if not rule.enabled or not fast_model:
+        return None
+    return replace(rule, fast_model=fast_model)
@@ -1,58 +1,41 @@
 import logging
-import socket
-from urllib.parse import urlparse
-import requests
-from bs4 import BeautifulSoup
+from config import Config
 from tools.registry import registry
+from tools.excerpt import page_cache
+from tools.html_extract import extract_text_from_response
+from tools.http_client import http_client
+from tools.url_safety import check_url, validate_url, validate_urls  # validate_url re-exported for callers
 from agent.observable_agent import ObservableAgent
+from agent.routing import rule_for
 import os
 
 logger = logging.getLogger(__name__)
 DEFAULT_MODEL = os.getenv("MODEL_NAME", "z-ai/glm-4.5-air:free")
 
 
-# ======================
-# URL Validation
-# ======================
-def validate_url(url: str) -> bool:
-    try:
-        parsed = urlparse(url)
-        if parsed.scheme not in ["http", "https"]:
-            return False
-        hostname = parsed.hostname
-        if not hostname:
-            return False
-        ip_address = socket.gethostbyname(hostname)
-        parts = ip_address.split(".")
-        if parts[0] == "10" or (parts[0] == "192" and parts[1] == "168") \
-           or (parts[0] == "172" and 16 <= int(parts[1]) <= 31) \
-           or parts[0] == "127" or ip_address == "0.0.0.0":
-            return False
-        return True
-    except Exception:
-        return False
-
-
 # ======================
 # Tools
 # ======================
 @registry.register(
     name="search_web",
     description="Search the internet for up-to-date information. MUST be used when answer is not known.",
-    category="research"
+    category="research",
+    cache_ttl=3600,
+    cache_normalize=("query",),
 )
-def search_web(query: str, max_results: int = 5) -> str:
+async def search_web(query: str, max_results: int = 5) -> str:
     url = "https://html.duckduckgo.com/html/"
-    headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.post(url, data={"q": query}, headers=headers, timeout=10)
+        response = await http_client.post(url, data={"q": query})
         response.raise_for_status()
     except Exception as e:
         logger.error(f"Search failed: {e}")
         return f"Search failed: {str(e)}"
 
+    from bs4 import BeautifulSoup  # only needed once a search actually runs
+
     soup = BeautifulSoup(response.text, "html.parser")
-    results = []
+    candidates = []
     for result in soup.find_all("div", class_="result", limit=max_results):
         title_tag = result.find("a", class_="result__a")
         snippet_tag = result.find("a", class_="result__snippet")
@@ -61,8 +44,15 @@ def search_web(query: str, max_results: int = 5) -> str:
         link = title_tag.get("href", "")
         title = title_tag.get_text(strip=True)
         snippet = snippet_tag.get_text(strip=True) if snippet_tag else ""
-        if validate_url(link):
-            results.append(f"{title}\n{link}\n{snippet}")
+        candidates.append((title, link, snippet))
+
+    # One concurrent, cached DNS pass for every result link
+    checks = await validate_urls([link for _, link, _ in candidates])
+    results = [
+        f"{title}\n{link}\n{snippet}"
+        for (title, link, snippet), ok in zip(candidates, checks)
+        if ok
+    ]
     if not results:
         return "No relevant web results found."
     return "\n\n---\n\n".join(results)
@@ -70,24 +60,29 @@ def search_web(query: str, max_results: int = 5) -> str:
 
 @registry.register(
     name="read_webpage",
-    description="Read full content from a webpage URL. Use after search_web.",
-    category="research"
+    description=(
+        "Read content from a webpage URL. Use after search_web. Pass `focus` (what you are looking for) "
+        "to get the most relevant passages instead of the start of the page."
+    ),
+    category="research",
+    cache_ttl=86400,
+    cache_normalize=("url",),
 )
-def read_webpage(url: str) -> str:
-    if not validate_url(url):
-        return "Error: Invalid or restricted URL."
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        for tag in soup(["script", "style", "noscript"]):
-            tag.decompose()
-        text = "\n".join(line.strip() for line in soup.get_text().splitlines() if line.strip())
-        return text[:8000]
-    except Exception as e:
-        logger.error(f"Error reading {url}: {e}")
-        return f"Error reading {url}: {str(e)}"
+async def read_webpage(url: str, focus: str = "") -> str:
+    page = page_cache.get(url)
+    if page is None:
+        target = await check_url(url)
+        if target is None:
+            return "Error: Invalid or restricted URL."
+        try:
+            async with http_client.stream_pinned("GET", target) as response:
+                response.raise_for_status()
+                text = await extract_text_from_response(response, max_chars=Config.PAGE_MAX_CHARS)
+        except Exception as e:
+            logger.error(f"Error reading {url}: {e}")
+            return f"Error reading {url}: {str(e)}"
+        page = page_cache.put(url, text)
+    return page.excerpt(focus, max_chars=Config.EXCERPT_MAX_CHARS if focus.strip() else 8000)
 
 
 # ======================
@@ -95,39 +90,43 @@ def read_webpage(url: str) -> str:
 # ======================
 
 
-def create_researcher(model: str = None, max_steps: int = 10):
+def create_researcher(model: str = None, max_steps: int = 10, **agent_kwargs):
     system_prompt = (
         "You are a research agent.\n"
         "Always use search_web and read_webpage to find accurate and current information.\n"
     )
     tools = registry.get_tools_by_category("research")
+    agent_kwargs.setdefault("verbose", True)
+    agent_kwargs.setdefault("routing", rule_for("Researcher"))
     return ObservableAgent(
         model=model or DEFAULT_MODEL,
         max_steps=max_steps,
         agent_name="Researcher",
         system_prompt=system_prompt,
         tools=tools,
-        verbose=True
+        **agent_kwargs,
     )
 
 
-def create_analyst(model: str = None, max_steps: int = 20):
+def create_analyst(model: str = None, max_steps: int = 20, **agent_kwargs):
     system_prompt = (
         "You are an expert analyst.\n"
         "Critically evaluate research results, find patterns, trends, inconsistencies.\n"
     )
     tools = registry.get_tools_by_category("research")
+    agent_kwargs.setdefault("verbose", True)
+    agent_kwargs.setdefault("routing", rule_for("Analyst"))
     return ObservableAgent(
         model=model or DEFAULT_MODEL,
         max_steps=max_steps,
         agent_name="Analyst",
         system_prompt=system_prompt,
         tools=tools,
-        verbose=True
+        **agent_kwargs,
     )
 
 
-def create_writer(model: str = None, max_steps: int = 5):
+def create_writer(model: str = None, max_steps: int = 5, **agent_kwargs):
     system_prompt = (
     "You are a professional technical writer.\n"
     "Answer only technical questions.\n"
@@ -135,12 +134,14 @@ def create_writer(model: str = None, max_steps: int = 5):
 )
 
     tools = registry.get_tools_by_category("research")
+    agent_kwargs.setdefault("verbose", True)
+    agent_kwargs.setdefault("routing", rule_for("Writer"))
     return ObservableAgent(
         model=model or DEFAULT_MODEL,
         max_steps=max_steps,
         agent_name="Writer",
         system_prompt=system_prompt,
         tools=tools,
-        verbose=True
+        **agent_kwargs,
     )
 
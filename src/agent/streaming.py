@@ -0,0 +1,178 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+
+# ======================================
+# Streamed message pieces
+# ======================================
+@dataclass
+class StreamedFunction:
+    name: str = ""
+    arguments: str = ""
+
+
+@dataclass
+class StreamedToolCall:
+    index: int
+    id: str = ""
+    type: str = "function"
+    function: StreamedFunction = field(default_factory=StreamedFunction)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "type": self.type,
+            "function": {"name": self.function.name, "arguments": self.function.arguments},
+        }
+
+
+@dataclass
+class StreamedMessage:
+    """Assistant message rebuilt from stream deltas; same shape as ChatCompletionMessage."""
+    content: Optional[str] = None
+    tool_calls: Optional[List[StreamedToolCall]] = None
+    role: str = "assistant"
+
+    def to_dict(self) -> dict:
+        data = {"role": self.role, "content": self.content}
+        if self.tool_calls:
+            data["tool_calls"] = [call.to_dict() for call in self.tool_calls]
+        return data
+
+
+@dataclass
+class StreamedUsage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    prompt_tokens_details: Any = None
+
+
+# ======================================
+# Tool-call assembly
+# ======================================
+class ToolCallAssembler:
+    """
+    Assembles tool-call argument fragments from stream deltas.
+    A call is complete as soon as its arguments parse as a JSON object,
+    or when the stream moves on to the next call index / ends.
+    """
+
+    def __init__(self):
+        self._calls: Dict[int, StreamedToolCall] = {}
+        self._completed: set[int] = set()
+
+    def _is_complete_json(self, arguments: str) -> bool:
+        if not arguments.rstrip().endswith("}"):
+            return False
+        try:
+            return isinstance(json.loads(arguments), dict)
+        except json.JSONDecodeError:
+            return False
+
+    def add(self, delta) -> List[StreamedToolCall]:
+        """Feed one `delta.tool_calls` entry; returns calls that just completed."""
+        index = delta.index
+        ready = []
+
+        # A new index means every earlier call has received all its fragments
+        if index not in self._calls:
+            ready.extend(self._complete_before(index))
+            self._calls[index] = StreamedToolCall(index=index)
+
+        call = self._calls[index]
+        if delta.id:
+            call.id = delta.id
+        if delta.function is not None:
+            if delta.function.name:
+                call.function.name += delta.function.name
+            if delta.function.arguments:
+                call.function.arguments += delta.function.arguments
+
+        if (
+            index not in self._completed
+            and call.id
+            and call.function.name
+            and self._is_complete_json(call.function.arguments)
+        ):
+            self._completed.add(index)
+            ready.append(call)
+        return ready
+
+    def _complete_before(self, index: int) -> List[StreamedToolCall]:
+        ready = []
+        for earlier in sorted(self._calls):
+            if earlier < index and earlier not in self._completed:
+                self._completed.add(earlier)
+                ready.append(self._calls[earlier])
+        return ready
+
+    def finish(self) -> List[StreamedToolCall]:
+        """Stream ended: everything not yet completed is complete now."""
+        ready = [self._calls[i] for i in sorted(self._calls) if i not in self._completed]
+        self._completed.update(self._calls)
+        return ready
+
+    def tool_calls(self) -> List[StreamedToolCall]:
+        return [self._calls[i] for i in sorted(self._calls)]
+
+
+async def consume_stream(
+    stream,
+    on_delta: Callable[[str], Any],
+    on_tool_call: Callable[[StreamedToolCall], Any],
+    holdback_chars: int = 0,
+):
+    """
+    Drain a chat completion stream.
+    Content deltas go to on_delta, completed tool calls to on_tool_call.
+    With holdback_chars, content is held back until it is longer than that or
+    the stream ends; a tool call first means an intermediate step, whose
+    content is then never forwarded.
+    Returns (StreamedMessage, StreamedUsage or None).
+    """
+    assembler = ToolCallAssembler()
+    content_parts: List[str] = []
+    held: Optional[List[str]] = [] if holdback_chars > 0 else None
+    held_chars = 0
+    forward = True
+    usage = None
+
+    async for chunk in stream:
+        if getattr(chunk, "usage", None):
+            usage = StreamedUsage(
+                prompt_tokens=chunk.usage.prompt_tokens or 0,
+                completion_tokens=chunk.usage.completion_tokens or 0,
+                prompt_tokens_details=getattr(chunk.usage, "prompt_tokens_details", None),
+            )
+        if not chunk.choices:
+            continue
+
+        delta = chunk.choices[0].delta
+        if delta.tool_calls and held is not None:
+            forward, held = False, None
+        if delta.content:
+            content_parts.append(delta.content)
+            if held is not None:
+                held.append(delta.content)
+                held_chars += len(delta.content)
+                if held_chars > holdback_chars:
+                    for part in held:
+                        on_delta(part)
+                    held = None
+            elif forward:
+                on_delta(delta.content)
+        for tool_delta in delta.tool_calls or []:
+            for call in assembler.add(tool_delta):
+                on_tool_call(call)
+
+    for call in assembler.finish():
+        on_tool_call(call)
+    for part in held or []:
+        on_delta(part)
+
+    message = StreamedMessage(
+        content="".join(content_parts) or None,
+        tool_calls=assembler.tool_calls() or None,
+    )
+    return message, usage
@@ -0,0 +1,138 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+from observability.profiler import active_profile
+from observability.spans import span
+
+logger = structlog.get_logger()
+
+
+# ==============================
+# Shared Thread Pool (sync tools)
+# ==============================
+_thread_pool: Optional[ThreadPoolExecutor] = None
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """Bounded pool shared by every agent for blocking tools."""
+    global _thread_pool
+    if _thread_pool is None:
+        max_workers = int(os.getenv("TOOL_THREAD_POOL_SIZE", "8"))
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="tool-worker",
+        )
+    return _thread_pool
+
+
+def shutdown_thread_pool(wait: bool = True):
+    global _thread_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=wait)
+        _thread_pool = None
+
+
+@dataclass
+class ToolCallResult:
+    tool_call_id: str
+    tool_name: str
+    arguments: Dict[str, Any]
+    output: str
+    duration_ms: float
+
+
+class ToolExecutor:
+    """
+    Concurrent executor for the tool calls of one agent step.
+    - async tools are awaited directly on the event loop
+    - sync tools are sent to the shared bounded thread pool
+    - concurrency is capped per step and per tool
+    - results keep the order of the incoming tool calls
+    """
+
+    def __init__(self, max_concurrency: int = 8, per_tool_concurrency: int = 4):
+        self.max_concurrency = max_concurrency
+        self.per_tool_concurrency = per_tool_concurrency
+        self._tool_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _tool_semaphore(self, tool_name: str) -> asyncio.Semaphore:
+        if tool_name not in self._tool_semaphores:
+            self._tool_semaphores[tool_name] = asyncio.Semaphore(self.per_tool_concurrency)
+        return self._tool_semaphores[tool_name]
+
+    async def _invoke(self, tool, arguments: Dict[str, Any]) -> Any:
+        if tool.is_async:
+            return await tool.aexecute(**arguments)
+
+        # copy_context keeps the current trace visible inside the worker thread
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        call = functools.partial(tool.execute, **arguments)
+        run_profile = active_profile()
+        if run_profile is not None:
+            call = run_profile.wrap(call)
+        return await loop.run_in_executor(get_thread_pool(), ctx.run, call)
+
+    def step_semaphore(self) -> asyncio.Semaphore:
+        """Concurrency cap shared by all calls of one step."""
+        return asyncio.Semaphore(self.max_concurrency)
+
+    async def execute_call(self, tool_call, tools: Dict[str, Any], step_semaphore: asyncio.Semaphore) -> ToolCallResult:
+        """Run a single tool call (used when calls are started as they stream in)."""
+        tool_name = tool_call.function.name
+        start_time = time.perf_counter()
+
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            return ToolCallResult(
+                tool_call_id=tool_call.id,
+                tool_name=tool_name,
+                arguments={},
+                output=f"Invalid arguments for tool '{tool_name}': {str(e)}",
+                duration_ms=0.0,
+            )
+
+        tool = tools.get(tool_name)
+        if not tool:
+            return ToolCallResult(
+                tool_call_id=tool_call.id,
+                tool_name=tool_name,
+                arguments=arguments,
+                output=f"Tool '{tool_name}' not found.",
+                duration_ms=0.0,
+            )
+
+        with span("tool.execute", **{"tool.name": tool_name}) as current:
+            # Per-tool first: a call waiting on a busy tool must not hold a step slot
+            async with self._tool_semaphore(tool_name), step_semaphore:
+                try:
+                    result = await self._invoke(tool, arguments)
+                except Exception as e:
+                    logger.error("tool_execution_failed", tool=tool_name, error=str(e))
+                    current.set_attribute("tool.error", str(e))
+                    result = f"Tool execution failed: {str(e)}"
+
+        return ToolCallResult(
+            tool_call_id=tool_call.id,
+            tool_name=tool_name,
+            arguments=arguments,
+            output=str(result),
+            duration_ms=(time.perf_counter() - start_time) * 1000,
+        )
+
+    async def execute(self, tool_calls: list, tools: Dict[str, Any]) -> List[ToolCallResult]:
+        """Run all tool calls of a step; results are returned in tool_call order."""
+        step_semaphore = self.step_semaphore()
+        return await asyncio.gather(
+            *(self.execute_call(tool_call, tools, step_semaphore) for tool_call in tool_calls)
+        )
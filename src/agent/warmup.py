@@ -0,0 +1,43 @@
+import asyncio
+import time
+from typing import Optional
+
+import structlog
+
+from config import Config
+
+logger = structlog.get_logger()
+
+
+def _warm_up(vector_store: bool):
+    start = time.perf_counter()
+    from agent.context_manager import count_tokens
+    from agent.observable_agent import get_client
+    import bs4  # noqa: F401
+
+    get_client()
+    count_tokens("warm-up")  # loads the tiktoken encoding
+    if vector_store:
+        from tools.vector_store import get_tech_vector_store
+        get_tech_vector_store()
+    logger.info("warmup_done", duration_ms=round((time.perf_counter() - start) * 1000, 1))
+
+
+async def _run(vector_store: bool):
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _warm_up, vector_store)
+    except Exception as e:
+        # Warm-up is best effort; the first real use surfaces the error
+        logger.warning("warmup_failed", error=str(e))
+
+
+def start_warmup(vector_store: Optional[bool] = None) -> Optional[asyncio.Task]:
+    """
+    Load heavy dependencies (OpenAI client, tokenizer, bs4, optionally the
+    embedding model) in a background thread while the CLI gets going.
+    """
+    if not Config.WARMUP_ENABLED:
+        return None
+    if vector_store is None:
+        vector_store = Config.SEMANTIC_CACHE_ENABLED
+    return asyncio.create_task(_run(vector_store))
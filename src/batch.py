@@ -0,0 +1,141 @@
+import asyncio
+import json
+import sys
+import time
+from typing import Iterable, List, Optional, Set
+
+import structlog
+
+from agent.deadline import deadline
+from agent.llm_gateway import LLMGateway
+from config import Config
+from observability.cost_tracker import CostTracker
+from pipeline import create_pipeline_agents, run_pipeline
+from tools.http_client import http_client
+
+logger = structlog.get_logger()
+
+
+# ======================================
+# Input / Resume
+# ======================================
+def parse_queries(lines: Iterable[str]) -> List[dict]:
+    """
+    One query per JSONL line: {"id": ..., "query": ...} or a bare JSON string.
+    Lines without an id get their 1-based line number.
+    """
+    items = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            data = line  # plain-text line
+
+        if isinstance(data, str):
+            data = {"query": data}
+        if not isinstance(data, dict) or not data.get("query"):
+            logger.warning("batch_line_skipped", line=line_number)
+            continue
+
+        items.append({"id": str(data.get("id", line_number)), "query": data["query"]})
+    return items
+
+
+def load_completed_ids(output_path: str) -> Set[str]:
+    """Ids already written successfully by a previous (partial) run."""
+    completed = set()
+    try:
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn last line of an interrupted run
+                if record.get("status") == "ok":
+                    completed.add(str(record.get("id")))
+    except FileNotFoundError:
+        pass
+    return completed
+
+
+# ======================================
+# Batch Runner
+# ======================================
+async def _run_one(item: dict, gateway: Optional[LLMGateway]) -> dict:
+    tracker = CostTracker(verbose=False)
+    tracker.start_query(item["query"])
+    researcher, analyst, writer = create_pipeline_agents(verbose=False, gateway=gateway)
+
+    record = {"id": item["id"], "query": item["query"]}
+    try:
+        with deadline(Config.QUERY_DEADLINE_SECONDS):
+            final_result = await run_pipeline(
+                item["query"], tracker, researcher, analyst, writer, stream_output=False
+            )
+        record.update(status="ok", answer=final_result["answer"], error=None)
+    except Exception as e:
+        logger.error("batch_query_failed", id=item["id"], error=str(e))
+        record.update(status="failed", answer=None, error=str(e))
+
+    tracker.end_query()
+    record["cost"] = tracker.get_breakdown()
+    return record
+
+
+async def run_batch(
+    items: List[dict],
+    output_path: str,
+    concurrency: int = 4,
+    requests_per_minute: float = 0,
+    resume: bool = False,
+) -> dict:
+    """
+    Run many pipelines on one event loop.
+    Each result is appended to `output_path` as soon as its query finishes.
+    """
+    if resume:
+        completed = load_completed_ids(output_path)
+        items = [item for item in items if item["id"] not in completed]
+        logger.info("batch_resume", skipped=len(completed), remaining=len(items))
+
+    # With a limit, the batch gets its own gateway so every call (retries and hedges too) counts against it
+    gateway = LLMGateway(requests_per_minute=requests_per_minute) if requests_per_minute > 0 else None
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    summary = {"ok": 0, "failed": 0}
+    start_time = time.time()
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+
+        async def worker():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                record = await _run_one(item, gateway)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                summary[record["status"]] += 1
+                logger.info("batch_query_done", id=item["id"], status=record["status"])
+
+        http_client.attach()
+        try:
+            await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+        finally:
+            await http_client.detach()
+
+    summary["duration_sec"] = round(time.time() - start_time, 3)
+    return summary
+
+
+def read_batch_input(path: str) -> List[dict]:
+    if path == "-":
+        return parse_queries(sys.stdin)
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_queries(f)
@@ -6,4 +6,113 @@ load_dotenv()
 class Config:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o")
+
+    # HTTP client (web tools)
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_PER_HOST_LIMIT = int(os.getenv("HTTP_PER_HOST_LIMIT", "6"))
+    HTTP_PINNED_POOLS = int(os.getenv("HTTP_PINNED_POOLS", "32"))  # hostnames with their own pinned connection pool
+
+    # Persistent tool result cache
+    TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+    TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH", ".cache/tool_cache.sqlite")
+    TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "5000"))
+    TOOL_CACHE_MAX_BYTES = int(os.getenv("TOOL_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+    # LLM completion cache
+    COMPLETION_CACHE_ENABLED = os.getenv("COMPLETION_CACHE_ENABLED", "false").lower() == "true"
+    COMPLETION_CACHE_PATH = os.getenv("COMPLETION_CACHE_PATH", ".cache/completion_cache.sqlite")
+    COMPLETION_CACHE_TTL = float(os.getenv("COMPLETION_CACHE_TTL", str(7 * 24 * 3600)))
+    COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("COMPLETION_CACHE_MAX_ENTRIES", "2000"))
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+    # Context compaction (ReAct loop)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "16000"))
+    CONTEXT_STRATEGY = os.getenv("CONTEXT_STRATEGY", "truncate")  # truncate | summarize | evict
+
+    # DNS cache for URL safety checks (seconds)
+    DNS_CACHE_TTL = float(os.getenv("DNS_CACHE_TTL", "300"))
+    DNS_NEGATIVE_TTL = float(os.getenv("DNS_NEGATIVE_TTL", "30"))
+
+    # Page text extraction (read_webpage)
+    HTML_PARSER_BACKEND = os.getenv("HTML_PARSER_BACKEND", "auto")  # auto | stdlib | selectolax
+    HTML_MAX_BYTES = int(os.getenv("HTML_MAX_BYTES", str(2 * 1024 * 1024)))
+    # Focused excerpts of read pages (tools/excerpt.py); ~4 characters per token
+    EXCERPT_MAX_CHARS = int(os.getenv("EXCERPT_MAX_CHARS", "4000"))
+    # Text kept per page: excerpts are ranked over this much, and extraction stops once it is reached
+    PAGE_MAX_CHARS = int(os.getenv("PAGE_MAX_CHARS", str(4 * EXCERPT_MAX_CHARS)))
+    EXCERPT_CHUNK_CHARS = int(os.getenv("EXCERPT_CHUNK_CHARS", "600"))
+    PAGE_CACHE_TTL = float(os.getenv("PAGE_CACHE_TTL", "600"))
+    PAGE_CACHE_MAX_PAGES = int(os.getenv("PAGE_CACHE_MAX_PAGES", "64"))
+    # Vector store index (TechVectorStore)
+    VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")  # flat | hnsw | ivf
+    VECTOR_INDEX_HNSW_M = int(os.getenv("VECTOR_INDEX_HNSW_M", "32"))
+    VECTOR_INDEX_EF_SEARCH = int(os.getenv("VECTOR_INDEX_EF_SEARCH", "64"))
+    VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "8"))
+    VECTOR_INDEX_IVF_TRAIN_MIN = int(os.getenv("VECTOR_INDEX_IVF_TRAIN_MIN", "4096"))
+    VECTOR_INDEX_SAVE_EVERY = int(os.getenv("VECTOR_INDEX_SAVE_EVERY", "1000"))
+    # Embedding pipeline (TechVectorStore)
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+    # Background warm-up of heavy dependencies at CLI start
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    # Loop detection in the agent loop
+    LOOP_POLICY = os.getenv("LOOP_POLICY", "short_circuit")  # short_circuit | inject | abort
+    LOOP_EXACT_THRESHOLD = int(os.getenv("LOOP_EXACT_THRESHOLD", "2"))
+    LOOP_FUZZY_THRESHOLD = float(os.getenv("LOOP_FUZZY_THRESHOLD", "0.8"))
+    LOOP_STAGNATION_WINDOW = int(os.getenv("LOOP_STAGNATION_WINDOW", "3"))
+    # Trace storage: recent traces in memory, older ones in gzip JSONL segments
+    TRACE_STORE_CAPACITY = int(os.getenv("TRACE_STORE_CAPACITY", "200"))
+    TRACE_STORE_PERSIST = os.getenv("TRACE_STORE_PERSIST", "true").lower() == "true"
+    TRACE_STORE_DIR = os.getenv("TRACE_STORE_DIR", ".cache/traces")
+    TRACE_SEGMENT_MAX_BYTES = int(os.getenv("TRACE_SEGMENT_MAX_MB", "16")) * 1024 * 1024
+    TRACE_RETENTION_SECONDS = float(os.getenv("TRACE_RETENTION_DAYS", "7")) * 24 * 3600
+    TRACE_STORE_MAX_BYTES = int(os.getenv("TRACE_STORE_MAX_MB", "512")) * 1024 * 1024
+    # Running traces older than this may be evicted (spilled as they are) once the hot tier is full
+    TRACE_RUNNING_TIMEOUT_SECONDS = float(os.getenv("TRACE_RUNNING_TIMEOUT_SECONDS", "3600"))
+    # Span instrumentation (OTLP/JSON file export)
+    SPANS_ENABLED = os.getenv("SPANS_ENABLED", "false").lower() == "true"
+    SPANS_EXPORT_PATH = os.getenv("SPANS_EXPORT_PATH", ".cache/spans.otlp.jsonl")
+    # On-demand profiling of agent runs (cProfile stats stored on the trace)
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    PROFILE_MAX_FUNCTIONS = int(os.getenv("PROFILE_MAX_FUNCTIONS", "200"))
+    # Pricing (USD per 1M tokens, see observability/pricing.py) and spend limits; 0 = unlimited
+    PRICING_FILE = os.getenv("PRICING_FILE", "pricing.json")
+    QUERY_BUDGET_USD = float(os.getenv("QUERY_BUDGET_USD", "0"))
+    AGENT_BUDGET_USD = float(os.getenv("AGENT_BUDGET_USD", "0"))
+    BUDGET_SOFT_RATIO = float(os.getenv("BUDGET_SOFT_RATIO", "0.8"))  # force a final answer past this share
+    # Model cascade (agent/routing.py): tool steps on a fast model, final answers on the agent's model
+    ROUTING_FAST_MODEL = os.getenv("ROUTING_FAST_MODEL", "")  # empty = routing off
+    ROUTING_FILE = os.getenv("ROUTING_FILE", "routing.json")  # per-specialist rule overrides
+    # Shared LLM gateway (agent/llm_gateway.py); 0 = no rate limit
+    LLM_RPM = float(os.getenv("LLM_RPM", "0"))
+    LLM_TPM = float(os.getenv("LLM_TPM", "0"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+    LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+    LLM_EXPECTED_OUTPUT_TOKENS = int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "256"))  # TPM estimate before usage is known
+    # Hedged requests: duplicate calls slower than this percentile of recent latency (0 = off)
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0"))
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+    LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL", "")  # empty = same model
+    LLM_HEDGE_BASE_URL = os.getenv("LLM_HEDGE_BASE_URL", "")  # empty = same provider
+    # Deadlines: per query (0 = none); each agent step gets a share, at least STEP_DEADLINE_MIN_SECONDS
+    QUERY_DEADLINE_SECONDS = float(os.getenv("QUERY_DEADLINE_SECONDS", "0"))
+    STEP_DEADLINE_MIN_SECONDS = float(os.getenv("STEP_DEADLINE_MIN_SECONDS", "15"))
+    # Researcher fan-out (agent/fanout.py): sub-questions researched concurrently
+    FANOUT_ENABLED = os.getenv("FANOUT_ENABLED", "false").lower() == "true"
+    FANOUT_WIDTH = int(os.getenv("FANOUT_WIDTH", "4"))  # max sub-questions
+    FANOUT_WORKER_STEPS = int(os.getenv("FANOUT_WORKER_STEPS", "4"))
+    FANOUT_MAX_CONCURRENCY = int(os.getenv("FANOUT_MAX_CONCURRENCY", "4"))
+    FANOUT_DEADLINE_SECONDS = float(os.getenv("FANOUT_DEADLINE_SECONDS", "0"))  # 0 = none
+    FANOUT_COMPARE_SERIAL = os.getenv("FANOUT_COMPARE_SERIAL", "false").lower() == "true"  # also run the serial Researcher
+    # Streaming: content of a step that may still call tools is held back up to this many characters
+    STREAM_HOLDBACK_CHARS = int(os.getenv("STREAM_HOLDBACK_CHARS", "400"))
     # Add other configuration as needed
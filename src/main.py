@@ -2,63 +2,95 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import sys
+import argparse
 import asyncio
-from agent.specialists import create_researcher, create_analyst, create_writer
-from observability.cost_tracker import CostTracker
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.main",
+        description="Multi-agent research pipeline (Researcher → Analyst → Writer).",
+    )
+    parser.add_argument("query", nargs="?", help="Research query (single-query mode)")
+    parser.add_argument("--batch", metavar="PATH", help="JSONL file of queries, or '-' for stdin")
+    parser.add_argument("--output", metavar="PATH", default="batch_results.jsonl",
+                        help="JSONL file results are streamed to (batch mode)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Pipelines running at once (batch mode)")
+    parser.add_argument("--rpm", type=float, default=0,
+                        help="Global LLM requests-per-minute limit, 0 = unlimited (batch mode)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip queries already completed in --output (batch mode)")
+    parser.add_argument("--budget", type=float, metavar="USD",
+                        help="Spend limit per query; agents stop using tools and answer as it gets close")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                        help="Time limit per query; agents answer early as it gets close")
+    parser.add_argument("--fanout", action="store_true",
+                        help="Split the query into sub-questions researched concurrently (see FANOUT_* settings)")
+    parser.add_argument("--profile", action="store_true",
+                        help="cProfile every agent run; show with: python -m observability.profiler <trace_id>")
+    return parser.parse_args(argv)
+
 
 async def main():
-    if len(sys.argv) < 2:
+    args = parse_args()
+
+    # Heavy imports only after argument parsing, so --help and usage errors stay instant
+    from agent.deadline import deadline
+    from agent.warmup import start_warmup
+    from batch import read_batch_input, run_batch
+    from observability.cost_tracker import CostTracker
+    from config import Config
+    from pipeline import create_pipeline_agents, run_pipeline
+
+    if args.profile:
+        Config.PROFILE_SAMPLE_RATE = 1.0
+    if args.budget is not None:
+        Config.QUERY_BUDGET_USD = args.budget
+    if args.deadline is not None:
+        Config.QUERY_DEADLINE_SECONDS = args.deadline
+    if args.fanout:
+        Config.FANOUT_ENABLED = True
+
+    if args.batch:
+        items = read_batch_input(args.batch)
+        if not items:
+            print(f"No queries in {args.batch}")
+            return
+        start_warmup()  # only once there is work to do
+        print(f"\n📦 Running batch of {len(items)} queries (concurrency={args.concurrency})\n")
+        summary = await run_batch(
+            items,
+            output_path=args.output,
+            concurrency=args.concurrency,
+            requests_per_minute=args.rpm,
+            resume=args.resume,
+        )
+        print(f"Batch finished: {summary} → {args.output}")
+        return
+
+    if not args.query:
         print('Usage: python -m src.main "Your research query"')
         sys.exit(1)
 
-    query = sys.argv[1]
+    start_warmup()
+    query = args.query
     print(f"\n🔎 Starting research on: {query}\n")
 
     tracker = CostTracker()
     tracker.start_query(query)
 
     # Agents
-    researcher = create_researcher()
-    analyst = create_analyst()
-    writer = create_writer()
-
-    # Run Researcher
-    print("Running Researcher...\n")
-    research_result = await researcher.run(query)
-    tracker.log_agent_usage(
-        agent_name="Researcher",
-        model=research_result["model_used"],
-        input_tokens=research_result["total_input_tokens"],
-        output_tokens=research_result["total_output_tokens"],
-    )
+    researcher, analyst, writer = create_pipeline_agents()
 
-    # Run Analyst
-    print("\nRunning Analyst...\n")
-    analysis_result = await analyst.run(research_result["answer"])
-    tracker.log_agent_usage(
-        agent_name="Analyst",
-        model=analysis_result["model_used"],
-        input_tokens=analysis_result["total_input_tokens"],
-        output_tokens=analysis_result["total_output_tokens"],
-    )
-
-    # Run Writer
-    print("\nRunning Writer...\n")
-    final_result = await writer.run(analysis_result["answer"])
-    tracker.log_agent_usage(
-        agent_name="Writer",
-        model=final_result["model_used"],
-        input_tokens=final_result["total_input_tokens"],
-        output_tokens=final_result["total_output_tokens"],
-    )
+    # Agents share one pooled HTTP client; it is closed when the last one exits
+    async with researcher, analyst, writer:
+        with deadline(Config.QUERY_DEADLINE_SECONDS):
+            await run_pipeline(query, tracker, researcher, analyst, writer)
 
     tracker.end_query()
     tracker.print_cost_breakdown()
 
-    print("\n================ FINAL OUTPUT ================\n")
-    print(final_result["answer"])
-    print("\n==============================================\n")
-
 if __name__ == "__main__":
     try:
         asyncio.run(main())
@@ -1,7 +1,17 @@
+import json
 import time
 
+from config import Config
+from observability.pricing import Budget, get_price_table
+
 class CostTracker:
-    def __init__(self):
+    """
+    Per-query usage and cost.
+    `budget` is the query's spend limit; pass it to each agent's run() so they are charged as they go.
+    """
+    def __init__(self, verbose: bool = True, budget_usd: float = None):
+        self.verbose = verbose
+        self.budget = Budget(Config.QUERY_BUDGET_USD if budget_usd is None else budget_usd)
         self.query_start_time = None
         self.query_end_time = None
         self.query_text = ""
@@ -14,19 +24,31 @@ class CostTracker:
         self.query_start_time = time.time()
         self.query_text = query_text
         self.usage_log = []
-        print(f"Started query tracking: {query_text}")
+        self.budget = Budget(self.budget.limit_usd)
+        if self.verbose:
+            print(f"Started query tracking: {query_text}")
 
     # -----------------------------------
     # Log agent usage
     # -----------------------------------
-    def log_agent_usage(self, agent_name, model, input_tokens, output_tokens):
+    def log_agent_usage(self, agent_name, model, input_tokens, output_tokens, cost_usd=None, budget_actions=(), models=None):
+        """
+        cost_usd defaults to the price-table cost of the tokens (no cached-token discount).
+        models: per-model calls/tokens/cost when the agent routed steps to several models.
+        """
+        if cost_usd is None:
+            cost_usd = get_price_table().cost(model, input_tokens, output_tokens)
         self.usage_log.append({
             "agent": agent_name,
             "model": model,
             "input_tokens": input_tokens,
             "output_tokens": output_tokens,
+            "cost_usd": round(cost_usd, 6),
+            "budget_actions": list(budget_actions),
+            "models": dict(models or {}),
         })
-        print(f"[{agent_name}] Logged usage: model={model}, input={input_tokens}, output={output_tokens}")
+        if self.verbose:
+            print(f"[{agent_name}] Logged usage: model={model}, input={input_tokens}, output={output_tokens}, cost=${cost_usd:.4f}")
 
     # -----------------------------------
     # End query
@@ -34,7 +56,40 @@ class CostTracker:
     def end_query(self):
         self.query_end_time = time.time()
         duration = self.query_end_time - self.query_start_time
-        print(f"Ended query tracking. Duration: {duration:.2f}s")
+        if self.verbose:
+            print(f"Ended query tracking. Duration: {duration:.2f}s")
+
+    # -----------------------------------
+    # Machine-readable breakdown
+    # -----------------------------------
+    def get_breakdown(self):
+        duration = None
+        if self.query_start_time is not None and self.query_end_time is not None:
+            duration = round(self.query_end_time - self.query_start_time, 3)
+        return {
+            "query": self.query_text,
+            "duration_sec": duration,
+            "agents": [dict(usage) for usage in self.usage_log],
+            "total_input_tokens": sum(u["input_tokens"] for u in self.usage_log),
+            "total_output_tokens": sum(u["output_tokens"] for u in self.usage_log),
+            "total_cost_usd": round(sum(u["cost_usd"] for u in self.usage_log), 6),
+            "cost_by_model": self._cost_by_model(),
+            "budget": self.budget.to_dict(),
+        }
+
+    def _cost_by_model(self):
+        totals = {}
+        for usage in self.usage_log:
+            for model, entry in usage["models"].items():
+                total = totals.setdefault(model, {"calls": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+                for key in total:
+                    total[key] += entry.get(key, 0)
+        for total in totals.values():
+            total["cost_usd"] = round(total["cost_usd"], 6)
+        return totals
+
+    def to_json(self, indent: int = None) -> str:
+        return json.dumps(self.get_breakdown(), indent=indent)
 
     # -----------------------------------
     # Print cost/usage breakdown
@@ -43,10 +98,18 @@ class CostTracker:
         print("\n=== Usage Breakdown ===")
         total_input = 0
         total_output = 0
+        total_cost = 0.0
         for usage in self.usage_log:
-            print(f"{usage['agent']}: model={usage['model']}, input_tokens={usage['input_tokens']}, output_tokens={usage['output_tokens']}")
+            print(f"{usage['agent']}: model={usage['model']}, input_tokens={usage['input_tokens']}, output_tokens={usage['output_tokens']}, cost=${usage['cost_usd']:.4f}")
+            if len(usage["models"]) > 1:
+                for model, entry in usage["models"].items():
+                    print(f"    {model}: calls={entry['calls']}, cost=${entry['cost_usd']:.4f}")
             total_input += usage['input_tokens']
             total_output += usage['output_tokens']
+            total_cost += usage['cost_usd']
         print(f"Total input tokens: {total_input}")
         print(f"Total output tokens: {total_output}")
+        print(f"Total cost: ${total_cost:.4f}")
+        if self.budget.limited:
+            print(f"Budget: ${self.budget.spent_usd:.4f} of ${self.budget.limit_usd:.4f} spent")
         print("======================\n")
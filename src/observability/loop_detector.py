@@ -1,4 +1,7 @@
+import hashlib
+from collections import Counter, deque
 from dataclasses import dataclass
+from functools import lru_cache
 
 @dataclass
 class LoopDetectionResult:
@@ -7,54 +10,88 @@ class LoopDetectionResult:
     message: str
     confidence: float
 
+
+@lru_cache(maxsize=4096)
+def _tokens(text: str) -> frozenset:
+    """Word-level token set, cached so each string is tokenized once."""
+    return frozenset(text.lower().split())
+
+
+def _token_jaccard(tokens1: frozenset, tokens2: frozenset) -> float:
+    if not tokens1 and not tokens2:
+        return 1.0
+    if not tokens1 or not tokens2:
+        return 0.0
+    intersection = len(tokens1 & tokens2)
+    return intersection / (len(tokens1) + len(tokens2) - intersection)
+
+
+def _call_key(tool_name: str, tool_input: str) -> bytes:
+    return hashlib.blake2b(f"{tool_name}\0{tool_input}".encode("utf-8"), digest_size=16).digest()
+
+
 class AdvancedLoopDetector:
     """
     Detects agent loops using three strategies.
+    Per-call cost does not grow with the session:
+    - exact: counter of hashed (tool, stripped args) over a bounded history
+    - fuzzy: cached token sets of the last `fuzzy_window` calls
+    - stagnation: each output is compared only with the previous ones in the window
     """
     def __init__(
         self,
         exact_threshold: int = 2,
         fuzzy_threshold: float = 0.8,
         stagnation_window: int = 3,
+        max_history: int = 1000,
+        fuzzy_window: int = 5,
     ):
         self.exact_threshold = exact_threshold
         self.fuzzy_threshold = fuzzy_threshold
         self.stagnation_window = stagnation_window
-        self.tool_history: list[tuple[str, str]] = []  # (tool_name, args_str)
-        self.output_history: list[str] = []
+        self.max_history = max_history
+        self.tool_history: deque[tuple[str, str]] = deque(maxlen=max_history)  # (tool_name, args_str)
+        self.output_history: deque[str] = deque(maxlen=stagnation_window)
+
+        self._call_keys: deque[bytes] = deque(maxlen=max_history)
+        self._call_counts: Counter = Counter()
+        self._recent_calls: deque[tuple[str, frozenset]] = deque(maxlen=fuzzy_window)
+        # For each output in the window: similarities to the outputs before it (nearest first)
+        self._output_tokens: deque[frozenset] = deque(maxlen=stagnation_window)
+        self._output_sims: deque[list] = deque(maxlen=stagnation_window)
 
     def _jaccard_similarity(self, s1: str, s2: str) -> float:
         """
         Compute Jaccard similarity between two strings.
         Uses word-level tokens for meaningful comparison.
         """
-        tokens1 = set(s1.lower().split())
-        tokens2 = set(s2.lower().split())
-
-        if not tokens1 and not tokens2:
-            return 1.0
-        if not tokens1 or not tokens2:
-            return 0.0
-
-        intersection = tokens1 & tokens2
-        union = tokens1 | tokens2
-        return len(intersection) / len(union)
+        return _token_jaccard(_tokens(s1), _tokens(s2))
+
+    def _record_call(self, tool_name: str, tool_input: str, key: bytes, tokens: frozenset):
+        if len(self._call_keys) == self.max_history:
+            evicted = self._call_keys[0]
+            self._call_counts[evicted] -= 1
+            if not self._call_counts[evicted]:
+                del self._call_counts[evicted]
+        self._call_keys.append(key)
+        self._call_counts[key] += 1
+        self.tool_history.append((tool_name, tool_input))
+        self._recent_calls.append((tool_name, tokens))
 
     def check_tool_call(self, tool_name: str, tool_input: str) -> LoopDetectionResult:
         """
         Check if a tool call indicates a loop.
         Call this BEFORE executing the tool.
         """
-        current = (tool_name, tool_input.strip())
+        stripped = tool_input.strip()
+        key = _call_key(tool_name, stripped)
+        tokens = _tokens(tool_input)
 
         # Strategy 1: Exact Match
-        exact_count = sum(
-            1 for past_tool, past_input in self.tool_history
-            if (past_tool, past_input.strip()) == current
-        )
+        exact_count = self._call_counts[key]
 
         if exact_count >= self.exact_threshold:
-            self.tool_history.append(current)
+            self._record_call(tool_name, stripped, key, tokens)
             return LoopDetectionResult(
                 is_looping=True,
                 strategy="exact",
@@ -67,16 +104,15 @@ class AdvancedLoopDetector:
 
         # Strategy 2: Fuzzy Match
         # Check against recent history for similar (but not identical) calls
-        recent_history = self.tool_history[-5:]  # Last 5 calls
         fuzzy_matches = 0
-        for past_tool, past_input in recent_history:
+        for past_tool, past_tokens in self._recent_calls:
             if past_tool == tool_name:
-                similarity = self._jaccard_similarity(tool_input, past_input)
+                similarity = _token_jaccard(tokens, past_tokens)
                 if similarity >= self.fuzzy_threshold:
                     fuzzy_matches += 1
 
         if fuzzy_matches >= self.exact_threshold:
-            self.tool_history.append(current)
+            self._record_call(tool_name, stripped, key, tokens)
             return LoopDetectionResult(
                 is_looping=True,
                 strategy="fuzzy",
@@ -88,7 +124,7 @@ class AdvancedLoopDetector:
                 confidence=0.85,
             )
 
-        self.tool_history.append(current)
+        self._record_call(tool_name, stripped, key, tokens)
         return LoopDetectionResult(
             is_looping=False,
             strategy="none",
@@ -101,7 +137,12 @@ class AdvancedLoopDetector:
         Check if the agent's outputs are stagnating
         (producing very similar responses repeatedly).
         """
+        tokens = _tokens(output)
+        # Only the new pairs are computed; older pairs are reused
+        sims = [_token_jaccard(tokens, previous) for previous in reversed(self._output_tokens)]
         self.output_history.append(output)
+        self._output_tokens.append(tokens)
+        self._output_sims.append(sims)
 
         if len(self.output_history) < self.stagnation_window:
             return LoopDetectionResult(
@@ -109,13 +150,13 @@ class AdvancedLoopDetector:
                 message="", confidence=0.0,
             )
 
-        # Check similarity among the last N outputs
-        recent = self.output_history[-self.stagnation_window:]
-        similarities = []
-        for i in range(len(recent)):
-            for j in range(i + 1, len(recent)):
-                sim = self._jaccard_similarity(recent[i], recent[j])
-                similarities.append(sim)
+        # Pairs (i, j) inside the window; entry j stores its similarity to i at j - i - 1
+        entries = list(self._output_sims)
+        similarities = [
+            entries[j][j - i - 1]
+            for i in range(len(entries))
+            for j in range(i + 1, len(entries))
+        ]
 
         avg_similarity = sum(similarities) / len(similarities) if similarities else 0
 
@@ -139,3 +180,8 @@ class AdvancedLoopDetector:
     def reset(self):
         self.tool_history.clear()
         self.output_history.clear()
+        self._call_keys.clear()
+        self._call_counts.clear()
+        self._recent_calls.clear()
+        self._output_tokens.clear()
+        self._output_sims.clear()
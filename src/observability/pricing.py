@@ -0,0 +1,176 @@
+"""
+Per-model prices and spend budgets.
+
+Prices are USD per 1M tokens. The built-in table can be extended or overridden
+with a JSON file (Config.PRICING_FILE):
+
+    {
+      "default": {"input": 0.30, "output": 0.60},
+      "models": {
+        "openai/gpt-4o": {"input": 2.50, "output": 10.00, "cached_input": 1.25}
+      }
+    }
+
+`cached_input` is the rate for prompt tokens served from the provider's prompt
+cache (usage.prompt_tokens_details.cached_tokens); it defaults to `input`.
+"""
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+import structlog
+
+from config import Config
+
+logger = structlog.get_logger()
+
+
+@dataclass(frozen=True)
+class ModelPrice:
+    input: float  # USD per 1M prompt tokens
+    output: float  # USD per 1M completion tokens
+    cached_input: Optional[float] = None  # USD per 1M cached prompt tokens
+
+    def cost(self, input_tokens: int, output_tokens: int, cached_input_tokens: int = 0) -> float:
+        cached_input_tokens = min(cached_input_tokens, input_tokens)
+        cached_rate = self.input if self.cached_input is None else self.cached_input
+        return (
+            (input_tokens - cached_input_tokens) * self.input
+            + cached_input_tokens * cached_rate
+            + output_tokens * self.output
+        ) / 1_000_000
+
+
+FREE = ModelPrice(0.0, 0.0, 0.0)
+# Fallback for unknown models (the rates the agent used to hard-code)
+DEFAULT_PRICE = ModelPrice(input=0.30, output=0.60)
+
+DEFAULT_PRICES: Dict[str, ModelPrice] = {
+    "gpt-4o": ModelPrice(input=2.50, output=10.00, cached_input=1.25),
+    "gpt-4o-mini": ModelPrice(input=0.15, output=0.60, cached_input=0.075),
+    "gpt-4.1": ModelPrice(input=2.00, output=8.00, cached_input=0.50),
+    "gpt-4.1-mini": ModelPrice(input=0.40, output=1.60, cached_input=0.10),
+    "gpt-4.1-nano": ModelPrice(input=0.10, output=0.40, cached_input=0.025),
+    "glm-4.5-air": ModelPrice(input=0.20, output=1.10, cached_input=0.03),
+}
+
+
+class PriceTable:
+    """
+    Model name → ModelPrice.
+    Lookup: exact name, then without the provider prefix ("openai/gpt-4o" → "gpt-4o"),
+    then the default. OpenRouter ":free" variants cost nothing.
+    """
+
+    def __init__(self, prices: Dict[str, ModelPrice] = None, default: ModelPrice = DEFAULT_PRICE):
+        self.prices = dict(DEFAULT_PRICES if prices is None else prices)
+        self.default = default
+
+    @classmethod
+    def load(cls, path: str = None) -> "PriceTable":
+        """Built-in prices, overridden by `path` when it exists."""
+        path = path or Config.PRICING_FILE
+        table = cls()
+        if not path or not os.path.exists(path):
+            return table
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if "default" in data:
+                table.default = ModelPrice(**data["default"])
+            for model, price in data.get("models", {}).items():
+                table.prices[model] = ModelPrice(**price)
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("pricing_file_invalid", path=path, error=str(e))
+        return table
+
+    def price_for(self, model: str) -> ModelPrice:
+        model = model or ""
+        if model.endswith(":free"):
+            return FREE
+        if model in self.prices:
+            return self.prices[model]
+        return self.prices.get(model.rsplit("/", 1)[-1], self.default)
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int, cached_input_tokens: int = 0) -> float:
+        return self.price_for(model).cost(input_tokens, output_tokens, cached_input_tokens)
+
+
+_price_table: Optional[PriceTable] = None
+
+
+def get_price_table() -> PriceTable:
+    global _price_table
+    if _price_table is None:
+        _price_table = PriceTable.load()
+    return _price_table
+
+
+def cached_prompt_tokens(usage) -> int:
+    """Prompt tokens the provider billed at its cached rate (0 when not reported)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", None) or 0
+
+
+# ===========================
+# Budgets
+# ===========================
+@dataclass
+class Budget:
+    """A USD spend limit (0 or None = unlimited) and what has been charged to it."""
+    limit_usd: Optional[float] = None
+    spent_usd: float = 0.0
+
+    @property
+    def limited(self) -> bool:
+        return bool(self.limit_usd)
+
+    @property
+    def remaining_usd(self) -> float:
+        return self.limit_usd - self.spent_usd if self.limited else float("inf")
+
+    @property
+    def fraction_used(self) -> float:
+        return self.spent_usd / self.limit_usd if self.limited else 0.0
+
+    def charge(self, cost_usd: float):
+        self.spent_usd += cost_usd
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["spent_usd"] = round(self.spent_usd, 6)
+        return data
+
+
+# Degradation ladder, mildest first
+BUDGET_OK = "ok"
+BUDGET_SHRINK = "shrink_steps"  # fewer steps left than planned
+BUDGET_FINAL = "force_final"  # no more tools, answer now
+BUDGET_STOP = "stop"  # nothing left to spend
+
+
+def plan_step(budgets, estimated_step_cost: float, steps_left: int, soft_ratio: float = None) -> tuple:
+    """
+    Decide how the next step may run under the tightest of `budgets`.
+    Returns (action, affordable_steps).
+    """
+    soft_ratio = Config.BUDGET_SOFT_RATIO if soft_ratio is None else soft_ratio
+    limited = [b for b in budgets if b is not None and b.limited]
+    if not limited:
+        return BUDGET_OK, steps_left
+
+    remaining = min(b.remaining_usd for b in limited)
+    if remaining <= 0:
+        return BUDGET_STOP, 0
+    if any(b.fraction_used >= soft_ratio for b in limited):
+        return BUDGET_FINAL, 1
+
+    affordable = int(remaining // estimated_step_cost) if estimated_step_cost > 0 else steps_left
+    if affordable <= 1:
+        return BUDGET_FINAL, 1
+    if affordable < steps_left:
+        return BUDGET_SHRINK, affordable
+    return BUDGET_OK, steps_left
@@ -0,0 +1,213 @@
+"""
+On-demand cProfile for agent runs.
+
+A run is profiled when asked for explicitly (`agent.run(..., profile=True)`)
+or when sampled at Config.PROFILE_SAMPLE_RATE. The aggregated stats are stored
+on the trace (`Trace.profile`) and persisted with it, so they can be read back
+later by trace id:
+
+    PYTHONPATH=src python -m observability.profiler <trace_id> [--top 25] [--sort cumtime]
+
+Disabled runs only pay for one ContextVar lookup and a random() draw.
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from config import Config
+from observability.tracer import tracer
+
+SORT_KEYS = ("tottime", "cumtime", "ncalls")
+
+_active_profile: ContextVar[Optional["RunProfile"]] = ContextVar("active_profile", default=None)
+# cProfile hooks are per thread and cannot be stacked: one profiled run per thread at a time
+_profiled_threads: set = set()
+_profiled_threads_lock = threading.Lock()
+
+
+class RunProfile:
+    """
+    cProfile data for one agent run.
+    The event-loop thread is profiled from start() to stop(); sync tools running
+    in the thread pool are profiled separately (see wrap()) and merged in.
+    Other coroutines sharing the loop during the run are included too.
+    """
+
+    def __init__(self):
+        self._main = cProfile.Profile()
+        self._workers: list = []
+        self._lock = threading.Lock()
+        self._started = 0.0
+        self.wall_ms = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._main.enable()
+
+    def stop(self):
+        self._main.disable()
+        self.wall_ms = (time.perf_counter() - self._started) * 1000
+
+    def wrap(self, func: Callable) -> Callable:
+        """Profile `func` in whichever thread it ends up running."""
+        def profiled(*args, **kwargs):
+            worker = cProfile.Profile()
+            try:
+                return worker.runcall(func, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._workers.append(worker)
+        return profiled
+
+    def to_dict(self, max_functions: int = None) -> dict:
+        """
+        Aggregated, JSON-serializable stats.
+        Keeps the union of the top `max_functions` by own time and by cumulative time.
+        """
+        max_functions = max_functions or Config.PROFILE_MAX_FUNCTIONS
+        stats = pstats.Stats(self._main)
+        with self._lock:
+            for worker in self._workers:
+                stats.add(worker)
+
+        rows = [
+            {
+                "function": func_name,
+                "file": _short_path(filename),
+                "line": line,
+                "ncalls": ncalls,
+                "primitive_calls": primitive_calls,
+                "tottime_ms": round(tottime * 1000, 3),
+                "cumtime_ms": round(cumtime * 1000, 3),
+            }
+            for (filename, line, func_name), (primitive_calls, ncalls, tottime, cumtime, _) in stats.stats.items()
+        ]
+        by_own = sorted(rows, key=lambda r: r["tottime_ms"], reverse=True)[:max_functions]
+        by_cum = sorted(rows, key=lambda r: r["cumtime_ms"], reverse=True)[:max_functions]
+        kept = {id(r): r for r in by_own + by_cum}
+
+        return {
+            "profiler": "cProfile",
+            "wall_ms": round(self.wall_ms, 3),
+            "total_calls": stats.total_calls,
+            "cpu_ms": round(stats.total_tt * 1000, 3),
+            "worker_threads": len(self._workers),
+            "functions_total": len(rows),
+            "functions": sorted(kept.values(), key=lambda r: r["tottime_ms"], reverse=True),
+        }
+
+
+def _short_path(filename: str) -> str:
+    """Trim site-packages / project prefixes so the table stays readable."""
+    for marker in ("site-packages" + os.sep, "src" + os.sep):
+        index = filename.rfind(marker)
+        if index != -1:
+            return filename[index + len(marker):]
+    return filename
+
+
+def active_profile() -> Optional[RunProfile]:
+    return _active_profile.get()
+
+
+def should_profile(profile: Optional[bool] = None) -> bool:
+    """Explicit request wins; otherwise sample at Config.PROFILE_SAMPLE_RATE."""
+    if profile is not None:
+        return profile
+    rate = Config.PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+@contextmanager
+def profiled_run(trace_id: str, profile: Optional[bool] = None):
+    """
+    Profile the enclosed agent run and attach the stats to its trace.
+    No-op when not selected, when an enclosing run is already profiled
+    (its profile covers this one), or when another run holds this thread's profiler.
+    """
+    if _active_profile.get() is not None or not should_profile(profile):
+        yield None
+        return
+
+    thread_id = threading.get_ident()
+    with _profiled_threads_lock:
+        busy = thread_id in _profiled_threads
+        if not busy:
+            _profiled_threads.add(thread_id)
+    if busy:
+        tracer.increment("profile.skipped_busy", trace_id=trace_id)
+        yield None
+        return
+
+    run_profile = RunProfile()
+    token = _active_profile.set(run_profile)
+    run_profile.start()
+    try:
+        yield run_profile
+    finally:
+        run_profile.stop()
+        _active_profile.reset(token)
+        with _profiled_threads_lock:
+            _profiled_threads.discard(thread_id)
+        tracer.attach_profile(trace_id, run_profile.to_dict())
+
+
+# ===========================
+# CLI
+# ===========================
+def format_top(profile: dict, top: int = 25, sort: str = "tottime") -> str:
+    """Top-N table for a stored profile."""
+    if sort not in SORT_KEYS:
+        raise ValueError(f"sort must be one of {SORT_KEYS}")
+    key = "ncalls" if sort == "ncalls" else f"{sort}_ms"
+    rows = sorted(profile["functions"], key=lambda r: r[key], reverse=True)[:top]
+
+    lines = [
+        f"wall {profile['wall_ms']:.1f} ms, profiled CPU {profile['cpu_ms']:.1f} ms, "
+        f"{profile['total_calls']} calls, {profile['worker_threads']} worker-thread profiles",
+        f"{'ncalls':>10} {'tottime ms':>12} {'cumtime ms':>12}  function",
+    ]
+    for row in rows:
+        ncalls = str(row["ncalls"])
+        if row["primitive_calls"] != row["ncalls"]:
+            ncalls = f"{row['ncalls']}/{row['primitive_calls']}"
+        lines.append(
+            f"{ncalls:>10} {row['tottime_ms']:>12.2f} {row['cumtime_ms']:>12.2f}  "
+            f"{row['file']}:{row['line']}({row['function']})"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m observability.profiler",
+        description="Show the hottest functions recorded for a profiled trace.",
+    )
+    parser.add_argument("trace_id")
+    parser.add_argument("--top", type=int, default=25, help="Number of functions to show")
+    parser.add_argument("--sort", choices=SORT_KEYS, default="tottime")
+    args = parser.parse_args(argv)
+
+    trace = tracer.get_trace(args.trace_id)
+    if trace is None:
+        print(f"Trace {args.trace_id} not found in {Config.TRACE_STORE_DIR}", file=sys.stderr)
+        return 1
+    if not trace.profile:
+        print(f"Trace {args.trace_id} was not profiled (run with profile=True or PROFILE_SAMPLE_RATE)", file=sys.stderr)
+        return 1
+
+    print(f"Trace {trace.trace_id} · {trace.agent_name} · {trace.status} · {trace.input_query[:60]!r}")
+    print(format_top(trace.profile, args.top, args.sort))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
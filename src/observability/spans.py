@@ -0,0 +1,296 @@
+import atexit
+import functools
+import inspect
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+from config import Config
+
+logger = structlog.get_logger()
+
+SERVICE_NAME = "sdaia-agents"
+
+# OTLP enums
+KIND_INTERNAL = 1
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str  # 32 hex chars, shared by every span of one pipeline run
+    span_id: str  # 16 hex chars
+    parent_span_id: Optional[str] = None
+    kind: int = KIND_INTERNAL
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: int = STATUS_OK
+    status_message: str = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """Returned when span recording is off, so call sites need no checks."""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+# ===========================
+# Exporters
+# ===========================
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[Span]) -> dict:
+    """ExportTraceServiceRequest (OTLP/JSON) for a batch of spans."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "observability.spans"},
+                "spans": [
+                    {
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        "parentSpanId": span.parent_span_id or "",
+                        "name": span.name,
+                        "kind": span.kind,
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns),
+                        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+                        "status": {"code": span.status, "message": span.status_message},
+                    }
+                    for span in spans
+                ],
+            }],
+        }]
+    }
+
+
+class OTLPJsonFileExporter:
+    """
+    Appends one OTLP/JSON export request per finished trace (JSON lines, like
+    the collector's file exporter). Encoding and file writes happen on a
+    background thread, so ending a root span never waits on disk I/O.
+    """
+
+    def __init__(self, path: str = Config.SPANS_EXPORT_PATH):
+        self.path = path
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="span-writer", daemon=True)
+                self._writer.start()
+        self._queue.put(list(spans))
+
+    def _write_loop(self):
+        while True:
+            batches = [self._queue.get()]
+            # Drain whatever else is queued so one open/write covers it
+            while True:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = "".join(json.dumps(to_otlp(spans), default=str) + "\n" for spans in batches)
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except Exception as e:
+                logger.warning("span_export_failed", error=str(e))
+            finally:
+                for _ in batches:
+                    self._queue.task_done()
+
+    def flush(self, timeout: float = None):
+        """Block until every exported trace is on disk (tests / shutdown)."""
+        if self._writer is None:
+            return
+        if timeout is None:
+            self._queue.join()
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+class InMemorySpanExporter:
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def export(self, spans: List[Span]):
+        self.spans.extend(spans)
+
+
+# ===========================
+# Recording
+# ===========================
+class SpanRecorder:
+    """
+    Collects finished spans per trace and hands a trace to the exporter once
+    its root span ends. Spans of a root that never ends are flushed after
+    `max_buffered` to bound memory.
+    """
+
+    def __init__(self, exporter=None, max_buffered: int = 10000):
+        self.exporter = exporter
+        self.max_buffered = max_buffered
+        self._finished: Dict[str, List[Span]] = {}
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span):
+        batches = []
+        with self._lock:
+            self._finished.setdefault(span.trace_id, []).append(span)
+            self._buffered += 1
+            if span.parent_span_id is None:
+                batches.append(self._finished.pop(span.trace_id))
+            elif self._buffered > self.max_buffered:
+                batches.extend(self._finished.values())
+                self._finished.clear()
+            self._buffered -= sum(len(b) for b in batches)
+        for batch in batches:
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                logger.warning("span_export_failed", error=str(e))
+
+
+_recorder: Optional[SpanRecorder] = None
+_configured = False
+
+
+def configure(exporter=None, enabled: bool = True):
+    """Install an exporter (None with enabled=False turns recording off)."""
+    global _recorder, _configured
+    _configured = True
+    _recorder = SpanRecorder(exporter or OTLPJsonFileExporter()) if enabled else None
+    return _recorder
+
+
+def _flush_at_exit():
+    flush = getattr(getattr(_recorder, "exporter", None), "flush", None)
+    if flush is not None:
+        flush(2)
+
+
+atexit.register(_flush_at_exit)
+
+
+def _get_recorder() -> Optional[SpanRecorder]:
+    if not _configured:
+        configure(enabled=Config.SPANS_ENABLED)
+    return _recorder
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def set_attribute(key: str, value: Any):
+    """Annotate the current span, if one is being recorded."""
+    current = _current_span.get()
+    if current is not None:
+        current.set_attribute(key, value)
+
+
+@contextmanager
+def use_span(parent: Optional[Span]):
+    """Make `parent` the current span without recording anything (re-parenting)."""
+    token = _current_span.set(parent)
+    try:
+        yield parent
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """
+    Record `name` as a child of the current span (or as a new root).
+    Usable around sync and async code; the parent is taken from a ContextVar,
+    so tasks and copied contexts (thread pool) nest correctly.
+    """
+    recorder = _get_recorder()
+    if recorder is None:
+        yield _NOOP
+        return
+
+    parent = _current_span.get()
+    current = Span(
+        name=name,
+        trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+        span_id=os.urandom(8).hex(),
+        parent_span_id=parent.span_id if parent else None,
+        kind=kind,
+        attributes=attributes,
+    )
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = STATUS_ERROR
+        current.status_message = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end_ns = time.time_ns()
+        recorder.on_end(current)
+
+
+def traced(name: str = None, kind: int = KIND_INTERNAL):
+    """Decorator form of span() for sync and async functions."""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,278 @@
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import structlog
+
+from config import Config
+
+logger = structlog.get_logger()
+
+_STOP = object()
+
+
+class TraceStore:
+    """
+    Two-tier storage for traces.
+    - hot: the `capacity` most recent traces, in memory (LRU ring)
+    - cold: gzip JSONL segments written by a background thread
+    Completed traces are snapshotted (serialized) and queued for the writer;
+    completed traces are evicted first; running ones only once they are older
+    than `running_timeout` (spilled as they are), so they may briefly push the
+    hot tier past `capacity`. Callers never wait on disk I/O.
+    Lookup checks memory, then the write queue, then the segments.
+    Retention drops segments older than `retention_seconds` and the oldest
+    segments beyond `max_total_bytes`.
+    """
+
+    def __init__(
+        self,
+        directory: str = Config.TRACE_STORE_DIR,
+        capacity: int = Config.TRACE_STORE_CAPACITY,
+        persist: bool = Config.TRACE_STORE_PERSIST,
+        segment_max_bytes: int = Config.TRACE_SEGMENT_MAX_BYTES,
+        retention_seconds: float = Config.TRACE_RETENTION_SECONDS,
+        max_total_bytes: int = Config.TRACE_STORE_MAX_BYTES,
+        running_timeout: float = Config.TRACE_RUNNING_TIMEOUT_SECONDS,
+        serialize: Callable[[Any], dict] = None,
+        deserialize: Callable[[dict], Any] = None,
+    ):
+        self.directory = directory
+        self.capacity = capacity
+        self.persist = persist
+        self.segment_max_bytes = segment_max_bytes
+        self.retention_seconds = retention_seconds
+        self.max_total_bytes = max_total_bytes
+        self.running_timeout = running_timeout
+        self.serialize = serialize or (lambda obj: obj)
+        self.deserialize = deserialize or (lambda data: data)
+
+        self._hot: OrderedDict[str, Any] = OrderedDict()
+        self._pending: Dict[str, dict] = {}  # serialized snapshots queued for the writer, not on disk yet
+        self._completed: set = set()  # hot traces already queued by complete()
+        self._added_at: Dict[str, float] = {}  # trace_id -> time.monotonic() it entered the hot tier
+        self._index: Dict[str, str] = {}  # trace_id -> segment path (written this process)
+        self._lock = threading.Lock()
+
+        self._queue: queue.Queue = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._segment_path: Optional[str] = None
+        self._segment_bytes = 0
+        self._segment_seq = 0
+        self.stats = {"evicted": 0, "stale_evicted": 0, "written": 0, "write_errors": 0, "segments_deleted": 0}
+
+    # ---------------------------
+    # Hot path
+    # ---------------------------
+    def add(self, trace_id: str, trace: Any):
+        with self._lock:
+            self._hot[trace_id] = trace
+            self._hot.move_to_end(trace_id)
+            self._added_at[trace_id] = time.monotonic()
+            self._evict()
+
+    def complete(self, trace_id: str):
+        """Queue a snapshot of a finished trace for the writer (it stays in memory until evicted)."""
+        with self._lock:
+            trace = self._hot.get(trace_id)
+            if trace is not None:
+                self._completed.add(trace_id)
+                self._hot.move_to_end(trace_id)
+                self._enqueue(trace_id, trace)
+                self._evict()
+
+    def get_hot(self, trace_id: str) -> Optional[Any]:
+        """Only the in-memory tier; never touches disk."""
+        return self._hot.get(trace_id)
+
+    def _evict(self):
+        # caller holds self._lock; oldest completed traces first, then running ones past the timeout
+        if len(self._hot) <= self.capacity:
+            return
+        stale_before = time.monotonic() - self.running_timeout
+        completed = [t for t in self._hot if t in self._completed]
+        stale = [t for t in self._hot if t not in self._completed and self._added_at.get(t, 0) <= stale_before]
+        for trace_id in completed + stale:
+            if len(self._hot) <= self.capacity:
+                break
+            trace = self._hot.pop(trace_id)
+            self._added_at.pop(trace_id, None)
+            if trace_id in self._completed:
+                self._completed.discard(trace_id)
+            else:
+                self.stats["stale_evicted"] += 1
+                self._enqueue(trace_id, trace)  # abandoned run: keep what it recorded
+            self.stats["evicted"] += 1
+
+    def _enqueue(self, trace_id: str, trace: Any):
+        # caller holds self._lock
+        if not self.persist:
+            return
+        # Serialized now, so later updates to the live trace never race the writer
+        data = self.serialize(trace)
+        self._pending[trace_id] = data
+        self._ensure_writer()
+        self._queue.put((trace_id, data))
+
+    # ---------------------------
+    # Lookup across tiers
+    # ---------------------------
+    def get(self, trace_id: str) -> Optional[Any]:
+        with self._lock:
+            trace = self._hot.get(trace_id)
+            pending = self._pending.get(trace_id)
+            path = self._index.get(trace_id)
+        if trace is not None:
+            return trace
+        if pending is not None:
+            return self.deserialize(pending)
+        if not self.persist:
+            return None
+        paths = [path] if path else self._segments(newest_first=True)
+        for segment in paths:
+            data = self._find_in_segment(segment, trace_id)
+            if data is not None:
+                return self.deserialize(data)
+        return None
+
+    def _find_in_segment(self, path: str, trace_id: str) -> Optional[dict]:
+        needle = f'"trace_id": "{trace_id}"'
+        found = None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if needle in line:
+                        data = json.loads(line)
+                        if data.get("trace_id") == trace_id:
+                            found = data  # keep the last (most complete) snapshot
+        except (OSError, EOFError, ValueError) as e:
+            logger.warning("trace_segment_unreadable", path=path, error=str(e))
+        return found
+
+    # ---------------------------
+    # Background writer
+    # ---------------------------
+    def _ensure_writer(self):
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Drain whatever else is queued so one gzip member covers the batch
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(entry is _STOP for entry in batch)
+            batch = [entry for entry in batch if entry is not _STOP]
+            try:
+                if batch:
+                    self._write_batch(batch)
+            except Exception as e:
+                self.stats["write_errors"] += 1
+                logger.error("trace_write_failed", error=str(e))
+            finally:
+                with self._lock:
+                    for trace_id, data in batch:
+                        if self._pending.get(trace_id) is data:
+                            del self._pending[trace_id]
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _new_segment_path(self) -> str:
+        self._segment_seq += 1
+        name = f"traces-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._segment_seq:04d}.jsonl.gz"
+        return os.path.join(self.directory, name)
+
+    def _write_batch(self, batch):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._segment_path is None or self._segment_bytes >= self.segment_max_bytes:
+            self._segment_path = self._new_segment_path()
+            self._segment_bytes = 0
+            self._apply_retention()
+
+        lines = "".join(
+            json.dumps(data, default=str) + "\n" for _, data in batch
+        ).encode("utf-8")
+        # Each batch is a complete gzip member, so the file is always readable
+        with open(self._segment_path, "ab") as f:
+            with gzip.GzipFile(fileobj=f, mode="wb") as gz:
+                gz.write(lines)
+        self._segment_bytes += len(lines)
+
+        with self._lock:
+            for trace_id, _ in batch:
+                self._index[trace_id] = self._segment_path
+        self.stats["written"] += len(batch)
+
+    # ---------------------------
+    # Retention
+    # ---------------------------
+    def _segments(self, newest_first: bool = False):
+        paths = sorted(
+            glob.glob(os.path.join(self.directory, "traces-*.jsonl.gz")),
+            key=os.path.getmtime,
+        )
+        return paths[::-1] if newest_first else paths
+
+    def _delete_segment(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        self.stats["segments_deleted"] += 1
+        with self._lock:
+            for trace_id in [t for t, p in self._index.items() if p == path]:
+                del self._index[trace_id]
+
+    def _apply_retention(self):
+        now = time.time()
+        segments = [p for p in self._segments() if p != self._segment_path]
+        sizes = {}
+        for path in segments:
+            try:
+                if now - os.path.getmtime(path) > self.retention_seconds:
+                    self._delete_segment(path)
+                else:
+                    sizes[path] = os.path.getsize(path)
+            except OSError:
+                continue
+        total = sum(sizes.values())
+        for path in sizes:  # oldest first
+            if total <= self.max_total_bytes:
+                break
+            self._delete_segment(path)
+            total -= sizes[path]
+
+    # ---------------------------
+    # Shutdown
+    # ---------------------------
+    def flush(self, timeout: float = None):
+        """Block until every queued trace is on disk (tests / shutdown)."""
+        if self._writer is None:
+            return
+        if timeout is None:
+            self._queue.join()
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=5)
+        self._writer = None
+
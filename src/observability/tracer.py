@@ -1,13 +1,21 @@
+import atexit
 import json
+import threading
 import time
 import uuid
+from contextvars import ContextVar, Token
 from dataclasses import asdict, dataclass, field
 from typing import Optional
 
 import structlog
 
+from observability.trace_store import TraceStore
+
 logger = structlog.get_logger()
 
+# Trace of the agent run executing in the current task/thread
+_current_trace_id: ContextVar[Optional[str]] = ContextVar("current_trace_id", default=None)
+
 @dataclass
 class ToolCallRecord:
     tool_name: str
@@ -15,6 +23,17 @@ class ToolCallRecord:
     tool_output: str
     duration_ms: float
 
+@dataclass
+class LoopIntervention:
+    step_number: int
+    strategy: str  # "exact", "fuzzy", "stagnation"
+    action: str  # "short_circuit", "inject", "abort"
+    message: str
+    tool_name: Optional[str] = None
+    tool_ms_saved: float = 0.0
+    tokens_saved: int = 0
+    steps_saved: int = 0
+
 @dataclass
 class AgentStep:
     step_number: int
@@ -25,6 +44,16 @@ class AgentStep:
     cost_usd: float = 0.0
     duration_ms: float = 0.0
     timestamp: float = field(default_factory=time.time)
+    cache_hit: bool = False
+    cached_input_tokens: int = 0
+    cached_output_tokens: int = 0
+    context_tokens: int = 0
+    context_tokens_saved: int = 0
+    loop_interventions: list[LoopIntervention] = field(default_factory=list)
+    prompt_cache_tokens: int = 0  # input tokens billed at the provider's cached rate
+    budget_action: Optional[str] = None
+    model: str = ""  # model whose response was kept (routing may try a fast one first)
+    escalation: Optional[str] = None  # why the fast model's response was redone
 
 @dataclass
 class Trace:
@@ -40,36 +69,57 @@ class Trace:
     total_duration_ms: float = 0.0
     status: str = "running"
     error: Optional[str] = None
+    counters: dict[str, float] = field(default_factory=dict)
+    profile: Optional[dict] = None  # cProfile summary, see observability.profiler
+
+def trace_from_dict(data: dict) -> Trace:
+    """Rebuild a Trace read back from the on-disk tier."""
+    steps = []
+    for step in data.get("steps", []):
+        step = dict(step)
+        step["tool_calls"] = [ToolCallRecord(**call) for call in step.get("tool_calls", [])]
+        step["loop_interventions"] = [LoopIntervention(**i) for i in step.get("loop_interventions", [])]
+        steps.append(AgentStep(**step))
+    return Trace(**{**data, "steps": steps})
 
 class AgentTracer:
     """
     Captures agent execution flow for debugging and analysis.
+    Recent traces live in memory; older ones are spilled to disk by TraceStore.
     """
-    def __init__(self, verbose: bool = False):
-        self._traces: dict[str, Trace] = {}
+    def __init__(self, verbose: bool = False, store: TraceStore = None):
+        self.store = store or TraceStore(serialize=asdict, deserialize=trace_from_dict)
         self._active_trace_id: Optional[str] = None
+        self._context_tokens: dict[str, Token] = {}  # trace_id -> token to restore the outer trace
         self.verbose = verbose
+        self._counters: dict[str, float] = {}
+        self._counters_lock = threading.Lock()
 
     def start_trace(self, agent_name: str, query: str, model: str = "") -> str:
         """Start a new trace for an agent execution."""
         trace_id = str(uuid.uuid4())[:8]  # Short ID for readability
-        self._traces[trace_id] = Trace(
+        self.store.add(trace_id, Trace(
             trace_id=trace_id,
             agent_name=agent_name,
             input_query=query,
             model=model,
-        )
+        ))
         self._active_trace_id = trace_id
+        if len(self._context_tokens) > self.store.capacity:
+            # Traces evicted without end_trace (abandoned runs) release their tokens here
+            for stale_id in [t for t in self._context_tokens if self.store.get_hot(t) is None]:
+                del self._context_tokens[stale_id]
+        self._context_tokens[trace_id] = _current_trace_id.set(trace_id)
 
         logger.info("trace_started", trace_id=trace_id, agent_name=agent_name, model=model, query=query)
         return trace_id
 
     def log_step(self, trace_id: str, step: AgentStep):
         """Log a completed step to the trace."""
-        if trace_id not in self._traces:
+        trace = self.store.get_hot(trace_id)
+        if trace is None:
             return
 
-        trace = self._traces[trace_id]
         trace.steps.append(step)
 
         # Accumulate totals
@@ -86,12 +136,21 @@ class AgentTracer:
 
     def end_trace(self, trace_id: str, output: str, status: str = "completed", error: str = None):
         """Mark a trace as complete."""
-        if trace_id not in self._traces:
+        token = self._context_tokens.pop(trace_id, None)
+        if token is not None:
+            try:
+                _current_trace_id.reset(token)
+            except ValueError:
+                pass  # ended from another context; that context's value is left alone
+        trace = self.store.get_hot(trace_id)
+        if trace is None:
             return
-        trace = self._traces[trace_id]
         trace.final_output = output
         trace.status = status
         trace.error = error
+        # Snapshotted under the counters lock so increment() cannot change it mid-copy
+        with self._counters_lock:
+            self.store.complete(trace_id)  # written to disk in the background
 
         logger.info("trace_ended",
                     trace_id=trace_id,
@@ -99,14 +158,67 @@ class AgentTracer:
                     duration_ms=round(trace.total_duration_ms, 0),
                     cost_usd=round(trace.total_cost_usd, 4))
 
+    def log_intervention(self, trace_id: str, intervention: LoopIntervention):
+        """Count a loop-detector intervention and what it saved."""
+        self.increment("loop.interventions", trace_id=trace_id)
+        self.increment(f"loop.{intervention.action}", trace_id=trace_id)
+        self.increment("loop.tool_ms_saved", intervention.tool_ms_saved, trace_id=trace_id)
+        self.increment("loop.tokens_saved", intervention.tokens_saved, trace_id=trace_id)
+        self.increment("loop.steps_saved", intervention.steps_saved, trace_id=trace_id)
+
+        logger.info("loop_intervention",
+                    trace_id=trace_id,
+                    step_number=intervention.step_number,
+                    strategy=intervention.strategy,
+                    action=intervention.action,
+                    tool_name=intervention.tool_name)
+
+    def attach_profile(self, trace_id: str, profile: dict):
+        """Store profiler stats on a trace (before end_trace, so they are persisted with it)."""
+        trace = self.store.get_hot(trace_id)
+        if trace is None:
+            return
+        trace.profile = profile
+        self.increment("profile.runs", trace_id=trace_id)
+
+        hottest = profile["functions"][0] if profile["functions"] else {}
+        logger.info("profile_attached",
+                    trace_id=trace_id,
+                    cpu_ms=profile["cpu_ms"],
+                    total_calls=profile["total_calls"],
+                    hottest=hottest.get("function"))
+
+    def current_trace_id(self) -> Optional[str]:
+        """Trace of the agent run in the current context, if any."""
+        return _current_trace_id.get()
+
+    def increment(self, name: str, value: float = 1, trace_id: str = None):
+        """
+        Bump a named counter (e.g. "tool_cache.hit").
+        Counted globally and on the current trace.
+        """
+        trace_id = trace_id or _current_trace_id.get()
+        with self._counters_lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+            trace = self.store.get_hot(trace_id) if trace_id else None
+            if trace is not None:
+                trace.counters[name] = trace.counters.get(name, 0) + value
+
+    def get_counters(self) -> dict[str, float]:
+        with self._counters_lock:
+            return dict(self._counters)
+
     def get_trace(self, trace_id: str) -> Optional[Trace]:
-        return self._traces.get(trace_id)
+        """Look a trace up in memory, then on disk."""
+        return self.store.get(trace_id)
 
     def get_trace_json(self, trace_id: str) -> str:
         """Export a trace as formatted JSON for debugging."""
-        if trace_id not in self._traces:
+        trace = self.get_trace(trace_id)
+        if trace is None:
             return "{}"
-        return json.dumps(asdict(self._traces[trace_id]), indent=2)
+        return json.dumps(asdict(trace), indent=2)
 
 # Global tracer instance
 tracer = AgentTracer()
+atexit.register(tracer.store.flush, 2)
@@ -0,0 +1,91 @@
+from agent.deadline import deadline, remaining_time
+from agent.fanout import FanOutResearcher
+from agent.specialists import create_researcher, create_analyst, create_writer
+from config import Config
+from observability.spans import set_attribute, traced
+
+
+def create_pipeline_agents(fanout: bool = None, **agent_kwargs):
+    """
+    Researcher, Analyst and Writer sharing the same agent options.
+    fanout (default Config.FANOUT_ENABLED) swaps in the FanOutResearcher.
+    """
+    fanout = Config.FANOUT_ENABLED if fanout is None else fanout
+    return (
+        FanOutResearcher(**agent_kwargs) if fanout else create_researcher(**agent_kwargs),
+        create_analyst(**agent_kwargs),
+        create_writer(**agent_kwargs),
+    )
+
+
+def _log_usage(tracker, agent_name, result):
+    tracker.log_agent_usage(
+        agent_name=agent_name,
+        model=result["model_used"],
+        input_tokens=result["total_input_tokens"],
+        output_tokens=result["total_output_tokens"],
+        cost_usd=result["estimated_cost_usd"],
+        budget_actions=result["budget"]["actions"],
+        models=result["cost_by_model"],
+    )
+
+
+def _handoff(result, stage_input: str) -> str:
+    """A stage's answer as the next stage's input; without one, the stage's own input with a note."""
+    if result["answer"]:
+        return result["answer"]
+    set_attribute("pipeline.missing_answer", result["agent_name"])
+    return f"[No answer from the {result['agent_name']}: it stopped before finishing.]\n\n{stage_input}"
+
+
+def _stage_seconds(stages_left: int):
+    """An even share of the query deadline for the next stage (None without a deadline)."""
+    remaining = remaining_time()
+    if remaining is None:
+        return None
+    return max(remaining / stages_left, 0.001)
+
+
+@traced("pipeline.run")
+async def run_pipeline(query, tracker, researcher, analyst, writer, stream_output: bool = True):
+    """
+    Researcher → Analyst → Writer for one query; returns the Writer's result.
+    All three agents are charged to the tracker's query budget; under a query
+    deadline each stage gets an even share of the time that is left.
+    """
+    set_attribute("pipeline.query", query)
+    verbose = tracker.verbose
+    budget = tracker.budget
+
+    # Run Researcher
+    if verbose:
+        print("Running Researcher...\n")
+    with deadline(_stage_seconds(3)):
+        research_result = await researcher.run(query, budget=budget)
+    _log_usage(tracker, "Researcher", research_result)
+    research = _handoff(research_result, query)
+
+    # Run Analyst
+    if verbose:
+        print("\nRunning Analyst...\n")
+    with deadline(_stage_seconds(2)):
+        analysis_result = await analyst.run(research, budget=budget)
+    _log_usage(tracker, "Analyst", analysis_result)
+
+    # Run Writer (streamed: the final answer is printed as it is generated)
+    analysis = _handoff(analysis_result, research)
+    if stream_output:
+        print("\nRunning Writer...\n")
+        print("\n================ FINAL OUTPUT ================\n")
+        with deadline(_stage_seconds(1)):
+            async for delta in writer.astream(analysis, budget=budget):
+                print(delta, end="", flush=True)
+        print("\n\n==============================================\n")
+        final_result = writer.last_result
+    else:
+        with deadline(_stage_seconds(1)):
+            final_result = await writer.run(analysis, budget=budget)
+
+    _log_usage(tracker, "Writer", final_result)
+
+    return final_result
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import structlog
+
+from config import Config
+from observability.tracer import tracer
+
+logger = structlog.get_logger()
+
+# Tool outputs that describe a failure, never worth caching
+UNCACHEABLE_PREFIXES = ("Error", "Search failed", "No relevant web results", "Execution error", "Validation error")
+
+
+# ===========================
+# Key Normalization
+# ===========================
+def normalize_url(url: str) -> str:
+    """Lowercase scheme/host, drop default ports and fragments, sort query params."""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    port = parsed.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, host, parsed.path or "/", "", query, ""))
+
+
+def normalize_value(value: Any) -> Any:
+    if isinstance(value, str):
+        if value.strip().lower().startswith(("http://", "https://")):
+            return normalize_url(value)
+        # Queries: case and whitespace don't change the answer
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {k: normalize_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_value(v) for v in value]
+    return value
+
+
+def make_cache_key(namespace: str, arguments: Dict[str, Any], normalize: Iterable[str] = ()) -> str:
+    """
+    Key for a tool call. Only the arguments named in `normalize` (declared safe
+    by the tool, e.g. a search query) are normalized; the rest are hashed verbatim.
+    """
+    normalize = set(normalize)
+    arguments = {k: normalize_value(v) if k in normalize else v for k, v in arguments.items()}
+    payload = json.dumps(arguments, sort_keys=True, default=str)
+    return hashlib.sha256(f"{namespace}:{payload}".encode("utf-8")).hexdigest()
+
+
+def is_cacheable(result: Any) -> bool:
+    return (
+        isinstance(result, str)
+        and bool(result.strip())
+        and result != "[]"
+        and not result.startswith(UNCACHEABLE_PREFIXES)
+    )
+
+
+# ===========================
+# SQLite Cache
+# ===========================
+class PersistentCache:
+    """
+    Disk-backed key/value cache.
+    - SQLite storage, safe to share between threads
+    - per-entry TTL
+    - LRU eviction bounded by entry count and total compressed bytes
+    - zlib-compressed values
+    - hit/miss/eviction counters reported to the tracer
+    """
+
+    def __init__(
+        self,
+        path: str = Config.TOOL_CACHE_PATH,
+        max_entries: int = Config.TOOL_CACHE_MAX_ENTRIES,
+        max_bytes: int = Config.TOOL_CACHE_MAX_BYTES,
+        name: str = "tool_cache",
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.name = name
+        self.stats = {"hit": 0, "miss": 0, "eviction": 0, "expired": 0}
+
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache(last_access)")
+            self._conn = conn
+        return self._conn
+
+    def _count(self, event: str, value: int = 1):
+        self.stats[event] += value
+        tracer.increment(f"{self.name}.{event}", value)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self._count("miss")
+                return None
+
+            value, expires_at = row
+            if expires_at <= now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._count("expired")
+                self._count("miss")
+                return None
+
+            conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+
+        self._count("hit")
+        return zlib.decompress(value).decode("utf-8")
+
+    def set(self, key: str, value: str, ttl: float):
+        now = time.time()
+        blob = zlib.compress(value.encode("utf-8"), 6)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now + ttl, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        # Expired rows go first, then least recently used until within bounds
+        expired = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,)).rowcount
+        if expired > 0:
+            self._count("expired", expired)
+
+        count, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        evicted = 0
+        while count > self.max_entries or total_bytes > self.max_bytes:
+            rows = conn.execute(
+                "SELECT key, size FROM cache ORDER BY last_access ASC LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if count <= self.max_entries and total_bytes <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                count -= 1
+                total_bytes -= size
+                evicted += 1
+
+        if evicted:
+            self._count("eviction", evicted)
+            logger.info("cache_evicted", cache=self.name, entries=evicted)
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM cache")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Shared cache for registered tools that opt in with cache_ttl=
+tool_cache = PersistentCache()
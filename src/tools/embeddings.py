@@ -0,0 +1,80 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+
+import numpy as np
+
+from config import Config
+from tools.segment_store import content_hash
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Unit-length rows, so L2 ranking equals cosine ranking."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(vectors / norms)
+
+
+class EmbeddingPipeline:
+    """
+    Batched, deduplicated text → normalized float32 embeddings.
+    - identical texts in one call are encoded once
+    - embeddings are cached in memory by content hash (LRU)
+    - misses are encoded in `batch_size` chunks
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable,
+        batch_size: int = Config.EMBEDDING_BATCH_SIZE,
+        cache_size: int = Config.EMBEDDING_CACHE_SIZE,
+    ):
+        self.encode_fn = encode_fn
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self._cache: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _cache_get(self, key: bytes):
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _cache_set(self, key: bytes, vector: np.ndarray):
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def encode(self, texts: List[str], hashes: List[bytes] = None) -> np.ndarray:
+        hashes = hashes or [content_hash(text) for text in texts]
+        vectors = {}
+        missing = OrderedDict()
+        for key, text in zip(hashes, texts):
+            if key in vectors or key in missing:
+                continue
+            cached = self._cache_get(key)
+            if cached is not None:
+                vectors[key] = cached
+            else:
+                missing[key] = text
+
+        self.stats["hits"] += len(vectors)
+        self.stats["misses"] += len(missing)
+        keys, pending = list(missing.keys()), list(missing.values())
+        for start in range(0, len(pending), self.batch_size):
+            batch = normalize(self.encode_fn(pending[start:start + self.batch_size]))
+            for key, vector in zip(keys[start:start + self.batch_size], batch):
+                vectors[key] = vector
+                self._cache_set(key, vector)
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in hashes])
@@ -0,0 +1,174 @@
+"""
+Query-focused excerpts of fetched pages.
+
+A page's text is split into chunks of about Config.EXCERPT_CHUNK_CHARS on line
+boundaries. With a focus query, chunks are ranked with BM25 (term statistics
+computed once per page) and the best ones are returned in page order within
+a character budget. Without a focus, or when nothing matches, the page's
+leading text is returned as before.
+
+Pages are kept in a short-lived in-memory cache (page_cache), so reading the
+same URL again with another focus does not download it again.
+"""
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+from config import Config
+from observability.tracer import tracer
+from tools.cache import normalize_url
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to was what when where which who why with"
+    .split()
+)
+SEPARATOR = "\n[...]\n"
+
+# BM25 parameters (the usual defaults)
+K1 = 1.5
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def chunk_text(text: str, chunk_chars: int) -> List[str]:
+    """Split on line boundaries into chunks of about `chunk_chars`; long lines are cut."""
+    chunks: List[str] = []
+    current: List[str] = []
+    length = 0
+    for line in text.splitlines():
+        while len(line) > chunk_chars:
+            cut = line.rfind(" ", 0, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            if current:
+                chunks.append("\n".join(current))
+                current, length = [], 0
+            chunks.append(line[:cut])
+            line = line[cut:].lstrip()
+        if current and length + len(line) + 1 > chunk_chars:
+            chunks.append("\n".join(current))
+            current, length = [], 0
+        if line:
+            current.append(line)
+            length += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# ===========================
+# Per-page index
+# ===========================
+class PageIndex:
+    """A page's text with BM25 statistics over its chunks, built on the first focused read."""
+
+    def __init__(self, text: str, chunk_chars: int = None):
+        self.text = text
+        self.chunk_chars = chunk_chars or Config.EXCERPT_CHUNK_CHARS
+        self.chunks: Optional[List[str]] = None
+        self._term_counts: List[Counter] = []
+        self._lengths: List[int] = []
+        self._average_length = 0.0
+        self._idf: Dict[str, float] = {}
+
+    def _build(self):
+        self.chunks = chunk_text(self.text, self.chunk_chars)
+        self._term_counts = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        self._lengths = [sum(counts.values()) for counts in self._term_counts]
+        self._average_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        document_frequency = Counter(term for counts in self._term_counts for term in counts)
+        n = len(self.chunks)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def scores(self, query: str) -> List[float]:
+        """BM25 score of every chunk for `query`."""
+        if self.chunks is None:
+            self._build()
+        terms = [t for t in dict.fromkeys(tokenize(query)) if t in self._idf]
+        scores = [0.0] * len(self.chunks)
+        if not terms or not self._average_length:
+            return scores
+        for i, (counts, length) in enumerate(zip(self._term_counts, self._lengths)):
+            norm = K1 * (1 - B + B * length / self._average_length)
+            score = 0.0
+            for term in terms:
+                tf = counts.get(term)
+                if tf:
+                    score += self._idf[term] * tf * (K1 + 1) / (tf + norm)
+            scores[i] = score
+        return scores
+
+    def excerpt(self, focus: str = "", max_chars: int = None) -> str:
+        """The best-matching chunks for `focus` in page order, or the leading text without one."""
+        max_chars = max_chars or Config.EXCERPT_MAX_CHARS
+        if not focus.strip():
+            return self.text[:max_chars]
+        scores = self.scores(focus)
+        ranked = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: -scores[i])
+        if not ranked:
+            return self.text[:max_chars]
+
+        chosen, used = [], 0
+        for i in ranked:
+            size = len(self.chunks[i]) + (len(SEPARATOR) if chosen else 0)
+            if used + size > max_chars:
+                if chosen:
+                    continue
+                chosen.append(i)  # one oversized best chunk, cut below
+                break
+            chosen.append(i)
+            used += size
+        return SEPARATOR.join(self.chunks[i] for i in sorted(chosen))[:max_chars]
+
+
+# ===========================
+# Short-lived page cache
+# ===========================
+class PageCache:
+    """URL → PageIndex, expiring after `ttl` seconds, LRU-bounded to `max_pages`."""
+
+    def __init__(self, ttl: float = None, max_pages: int = None):
+        self.ttl = Config.PAGE_CACHE_TTL if ttl is None else ttl
+        self.max_pages = Config.PAGE_CACHE_MAX_PAGES if max_pages is None else max_pages
+        self._pages: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[PageIndex]:
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._pages[key]
+                entry = None
+            if entry is not None:
+                self._pages.move_to_end(key)
+        tracer.increment("page_cache.hit" if entry is not None else "page_cache.miss")
+        return entry[1] if entry is not None else None
+
+    def put(self, url: str, text: str) -> PageIndex:
+        page = PageIndex(text)
+        if self.ttl <= 0 or self.max_pages <= 0:
+            return page
+        key = normalize_url(url)
+        with self._lock:
+            self._pages[key] = (time.monotonic() + self.ttl, page)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+
+page_cache = PageCache()
@@ -0,0 +1,183 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import List, Optional
+
+from config import Config
+from observability.spans import set_attribute, traced
+
+# Subtrees that never carry readable text
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "canvas", "iframe"}
+# Page chrome, dropped only outside the content (an <article>'s <header> holds its title)
+BOILERPLATE_TAGS = {"nav", "header", "footer", "aside"}
+CONTENT_TAGS = {"article", "main"}
+# Tags that end a line of text
+BLOCK_TAGS = {
+    "p", "div", "br", "li", "ul", "ol", "tr", "td", "th", "table", "section",
+    "article", "main", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote",
+    "dd", "dt", "figcaption", "hr", "title",
+}
+_WHITESPACE = re.compile(r"\s+")
+
+
+# ===========================
+# Incremental extractor (stdlib)
+# ===========================
+class StreamingTextExtractor(HTMLParser):
+    """
+    Incremental HTML → text.
+    Feed chunks as they arrive; `done` turns True once `max_chars` of
+    visible text have been collected so the caller can stop downloading.
+    """
+
+    def __init__(self, max_chars: int = 8000):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.done = False
+        self._lines: List[str] = []
+        self._current: List[str] = []
+        self._length = 0
+        self._skip_stack: List[str] = []
+        self._content_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS or (tag in BOILERPLATE_TAGS and not self._content_depth):
+            self._skip_stack.append(tag)
+            return
+        if tag in CONTENT_TAGS and not self._skip_stack:
+            self._content_depth += 1
+        if tag in BLOCK_TAGS:
+            self._end_line()
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/>, <svg ... /> - never opens a skipped subtree
+        if tag in BLOCK_TAGS:
+            self._end_line()
+
+    def handle_endtag(self, tag):
+        if tag in self._skip_stack:
+            # Pop up to the matching tag; tolerates unclosed children
+            while self._skip_stack and self._skip_stack.pop() != tag:
+                pass
+        else:
+            if tag in CONTENT_TAGS and self._content_depth and not self._skip_stack:
+                self._content_depth -= 1
+            if tag in BLOCK_TAGS:
+                self._end_line()
+
+    def handle_data(self, data):
+        if self._skip_stack or self.done:
+            return
+        text = _WHITESPACE.sub(" ", data).strip()
+        if text:
+            self._current.append(text)
+            self._length += len(text) + 1
+            if self._length >= self.max_chars:
+                self.done = True
+
+    def _end_line(self):
+        if self._current:
+            self._lines.append(" ".join(self._current))
+            self._current = []
+
+    def feed(self, data: str) -> bool:
+        """Feed a chunk; returns True when enough text has been collected."""
+        if not self.done:
+            super().feed(data)
+        return self.done
+
+    def text(self) -> str:
+        self._end_line()
+        return "\n".join(self._lines)[:self.max_chars]
+
+
+# ===========================
+# Optional fast backend
+# ===========================
+def _selectolax_available() -> bool:
+    try:
+        import selectolax.parser  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    backend = backend or Config.HTML_PARSER_BACKEND
+    if backend == "auto":
+        return "selectolax" if _selectolax_available() else "stdlib"
+    return backend
+
+
+def _extract_selectolax(html: str, max_chars: int) -> str:
+    from selectolax.parser import HTMLParser as FastHTMLParser
+
+    tree = FastHTMLParser(html)
+    tree.strip_tags(sorted(SKIP_TAGS))
+    for node in tree.css(", ".join(sorted(BOILERPLATE_TAGS))):
+        parent = node.parent
+        while parent is not None and parent.tag not in CONTENT_TAGS:
+            parent = parent.parent
+        if parent is None:
+            node.decompose()
+    root = tree.body or tree.root
+    if root is None:
+        return ""
+    raw = root.text(separator="\n")
+    lines = (_WHITESPACE.sub(" ", line).strip() for line in raw.splitlines())
+    return "\n".join(line for line in lines if line)[:max_chars]
+
+
+@traced("html.extract")
+def extract_text(html: str, max_chars: int = 8000, backend: Optional[str] = None) -> str:
+    """Extract visible text from a complete HTML document."""
+    if resolve_backend(backend) == "selectolax":
+        return _extract_selectolax(html, max_chars)
+    extractor = StreamingTextExtractor(max_chars)
+    extractor.feed(html)
+    extractor.close()
+    return extractor.text()
+
+
+# ===========================
+# Streaming from an HTTP response
+# ===========================
+@traced("html.extract")
+async def extract_text_from_response(
+    response,
+    max_chars: int = 8000,
+    max_bytes: int = Config.HTML_MAX_BYTES,
+    backend: Optional[str] = None,
+) -> str:
+    """
+    Read a streamed httpx response under a byte cap and extract its text.
+    The stdlib backend parses chunk by chunk and stops downloading as soon as
+    it has `max_chars` of text; the selectolax backend parses the capped body once.
+    """
+    try:
+        decoder = codecs.getincrementaldecoder(response.charset_encoding or "utf-8")(errors="replace")
+    except LookupError:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    backend = resolve_backend(backend)
+    extractor = StreamingTextExtractor(max_chars) if backend == "stdlib" else None
+    parts: List[str] = []
+    received = 0
+
+    async for chunk in response.aiter_bytes():
+        chunk = chunk[:max_bytes - received]
+        received += len(chunk)
+        text = decoder.decode(chunk)
+        if extractor is not None:
+            if extractor.feed(text):
+                break
+        else:
+            parts.append(text)
+        if received >= max_bytes:
+            break
+
+    set_attribute("html.backend", backend)
+    set_attribute("html.bytes_read", received)
+    if extractor is None:
+        return _extract_selectolax("".join(parts) + decoder.decode(b"", final=True), max_chars)
+    extractor.feed(decoder.decode(b"", final=True))
+    return extractor.text()
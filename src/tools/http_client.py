@@ -0,0 +1,221 @@
+import asyncio
+import importlib.util
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urljoin, urlparse, urlunparse
+
+import httpx
+import structlog
+
+from config import Config
+from observability.spans import KIND_CLIENT, span
+from tools.url_safety import UnsafeURLError, ValidatedURL, check_url
+
+logger = structlog.get_logger()
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+
+class AsyncHttpClient:
+    """
+    Shared async HTTP client for every web tool.
+    - keep-alive connection pooling (one pool per event loop)
+    - per-host connection limits
+    - HTTP/2 when the `h2` package is installed
+    - configurable connect/read timeouts
+    - reference-counted shutdown tied to agent lifecycles
+    - IP-pinned fetches for URLs that passed the SSRF checks, on one pool per
+      hostname: httpx pools by the IP origin, so a shared pool could reuse a
+      TLS connection opened (SNI, certificate) for another host on that IP
+    """
+
+    def __init__(
+        self,
+        max_connections: int = Config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = Config.HTTP_MAX_KEEPALIVE,
+        per_host_limit: int = Config.HTTP_PER_HOST_LIMIT,
+        connect_timeout: float = Config.HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = Config.HTTP_READ_TIMEOUT,
+        http2: Optional[bool] = None,
+        pinned_pools: int = Config.HTTP_PINNED_POOLS,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.per_host_limit = per_host_limit
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http2 = importlib.util.find_spec("h2") is not None if http2 is None else http2
+        self.pinned_pools = pinned_pools
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._pinned_clients: "OrderedDict[str, httpx.AsyncClient]" = OrderedDict()  # hostname -> pool, LRU
+        self._pinned_active: Counter = Counter()  # hostname -> requests in flight on its pool
+        self._users = 0
+
+    # ======================================
+    # Client lifecycle
+    # ======================================
+    def _build_client(self, max_connections: int = None, max_keepalive_connections: int = None) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2,
+            headers=DEFAULT_HEADERS,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=max_connections or self.max_connections,
+                max_keepalive_connections=max_keepalive_connections or self.max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(
+                self.read_timeout,
+                connect=self.connect_timeout,
+                read=self.read_timeout,
+            ),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Connection pools are bound to the loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = self._build_client()
+            self._loop = loop
+            self._host_semaphores = {}
+            self._pinned_clients = OrderedDict()
+            self._pinned_active = Counter()
+        return self._client
+
+    async def _pinned_client(self, hostname: str) -> httpx.AsyncClient:
+        """The connection pool for one hostname (least recently used idle pools are closed)."""
+        self.client  # rebinds everything to the running loop if needed
+        client = self._pinned_clients.pop(hostname, None)
+        if client is None or client.is_closed:
+            client = self._build_client(self.per_host_limit, self.per_host_limit)
+        self._pinned_clients[hostname] = client
+        idle = [h for h in self._pinned_clients if h != hostname and not self._pinned_active[h]]
+        for evicted in idle[:max(0, len(self._pinned_clients) - self.pinned_pools)]:
+            await self._pinned_clients.pop(evicted).aclose()
+        return client
+
+    def attach(self):
+        """Register one more user (agent) of the shared client."""
+        self._users += 1
+
+    async def detach(self):
+        """Release one user; the pool is closed once nobody uses it."""
+        self._users = max(0, self._users - 1)
+        if self._users == 0:
+            await self.aclose()
+
+    async def aclose(self):
+        clients = [self._client, *self._pinned_clients.values()]
+        if self._client is not None and not self._client.is_closed:
+            logger.info("http_client_closed")
+        for client in clients:
+            if client is None or client.is_closed:
+                continue
+            try:
+                await client.aclose()
+            except RuntimeError:
+                # Owning loop already closed; sockets go with it
+                pass
+        self._client = None
+        self._loop = None
+        self._host_semaphores = {}
+        self._pinned_clients = OrderedDict()
+        self._pinned_active = Counter()
+
+    # ======================================
+    # Requests
+    # ======================================
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc.lower()
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_semaphores[host]
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        client = self.client
+        with span("http.request", KIND_CLIENT, **{"http.method": method, "url.full": url}) as current:
+            async with self._host_semaphore(url):
+                response = await client.request(method, url, **kwargs)
+            current.set_attribute("http.status_code", response.status_code)
+            return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        client = self.client
+        with span("http.stream", KIND_CLIENT, **{"http.method": method, "url.full": url}) as current:
+            async with self._host_semaphore(url):
+                async with client.stream(method, url, **kwargs) as response:
+                    current.set_attribute("http.status_code", response.status_code)
+                    yield response
+
+    # ======================================
+    # Pinned requests (no second DNS lookup)
+    # ======================================
+    def _build_pinned_request(self, client: httpx.AsyncClient, method: str, target: ValidatedURL, **kwargs) -> httpx.Request:
+        # Connect to the validated IP; Host header and TLS SNI keep the original name
+        default_port = 443 if target.scheme == "https" else 80
+        ip_host = f"[{target.ip}]" if ":" in target.ip else target.ip
+        suffix = "" if target.port == default_port else f":{target.port}"
+        parsed = urlparse(target.url)
+        url = urlunparse((target.scheme, ip_host + suffix, parsed.path or "/", parsed.params, parsed.query, ""))
+
+        headers = {**kwargs.pop("headers", {}), "Host": target.hostname + suffix}
+        extensions = {"sni_hostname": target.hostname} if target.scheme == "https" else {}
+        return client.build_request(method, url, headers=headers, extensions=extensions, **kwargs)
+
+    @asynccontextmanager
+    async def stream_pinned(self, method: str, target: ValidatedURL, max_redirects: int = 5, **kwargs):
+        """
+        Stream a response from a pre-validated URL.
+        Redirects are followed manually and every hop is re-validated.
+        """
+        with span("http.fetch", KIND_CLIENT, **{"http.method": method, "url.full": target.url}) as current:
+            for redirects in range(max_redirects + 1):
+                hostname = target.hostname
+                client = await self._pinned_client(hostname)
+                request = self._build_pinned_request(client, method, target, **dict(kwargs))
+                self._pinned_active[hostname] += 1
+                try:
+                    async with self._host_semaphore(target.url):
+                        response = await client.send(request, stream=True, follow_redirects=False)
+                        if not response.is_redirect:
+                            current.set_attribute("http.status_code", response.status_code)
+                            current.set_attribute("http.redirects", redirects)
+                            current.set_attribute("server.address", target.ip)
+                            try:
+                                yield response
+                            finally:
+                                await response.aclose()
+                            return
+                        location = urljoin(target.url, response.headers.get("location", ""))
+                        await response.aclose()
+                finally:
+                    self._pinned_active[hostname] -= 1
+
+                next_target = await check_url(location)
+                if next_target is None:
+                    raise UnsafeURLError(f"Redirect to invalid or restricted URL: {location}")
+                target = next_target
+                if response.status_code == 303:
+                    method = "GET"
+                    kwargs.pop("data", None)
+            raise httpx.TooManyRedirects(f"Exceeded {max_redirects} redirects", request=request)
+
+    async def get_pinned(self, target: ValidatedURL, **kwargs) -> httpx.Response:
+        async with self.stream_pinned("GET", target, **kwargs) as response:
+            await response.aread()
+            return response
+
+
+# Shared instance used by all web tools
+http_client = AsyncHttpClient()
@@ -1,16 +1,37 @@
+import asyncio
 import inspect
 from typing import Any, Callable, Dict, Optional, List
 from pydantic import BaseModel, create_model, ValidationError
 
+from config import Config
+from tools.cache import is_cacheable, make_cache_key, tool_cache
+
+# Argument types checked without pydantic when every parameter has one of them
+PRIMITIVE_TYPES = (str, int, float, bool)
+_REQUIRED = object()
+
+
 # ===========================
 # Tool Wrapper
 # ===========================
 class Tool:
-    def __init__(self, name: str, func: Callable, description: str):
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        description: str,
+        cache_ttl: Optional[float] = None,
+        cache_normalize: tuple = (),
+    ):
         self.name = name
         self.func = func
         self.description = description
+        self.cache_ttl = cache_ttl
+        self.cache_normalize = tuple(cache_normalize)
+        self.is_async = inspect.iscoroutinefunction(func)
         self.model = self._create_pydantic_model(func)
+        self._fast_params = self._compile_fast_path(func)
+        self._openai_schema: Optional[dict] = None
 
     def _create_pydantic_model(self, func: Callable) -> type(BaseModel):
         sig = inspect.signature(func)
@@ -36,7 +57,51 @@ class Tool:
 
         return create_model(f"{self.name}Schema", **fields)
 
+    def _compile_fast_path(self, func: Callable) -> Optional[tuple]:
+        """(name, type, default) per parameter when all of them are primitives, else None."""
+        params = []
+        for param_name, param in inspect.signature(func).parameters.items():
+            if param_name == "self":
+                continue
+            if param.kind in (inspect.Parameter.VAR_POSITIONAL, inspect.Parameter.VAR_KEYWORD):
+                return None
+            annotation = param.annotation if param.annotation != inspect.Parameter.empty else str
+            if annotation not in PRIMITIVE_TYPES:
+                return None
+            default = param.default if param.default != inspect.Parameter.empty else _REQUIRED
+            params.append((param_name, annotation, default))
+        return tuple(params)
+
+    def validate_arguments(self, kwargs: dict) -> dict:
+        """
+        The arguments the function is called with; raises ValidationError.
+        Primitive-only tools whose arguments already have the exact types skip
+        pydantic; anything else (coercion, errors) goes through the model.
+        """
+        fast_params = self._fast_params
+        if fast_params is not None:
+            arguments = {}
+            for name, annotation, default in fast_params:
+                if name in kwargs:
+                    value = kwargs[name]
+                    if type(value) is not annotation:
+                        break
+                    arguments[name] = value
+                elif default is _REQUIRED:
+                    break
+                else:
+                    arguments[name] = default
+            else:
+                return arguments
+        return self.model(**kwargs).model_dump()
+
     def to_openai_schema(self) -> dict:
+        """Built once per tool and shared; callers must not modify it."""
+        if self._openai_schema is None:
+            self._openai_schema = self._build_openai_schema()
+        return self._openai_schema
+
+    def _build_openai_schema(self) -> dict:
         schema = self.model.model_json_schema()
 
         return {
@@ -53,18 +118,68 @@ class Tool:
             },
         }
 
+    def _format_result(self, result: Any) -> Any:
+        # 🔥 أهم تعديل: نحول أي نتيجة لنص
+        if result is None:
+            return "No result returned."
+
+        if isinstance(result, (dict, list)):
+            return str(result)  # مهم عشان LLM ما يطيح
+
+        return result
+
+    # ---------------------------
+    # Result cache (opt-in via cache_ttl)
+    # ---------------------------
+    def _cache_get(self, arguments: dict):
+        if not self.cache_ttl or not Config.TOOL_CACHE_ENABLED:
+            return None, None
+        key = make_cache_key(self.name, arguments, self.cache_normalize)
+        return key, tool_cache.get(key)
+
+    def _cache_set(self, key: Optional[str], result: Any):
+        if key is not None and is_cacheable(result):
+            tool_cache.set(key, result, self.cache_ttl)
+
     def execute(self, **kwargs) -> Any:
+        if self.is_async:
+            # Sync callers (scripts, tests) of a coroutine tool
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(self.aexecute(**kwargs))
+            return f"Execution error in tool '{self.name}': async tool must be awaited via aexecute()"
+
         try:
-            validated_args = self.model(**kwargs)
-            result = self.func(**validated_args.model_dump())
+            arguments = self.validate_arguments(kwargs)
+            cache_key, cached = self._cache_get(arguments)
+            if cached is not None:
+                return cached
 
-            # 🔥 أهم تعديل: نحول أي نتيجة لنص
-            if result is None:
-                return "No result returned."
+            result = self._format_result(self.func(**arguments))
+            self._cache_set(cache_key, result)
+            return result
 
-            if isinstance(result, (dict, list)):
-                return str(result)  # مهم عشان LLM ما يطيح
+        except ValidationError as e:
+            return f"Validation error in tool '{self.name}': {str(e)}"
+        except Exception as e:
+            return f"Execution error in tool '{self.name}': {str(e)}"
+
+    async def aexecute(self, **kwargs) -> Any:
+        """Awaitable variant of execute; native coroutine tools are awaited."""
+        if not self.is_async:
+            return self.execute(**kwargs)
+
+        try:
+            arguments = self.validate_arguments(kwargs)
+            # SQLite + zlib work runs in a thread so it never stalls the event loop
+            cache_key, cached = await asyncio.to_thread(self._cache_get, arguments) if self.cache_ttl else (None, None)
+            if cached is not None:
+                return cached
 
+            result = self._format_result(await self.func(**arguments))
+            if cache_key is not None:
+                await asyncio.to_thread(self._cache_set, cache_key, result)
             return result
 
         except ValidationError as e:
@@ -81,9 +196,25 @@ class ToolRegistry:
         self._tools: Dict[str, Tool] = {}
         self._categories: Dict[str, List[str]] = {}
 
-    def register(self, name: str, description: str, category: str = "general"):
+    def register(
+        self,
+        name: str,
+        description: str,
+        category: str = "general",
+        cache_ttl: Optional[float] = None,
+        cache_normalize: tuple = (),
+    ):
+        """
+        Register a sync function or an `async def` coroutine as a tool.
+        cache_ttl (seconds) opts the tool into the persistent result cache.
+        cache_normalize names the arguments whose case/whitespace (or URL form)
+        does not change the result; all others must match exactly to share a cache entry.
+        """
         def decorator(func: Callable):
-            tool = Tool(name=name, func=func, description=description)
+            tool = Tool(
+                name=name, func=func, description=description,
+                cache_ttl=cache_ttl, cache_normalize=cache_normalize,
+            )
 
             self._tools[name] = tool
             self._categories.setdefault(category, []).append(name)
@@ -112,6 +243,14 @@ class ToolRegistry:
 
         return tool.execute(**kwargs)
 
+    async def aexecute_tool(self, name: str, **kwargs) -> Any:
+        tool = self.get_tool(name)
+
+        if not tool:
+            return f"Tool '{name}' not found."
+
+        return await tool.aexecute(**kwargs)
+
 
 # ===========================
 # Global Registry Instance
@@ -1,9 +1,9 @@
-import logging
-import socket
-from urllib.parse import urlparse
-import requests
-from bs4 import BeautifulSoup
+from config import Config
 from tools.registry import registry
+from tools.excerpt import page_cache
+from tools.html_extract import extract_text_from_response
+from tools.http_client import http_client
+from tools.url_safety import check_url, validate_urls
 
 # ===========================
 # Web Search (Modified to print links)
@@ -11,26 +11,32 @@ from tools.registry import registry
 @registry.register(
     name="search_web",
     description="Search the web for a query. Prints results with title and link.",
-    category="research"
+    category="research",
+    cache_ttl=3600,
+    cache_normalize=("query",),
 )
-def search_web(query: str, max_results: int = 5) -> list[dict]:
+async def search_web(query: str, max_results: int = 5) -> list[dict]:
     url = "https://html.duckduckgo.com/html/"
-    headers = {"User-Agent": "Mozilla/5.0"}
     try:
-        response = requests.post(url, data={"q": query}, headers=headers, timeout=10)
+        response = await http_client.post(url, data={"q": query})
         response.raise_for_status()
     except Exception as e:
         print(f"Search failed: {e}")
         return []
 
+    from bs4 import BeautifulSoup  # only needed once a search actually runs
+
     soup = BeautifulSoup(response.text, "html.parser")
+    found = soup.find_all("div", class_="result", limit=max_results)
+    title_tags = [result.find("a", class_="result__a") for result in found]
+    checks = await validate_urls([tag.get("href", "") if tag else "" for tag in title_tags])
+
     results = []
-    for idx, result in enumerate(soup.find_all("div", class_="result", limit=max_results), start=1):
-        title_tag = result.find("a", class_="result__a")
+    for idx, (result, title_tag, safe) in enumerate(zip(found, title_tags, checks), start=1):
         snippet_tag = result.find("a", class_="result__snippet")
         if title_tag:
             link = title_tag.get("href", "")
-            if validate_url(link):
+            if safe:
                 title = title_tag.get_text(strip=True)
                 snippet = snippet_tag.get_text(strip=True) if snippet_tag else ""
                 result_entry = {
@@ -50,22 +56,25 @@ def search_web(query: str, max_results: int = 5) -> list[dict]:
 # ===========================
 @registry.register(
     name="read_webpage",
-    description="Read the content of a webpage. Returns the text content.",
-    category="research"
+    description=(
+        "Read the content of a webpage. Returns the text content; pass `focus` to get only "
+        "the passages most relevant to it."
+    ),
+    category="research",
+    cache_ttl=86400,
+    cache_normalize=("url",),
 )
-def read_webpage(url: str) -> str:
-    if not validate_url(url):
-        return "Error: Invalid or restricted URL."
-    try:
-        headers = {"User-Agent": "Mozilla/5.0"}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        for script in soup(["script", "style"]):
-            script.decompose()
-        text = soup.get_text(separator="\n")
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        return '\n'.join(chunk for chunk in chunks if chunk)[:10000]
-    except Exception as e:
-        return f"Error reading {url}: {e}"
+async def read_webpage(url: str, focus: str = "") -> str:
+    page = page_cache.get(url)
+    if page is None:
+        target = await check_url(url)
+        if target is None:
+            return "Error: Invalid or restricted URL."
+        try:
+            async with http_client.stream_pinned("GET", target) as response:
+                response.raise_for_status()
+                text = await extract_text_from_response(response, max_chars=Config.PAGE_MAX_CHARS)
+        except Exception as e:
+            return f"Error reading {url}: {e}"
+        page = page_cache.put(url, text)
+    return page.excerpt(focus, max_chars=Config.EXCERPT_MAX_CHARS if focus.strip() else 10000)
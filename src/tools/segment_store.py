@@ -0,0 +1,260 @@
+import hashlib
+import json
+import mmap
+import os
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger()
+
+MANIFEST = "manifest.json"
+DOCS_DATA = "docs.bin"
+DOCS_INDEX = "docs.idx"
+DOCS_HASH = "docs.hash"
+HASH_SIZE = 16
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=HASH_SIZE).digest()
+
+
+def _fsync_dir(path: str):
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(os.path.dirname(path) or ".")
+
+
+class DocSequence(Sequence):
+    """Read-only view of the stored texts, decoded on access from a memory map."""
+
+    def __init__(self, data_path: str, offsets: np.ndarray):
+        self._offsets = offsets
+        self._data = None
+        if len(offsets):
+            with open(data_path, "rb") as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, length = self._offsets[i]
+        return self._data[start:start + length].decode("utf-8")
+
+
+class SegmentStore:
+    """
+    Append-only on-disk storage for embeddings and their texts.
+    - vectors: immutable float32 .npy segments, opened with mmap
+    - texts: docs.bin (utf-8) + docs.idx (int64 offset/length pairs)
+    - docs.hash: 16-byte content hash per text, for dedup
+    - manifest.json, replaced atomically, is the only commit point:
+      bytes written past what it records are ignored (and overwritten) on the next append
+    - compact() merges segments, optionally in a background thread
+    """
+
+    def __init__(self, directory: str, max_segments: int = 16):
+        self.directory = directory
+        self.max_segments = max_segments
+        self._lock = threading.RLock()
+        self._compacting = False
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = self._read_manifest()
+        self._segments: List[np.ndarray] = []
+        self._docs: Optional[DocSequence] = None
+        self._open()
+
+    # ---------------------------
+    # Manifest / opening
+    # ---------------------------
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(self._path(MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 1, "dim": None, "count": 0, "docs_bytes": 0, "next_segment": 1, "segments": []}
+
+    def _write_manifest(self, manifest: dict):
+        _atomic_write(self._path(MANIFEST), json.dumps(manifest, indent=2).encode("utf-8"))
+        self.manifest = manifest
+
+    def _open(self):
+        self._segments = [
+            np.load(self._path(seg["name"]), mmap_mode="r") for seg in self.manifest["segments"]
+        ]
+        count = self.manifest["count"]
+        if count:
+            offsets = np.memmap(self._path(DOCS_INDEX), dtype=np.int64, mode="r", shape=(count, 2))
+        else:
+            offsets = np.zeros((0, 2), dtype=np.int64)
+        self._docs = DocSequence(self._path(DOCS_DATA), offsets)
+
+    # ---------------------------
+    # Read API
+    # ---------------------------
+    @property
+    def dim(self) -> Optional[int]:
+        return self.manifest["dim"]
+
+    @property
+    def count(self) -> int:
+        return self.manifest["count"]
+
+    @property
+    def docs(self) -> DocSequence:
+        return self._docs
+
+    def segments(self) -> List[np.ndarray]:
+        """Memory-mapped float32 segments in insertion order."""
+        return list(self._segments)
+
+    def hashes(self) -> List[bytes]:
+        """Content hashes of every stored text (backfilled for stores written before docs.hash)."""
+        with self._lock:
+            count = self.count
+            path = self._path(DOCS_HASH)
+            have = os.path.getsize(path) // HASH_SIZE if os.path.exists(path) else 0
+            if have < count:
+                with open(path, "ab") as f:
+                    f.truncate(have * HASH_SIZE)
+                    f.write(b"".join(content_hash(self.docs[i]) for i in range(have, count)))
+            if not count:
+                return []
+            with open(path, "rb") as f:
+                data = f.read(count * HASH_SIZE)
+        return [data[i:i + HASH_SIZE] for i in range(0, len(data), HASH_SIZE)]
+
+    # ---------------------------
+    # Append (O(N) in the new documents)
+    # ---------------------------
+    def append(self, embeddings: np.ndarray, documents: List[str], hashes: Optional[List[bytes]] = None):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(embeddings) != len(documents):
+            raise ValueError("embeddings and documents must have the same length")
+        if not documents:
+            return
+
+        with self._lock:
+            manifest = json.loads(json.dumps(self.manifest))
+            if manifest["dim"] is None:
+                manifest["dim"] = int(embeddings.shape[1])
+            elif embeddings.shape[1] != manifest["dim"]:
+                raise ValueError(f"expected dim {manifest['dim']}, got {embeddings.shape[1]}")
+
+            # 1. new immutable vector segment
+            name = f"seg-{manifest['next_segment']:06d}.npy"
+            tmp = self._path(name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, embeddings)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._path(name))
+
+            # 2. texts and offsets, appended after the last committed byte
+            encoded = [doc.encode("utf-8") for doc in documents]
+            offsets = np.empty((len(encoded), 2), dtype=np.int64)
+            position = manifest["docs_bytes"]
+            for i, data in enumerate(encoded):
+                offsets[i] = (position, len(data))
+                position += len(data)
+
+            with open(self._path(DOCS_DATA), "ab") as f:
+                f.truncate(manifest["docs_bytes"])
+                f.write(b"".join(encoded))
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._path(DOCS_INDEX), "ab") as f:
+                f.truncate(manifest["count"] * 16)
+                f.write(offsets.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            hash_path = self._path(DOCS_HASH)
+            if manifest["count"] == 0 or os.path.exists(hash_path):
+                hashes = hashes or [content_hash(doc) for doc in documents]
+                with open(hash_path, "ab") as f:
+                    f.truncate(manifest["count"] * HASH_SIZE)
+                    f.write(b"".join(hashes))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            # 3. commit
+            manifest["segments"].append({"name": name, "count": len(documents)})
+            manifest["count"] += len(documents)
+            manifest["docs_bytes"] = position
+            manifest["next_segment"] += 1
+            self._write_manifest(manifest)
+            self._open()
+
+    # ---------------------------
+    # Compaction
+    # ---------------------------
+    def needs_compaction(self) -> bool:
+        return len(self.manifest["segments"]) > self.max_segments
+
+    def compact(self):
+        """Merge all current segments into one; appends may continue meanwhile."""
+        with self._lock:
+            if self._compacting or len(self.manifest["segments"]) < 2:
+                return
+            self._compacting = True
+            merged_specs = list(self.manifest["segments"])
+            sources = list(self._segments)
+            name = f"seg-{self.manifest['next_segment']:06d}.npy"
+            # Reserve the segment number so a concurrent append cannot take it
+            manifest = json.loads(json.dumps(self.manifest))
+            manifest["next_segment"] += 1
+            self._write_manifest(manifest)
+
+        try:
+            merged = np.concatenate([np.asarray(seg) for seg in sources]) if sources else None
+            tmp = self._path(name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, merged)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._path(name))
+
+            with self._lock:
+                manifest = json.loads(json.dumps(self.manifest))
+                remaining = manifest["segments"][len(merged_specs):]
+                manifest["segments"] = [{"name": name, "count": int(len(merged))}] + remaining
+                self._write_manifest(manifest)
+                self._open()
+
+            for spec in merged_specs:
+                try:
+                    os.remove(self._path(spec["name"]))
+                except OSError:
+                    pass
+            logger.info("vector_store_compacted", segments=len(merged_specs), vectors=int(len(merged)))
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact_in_background(self) -> Optional[threading.Thread]:
+        if self._compacting:
+            return None
+        thread = threading.Thread(target=self.compact, name="segment-compaction", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,230 @@
+import asyncio
+import ipaddress
+import socket
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import structlog
+
+from config import Config
+from observability.spans import KIND_CLIENT, set_attribute, traced
+
+logger = structlog.get_logger()
+
+
+# ===========================
+# Address policy
+# ===========================
+def is_public_ip(ip: str) -> bool:
+    """True only for globally routable unicast addresses (v4 and v6; IPv4-mapped v6 is unwrapped)."""
+    try:
+        address = ipaddress.ip_address(ip.split("%", 1)[0])
+    except ValueError:
+        return False
+    if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    # is_global also excludes shared/CGNAT (100.64.0.0/10), benchmarking and other special-purpose ranges
+    return address.is_global and not address.is_multicast
+
+
+class UnsafeURLError(Exception):
+    """Raised when a URL (or a redirect target) fails the SSRF checks."""
+
+
+@dataclass(frozen=True)
+class ValidatedURL:
+    """A URL that passed the SSRF checks, pinned to the IP it resolved to."""
+    url: str
+    scheme: str
+    hostname: str
+    port: int
+    ip: str
+
+
+# ===========================
+# DNS cache
+# ===========================
+class DNSCache:
+    """Positive/negative DNS cache; positive entries honour the record TTL when known."""
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        default_ttl: float = Config.DNS_CACHE_TTL,
+        negative_ttl: float = Config.DNS_NEGATIVE_TTL,
+        max_ttl: float = 3600,
+    ):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+
+    def get(self, hostname: str):
+        """Returns (found, addresses); addresses is None for a cached failure."""
+        entry = self._entries.get(hostname)
+        if entry is None:
+            return False, None
+        expires_at, addresses = entry
+        if expires_at <= time.monotonic():
+            del self._entries[hostname]
+            return False, None
+        self._entries.move_to_end(hostname)
+        return True, addresses
+
+    def set(self, hostname: str, addresses: Optional[List[str]], ttl: Optional[float] = None):
+        if addresses is None:
+            ttl = self.negative_ttl
+        elif ttl is None:
+            ttl = self.default_ttl
+        self._entries[hostname] = (time.monotonic() + min(ttl, self.max_ttl), addresses)
+        self._entries.move_to_end(hostname)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# ===========================
+# Resolver
+# ===========================
+class AsyncResolver:
+    """
+    Non-blocking hostname resolution with caching.
+    Uses aiodns (record TTLs) when installed, otherwise loop.getaddrinfo.
+    Concurrent lookups of the same host share one query.
+    """
+
+    def __init__(self, cache: DNSCache = None):
+        self.cache = cache or DNSCache()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._aiodns_resolver = None
+        self._aiodns_checked = False
+
+    def _aiodns(self):
+        if not self._aiodns_checked:
+            self._aiodns_checked = True
+            try:
+                import aiodns
+                self._aiodns_resolver = aiodns.DNSResolver()
+            except Exception:
+                self._aiodns_resolver = None
+        return self._aiodns_resolver
+
+    async def _query(self, hostname: str):
+        """Returns (addresses, ttl or None)."""
+        resolver = self._aiodns()
+        if resolver is not None:
+            addresses, ttls = [], []
+            for record_type in ("A", "AAAA"):
+                try:
+                    for record in await resolver.query(hostname, record_type):
+                        addresses.append(record.host)
+                        ttls.append(record.ttl)
+                except Exception:
+                    continue
+            if addresses:
+                return addresses, min(ttls)
+
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(hostname, None, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        return addresses, None
+
+    @traced("dns.resolve", KIND_CLIENT)
+    async def resolve(self, hostname: str) -> Optional[List[str]]:
+        set_attribute("dns.hostname", hostname)
+        found, addresses = self.cache.get(hostname)
+        set_attribute("dns.cache_hit", found)
+        if found:
+            return addresses
+
+        # The lookup runs as its own task; waiters are shielded, so cancelling one
+        # (even the first) never cancels the query the others are waiting on
+        lookup = self._inflight.get(hostname)
+        if lookup is None:
+            lookup = self._inflight[hostname] = asyncio.ensure_future(self._lookup(hostname))
+            lookup.add_done_callback(lambda _: self._inflight.pop(hostname, None))
+        return await asyncio.shield(lookup)
+
+    async def _lookup(self, hostname: str) -> Optional[List[str]]:
+        try:
+            addresses, ttl = await self._query(hostname)
+        except (OSError, UnicodeError) as e:
+            logger.info("dns_lookup_failed", hostname=hostname, error=str(e))
+            addresses, ttl = None, None
+        addresses = addresses or None
+        self.cache.set(hostname, addresses, ttl)
+        return addresses
+
+
+resolver = AsyncResolver()
+
+
+# ===========================
+# URL validation
+# ===========================
+def _parse(url: str):
+    try:
+        parsed = urlparse(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            return None
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    except ValueError:
+        return None
+    return parsed, port
+
+
+@traced("url.validate")
+async def check_url(url: str) -> Optional[ValidatedURL]:
+    """Resolve and validate one URL; returns it pinned to a public IP, or None."""
+    parsed_port = _parse(url)
+    if parsed_port is None:
+        return None
+    parsed, port = parsed_port
+    hostname = parsed.hostname.lower()
+
+    try:
+        addresses = [str(ipaddress.ip_address(hostname))]
+    except ValueError:
+        addresses = await resolver.resolve(hostname)
+    if not addresses:
+        return None
+
+    # Any private answer rejects the host (guards against mixed/rebinding records)
+    if not all(is_public_ip(ip) for ip in addresses):
+        return None
+
+    return ValidatedURL(url=url, scheme=parsed.scheme, hostname=hostname, port=port, ip=addresses[0])
+
+
+async def validate_urls(urls: List[str]) -> List[Optional[ValidatedURL]]:
+    """Validate a whole batch of URLs concurrently (e.g. every search result link)."""
+    return list(await asyncio.gather(*(check_url(url) for url in urls)))
+
+
+@traced("url.validate")
+def validate_url(url: str) -> bool:
+    """Blocking variant for sync callers; shares the address policy and DNS cache."""
+    parsed_port = _parse(url)
+    if parsed_port is None:
+        return False
+    hostname = parsed_port[0].hostname.lower()
+
+    try:
+        addresses = [str(ipaddress.ip_address(hostname))]
+    except ValueError:
+        found, addresses = resolver.cache.get(hostname)
+        if not found:
+            try:
+                infos = socket.getaddrinfo(hostname, None, type=socket.SOCK_STREAM)
+                addresses = list(dict.fromkeys(info[4][0] for info in infos)) or None
+            except (OSError, UnicodeError):
+                addresses = None
+            resolver.cache.set(hostname, addresses)
+
+    return bool(addresses) and all(is_public_ip(ip) for ip in addresses)
@@ -0,0 +1,130 @@
+import math
+import os
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+import structlog
+
+from config import Config
+
+logger = structlog.get_logger()
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+
+
+def _kind(index) -> str:
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+class VectorIndex:
+    """
+    FAISS index engine for TechVectorStore.
+    - flat: exact L2 scan
+    - hnsw: graph index, incremental adds, tuned with `ef_search`
+    - ivf: inverted lists; vectors are held in a flat staging index until
+      `train_min` exist, then the quantizer is trained once and the index
+      switches over. Tuned with `nprobe`.
+    Row ids always match insertion order (= SegmentStore row order).
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        index_type: str = Config.VECTOR_INDEX_TYPE,
+        hnsw_m: int = Config.VECTOR_INDEX_HNSW_M,
+        ef_search: int = Config.VECTOR_INDEX_EF_SEARCH,
+        nprobe: int = Config.VECTOR_INDEX_NPROBE,
+        nlist: Optional[int] = None,
+        train_min: int = Config.VECTOR_INDEX_IVF_TRAIN_MIN,
+    ):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+        self.dim = dim
+        self.index_type = index_type
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.train_min = train_min
+
+        if index_type == "hnsw":
+            self.index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        else:
+            # ivf starts as its own staging area
+            self.index = faiss.IndexFlatL2(dim)
+
+    # ---------------------------
+    # State
+    # ---------------------------
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def trained(self) -> bool:
+        return self.index_type != "ivf" or _kind(self.index) == "ivf"
+
+    # ---------------------------
+    # Build
+    # ---------------------------
+    def _train_ivf(self):
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        # ~4*sqrt(n) lists, with enough points per centroid for k-means
+        nlist = self.nlist or max(1, min(int(4 * math.sqrt(len(vectors))), len(vectors) // 39))
+        index = faiss.index_factory(self.dim, f"IVF{nlist},Flat")
+        index.train(vectors)
+        index.add(vectors)
+        self.index = index
+        logger.info("vector_index_trained", nlist=nlist, vectors=len(vectors))
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        self.index.add(vectors)
+        if not self.trained and self.index.ntotal >= self.train_min:
+            self._train_ivf()
+
+    # ---------------------------
+    # Search
+    # ---------------------------
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        kind = _kind(self.index)
+        if kind == "hnsw":
+            faiss.downcast_index(self.index).hnsw.efSearch = max(self.ef_search, k)
+        elif kind == "ivf":
+            faiss.downcast_index(self.index).nprobe = self.nprobe
+        return self.index.search(queries, k)
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def save(self, path: str):
+        tmp = f"{path}.tmp"
+        faiss.write_index(self.index, tmp)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, dim: int, index_type: str = Config.VECTOR_INDEX_TYPE, **kwargs) -> Optional["VectorIndex"]:
+        """Load a saved index; None when missing, unreadable or of another type."""
+        if not os.path.exists(path):
+            return None
+        try:
+            index = faiss.read_index(path)
+        except RuntimeError as e:
+            logger.warning("vector_index_unreadable", path=path, error=str(e))
+            return None
+        kind = _kind(index)
+        staging = index_type == "ivf" and kind == "flat"
+        if index.d != dim or (kind != index_type and not staging):
+            return None
+        engine = cls(dim, index_type, **kwargs)
+        engine.index = index
+        return engine
@@ -1,60 +1,147 @@
 # src/tools/vector_store.py
 from typing import List, Dict
+import atexit
 import os
-import faiss
 import pickle
-from sentence_transformers import SentenceTransformer
+import threading
+
+from config import Config
+from tools.embeddings import EmbeddingPipeline, normalize
+from tools.segment_store import SegmentStore, content_hash
+from tools.vector_index import VectorIndex
+
+INDEX_FILE = "index.faiss"
 
 class TechVectorStore:
     """
     Vector store مخصص للتكنولوجيا
     - يخزن مستندات
     - يمكن البحث عن أفضل النتائج بناءً على التشابه
+    - التخزين: segments على القرص (append-only + mmap)
+    - الفهرس: flat / hnsw / ivf، محفوظ بجانب الـ segments
+    - المتجهات normalized: المسافة L2 تعادل cosine، و score = cosine similarity
+    - المستندات المكررة (نفس الـ content hash) لا تُضاف مرتين
     """
-    def __init__(self, store_file="tech_vectors.pkl", embedding_model="all-MiniLM-L6-v2"):
-        self.store_file = store_file
+    def __init__(self, store_dir="tech_vectors", embedding_model="all-MiniLM-L6-v2", legacy_store_file="tech_vectors.pkl",
+                 index_type=Config.VECTOR_INDEX_TYPE, save_every=Config.VECTOR_INDEX_SAVE_EVERY,
+                 batch_size=Config.EMBEDDING_BATCH_SIZE, **index_kwargs):
+        self.store_dir = store_dir
+        self.legacy_store_file = legacy_store_file
+        self.index_type = index_type
+        self.index_kwargs = index_kwargs
+        self.save_every = save_every
+        self.index_path = os.path.join(store_dir, INDEX_FILE)
+        from sentence_transformers import SentenceTransformer  # heavy (torch); only when a store is built
         self.embedding_model = SentenceTransformer(embedding_model)
-        self.docs: List[str] = []
-        self.embeddings = None
+        self.embedder = EmbeddingPipeline(self.embedding_model.encode, batch_size=batch_size)
+        self.store = SegmentStore(store_dir)
         self.index = None
+        self._saved_ntotal = 0
+        self._hashes = None  # loaded on the first add
+        self._lock = threading.RLock()
         self.load_store()
+        atexit.register(self.save_index)
+
+    @property
+    def docs(self):
+        return self.store.docs
+
+    def _migrate_legacy(self):
+        # One-time import of the old single-pickle format
+        if self.store.count or not os.path.exists(self.legacy_store_file):
+            return
+        with open(self.legacy_store_file, "rb") as f:
+            data = pickle.load(f)
+        if data.get("docs"):
+            self.store.append(normalize(data["embeddings"]), data["docs"])
+
+    def _new_index(self, dim: int) -> VectorIndex:
+        return VectorIndex(dim, self.index_type, **self.index_kwargs)
 
     def load_store(self):
-        if os.path.exists(self.store_file):
-            with open(self.store_file, "rb") as f:
-                data = pickle.load(f)
-                self.docs = data["docs"]
-                self.embeddings = data["embeddings"]
-                dim = self.embeddings.shape[1]
-                self.index = faiss.IndexFlatL2(dim)
-                self.index.add(self.embeddings)
-        else:
-            self.embeddings = None
-            self.index = None
-
-    def save_store(self):
-        with open(self.store_file, "wb") as f:
-            pickle.dump({"docs": self.docs, "embeddings": self.embeddings}, f)
-
-    def add_documents(self, documents: List[str]):
-        new_embeddings = self.embedding_model.encode(documents)
-        if self.embeddings is None:
-            self.embeddings = new_embeddings
-            dim = new_embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(dim)
-        else:
-            self.embeddings = np.vstack([self.embeddings, new_embeddings])
-        self.index.add(new_embeddings)
-        self.docs.extend(documents)
-        self.save_store()
+        self._migrate_legacy()
+        self.index = None
+        if not self.store.count:
+            return
+
+        index = VectorIndex.load(self.index_path, self.store.dim, self.index_type, **self.index_kwargs)
+        if index is None or index.ntotal > self.store.count:
+            index = self._new_index(self.store.dim)
+        self._saved_ntotal = index.ntotal
+
+        # Add only the rows appended since the index was last saved
+        offset = 0
+        for segment in self.store.segments():
+            start = max(index.ntotal - offset, 0)
+            if start < len(segment):
+                # No-op for normalized rows; fixes up stores written before normalization
+                index.add(normalize(segment[start:]))
+            offset += len(segment)
+        self.index = index
+        if self.index.ntotal != self._saved_ntotal:
+            self.save_index()
+
+    def save_index(self):
+        if self.index is not None and self.index.ntotal != self._saved_ntotal:
+            self.index.save(self.index_path)
+            self._saved_ntotal = self.index.ntotal
+
+    def add_documents(self, documents: List[str]) -> int:
+        """Embed and store the documents not stored yet; returns how many were added."""
+        with self._lock:
+            if self._hashes is None:
+                self._hashes = set(self.store.hashes())
+            new_docs, new_hashes = [], []
+            for doc in documents:
+                key = content_hash(doc)
+                if key not in self._hashes:
+                    self._hashes.add(key)
+                    new_docs.append(doc)
+                    new_hashes.append(key)
+            if not new_docs:
+                return 0
+
+            new_embeddings = self.embedder.encode(new_docs, new_hashes)
+            self.store.append(new_embeddings, new_docs, new_hashes)
+            if self.index is None:
+                self.index = self._new_index(new_embeddings.shape[1])
+            self.index.add(new_embeddings)
+            if self.index.ntotal - self._saved_ntotal >= self.save_every:
+                self.save_index()
+        if self.store.needs_compaction():
+            self.store.compact_in_background()
+        return len(new_docs)
+
+    def query_many(self, queries: List[str], top_k=5) -> List[List[Dict]]:
+        """Embed all queries in one batch and search them in one FAISS call."""
+        if self.index is None or len(self.docs) == 0 or not queries:
+            return [[] for _ in queries]
+        query_embs = self.embedder.encode(queries)
+        with self._lock:
+            D, I = self.index.search(query_embs, top_k)
+        # Squared L2 between unit vectors = 2 - 2 * cosine
+        return [
+            [{"doc": self.docs[i], "score": float(1 - d / 2)} for d, i in zip(row_d, row_i) if i >= 0]
+            for row_d, row_i in zip(D, I)
+        ]
 
     def query(self, query: str, top_k=5) -> List[Dict]:
-        if self.index is None or len(self.docs) == 0:
-            return []
-        query_emb = self.embedding_model.encode([query])
-        D, I = self.index.search(query_emb, top_k)
-        results = [{"doc": self.docs[i], "score": float(D[0][idx])} for idx, i in enumerate(I[0])]
-        return results
-
-# Singleton instance
-tech_vector_store = TechVectorStore()
+        return self.query_many([query], top_k)[0]
+
+# Singleton instance, built on first access (loading the model is slow)
+_tech_vector_store = None
+_singleton_lock = threading.Lock()
+
+def get_tech_vector_store() -> TechVectorStore:
+    global _tech_vector_store
+    if _tech_vector_store is None:
+        with _singleton_lock:
+            if _tech_vector_store is None:
+                _tech_vector_store = TechVectorStore()
+    return _tech_vector_store
+
+def __getattr__(name):
+    # `from tools.vector_store import tech_vector_store` keeps working
+    if name == "tech_vector_store":
+        return get_tech_vector_store()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
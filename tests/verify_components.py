@@ -1,15 +1,30 @@
 import sys
 import os
 import json
+import time
+import asyncio
 import logging
+import tempfile
 from dataclasses import dataclass
+from types import SimpleNamespace
 
 # Add project root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from tools.registry import registry, Tool
 from observability.loop_detector import AdvancedLoopDetector
-from observability.tracer import tracer, AgentStep, ToolCallRecord
+from observability.tracer import tracer, AgentTracer, AgentStep, ToolCallRecord
+from observability.trace_store import TraceStore
+from agent.tool_executor import ToolExecutor
+from tools.cache import PersistentCache, make_cache_key
+from agent.completion_cache import CompletionCache
+from agent.streaming import ToolCallAssembler
+from agent.context_manager import ContextManager
+from tools import url_safety
+from tools.html_extract import extract_text, extract_text_from_response
+from tools.segment_store import SegmentStore
+from tools.vector_index import VectorIndex
+from tools.embeddings import EmbeddingPipeline
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -84,7 +99,1550 @@ def test_tracer():
     
     logger.info("Tracer Test Passed!")
 
+def _fake_tool_call(call_id, name, arguments):
+    return SimpleNamespace(
+        id=call_id,
+        function=SimpleNamespace(name=name, arguments=json.dumps(arguments)),
+    )
+
+def test_tool_executor():
+    logger.info("Testing Tool Executor...")
+
+    def slow_sync(delay: float):
+        time.sleep(delay)
+        return f"sync {delay}"
+
+    async def slow_async(delay: float):
+        await asyncio.sleep(delay)
+        return f"async {delay}"
+
+    tools = {
+        "slow_sync": Tool("slow_sync", slow_sync, "blocking tool"),
+        "slow_async": Tool("slow_async", slow_async, "coroutine tool"),
+    }
+    calls = [
+        _fake_tool_call("c1", "slow_sync", {"delay": 0.2}),
+        _fake_tool_call("c2", "slow_async", {"delay": 0.2}),
+        _fake_tool_call("c3", "slow_sync", {"delay": 0.2}),
+        _fake_tool_call("c4", "missing", {}),
+    ]
+
+    start = time.perf_counter()
+    results = asyncio.run(ToolExecutor().execute(calls, tools))
+    elapsed = time.perf_counter() - start
+
+    assert [r.tool_call_id for r in results] == ["c1", "c2", "c3", "c4"]
+    assert results[0].output == "sync 0.2"
+    assert results[1].output == "async 0.2"
+    assert "not found" in results[3].output
+    assert elapsed < 0.5, f"tool calls ran serially ({elapsed:.2f}s)"
+
+    # Calls queued on a busy tool do not take step slots from other tools
+    calls = [
+        _fake_tool_call("a1", "slow_async", {"delay": 0.2}),
+        _fake_tool_call("a2", "slow_async", {"delay": 0.2}),
+        _fake_tool_call("b1", "slow_other", {"delay": 0.2}),
+    ]
+    tools["slow_other"] = Tool("slow_other", slow_async, "another coroutine tool")
+    results = asyncio.run(ToolExecutor(max_concurrency=2, per_tool_concurrency=1).execute(calls, tools))
+    assert results[2].duration_ms < 300, f"b1 waited behind a2 ({results[2].duration_ms:.0f} ms)"
+
+    logger.info("Tool Executor Test Passed!")
+
+def test_async_tool_registration():
+    logger.info("Testing async tool registration...")
+
+    @registry.register("async_echo", "An async test tool")
+    async def async_echo(text: str):
+        await asyncio.sleep(0)
+        return f"echo {text}"
+
+    tool = registry.get_tool("async_echo")
+    assert tool.is_async
+    assert asyncio.run(registry.aexecute_tool("async_echo", text="hi")) == "echo hi"
+    # Sync callers still get a result when no loop is running
+    assert tool.execute(text="sync") == "echo sync"
+
+    # Cache I/O of coroutine tools runs off the event loop thread
+    import threading
+    from tools import registry as registry_module
+    cache_threads = []
+    original_cache = registry_module.tool_cache
+
+    class RecordingCache:
+        def get(self, key):
+            cache_threads.append(threading.get_ident())
+            return None
+
+        def set(self, key, value, ttl):
+            cache_threads.append(threading.get_ident())
+
+    @registry.register("async_cached_echo", "Echo with a cache", cache_ttl=60)
+    async def async_cached_echo(text: str) -> str:
+        return f"echo {text}"
+
+    registry_module.tool_cache = RecordingCache()
+    try:
+        async def cached_call():
+            return await registry.aexecute_tool("async_cached_echo", text="hi"), threading.get_ident()
+        result, loop_thread = asyncio.run(cached_call())
+    finally:
+        registry_module.tool_cache = original_cache
+    assert result == "echo hi" and len(cache_threads) == 2 and loop_thread not in cache_threads
+
+    logger.info("Async Tool Test Passed!")
+
+def test_persistent_cache():
+    logger.info("Testing Persistent Cache...")
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = PersistentCache(path=os.path.join(tmp, "cache.sqlite"), max_entries=2, name="test_cache")
+
+        # Declared arguments are normalized (query case/whitespace, URL host case and fragments)
+        assert make_cache_key("search_web", {"query": "Python  Agents"}, ["query"]) == \
+            make_cache_key("search_web", {"query": "python agents"}, ["query"])
+        assert make_cache_key("read_webpage", {"url": "https://Example.com/a#top"}, ["url"]) == \
+            make_cache_key("read_webpage", {"url": "https://example.com/a"}, ["url"])
+        # Everything else is hashed verbatim
+        assert make_cache_key("grep", {"pattern": "Foo"}) != make_cache_key("grep", {"pattern": "foo"})
+        assert make_cache_key("search_web", {"query": "a", "focus": "X"}, ["query"]) != \
+            make_cache_key("search_web", {"query": "a", "focus": "x"}, ["query"])
+        import agent.specialists  # noqa: F401  (registers the research tools)
+        assert registry.get_tool("search_web").cache_normalize == ("query",)
+        assert registry.get_tool("read_webpage").cache_normalize == ("url",)
+
+        cache.set("a", "alpha " * 100, ttl=60)
+        cache.set("b", "beta", ttl=60)
+        assert cache.get("a") == "alpha " * 100  # a is now most recently used
+        cache.set("c", "gamma", ttl=60)          # evicts b (LRU)
+        assert cache.get("b") is None
+        assert cache.get("c") == "gamma"
+
+        cache.set("d", "delta", ttl=-1)          # already expired
+        assert cache.get("d") is None
+
+        assert cache.stats["hit"] == 2
+        assert cache.stats["eviction"] >= 1
+        assert tracer.get_counters()["test_cache.hit"] >= 2
+        cache.close()
+
+    logger.info("Persistent Cache Test Passed!")
+
+def _fake_completion(content):
+    from openai.types.chat import ChatCompletion
+    return ChatCompletion.model_validate({
+        "id": "cmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "test-model",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 12, "completion_tokens": 7, "total_tokens": 19},
+    })
+
+def test_completion_cache():
+    logger.info("Testing Completion Cache...")
+
+    def fake_embed(texts):
+        # Bag-of-letters embedding: near-identical prompts get near-identical vectors
+        import numpy as np
+        vectors = np.zeros((len(texts), 26), dtype="float32")
+        for row, text in enumerate(texts):
+            for ch in text.lower():
+                if "a" <= ch <= "z":
+                    vectors[row, ord(ch) - 97] += 1
+        return vectors
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PersistentCache(path=os.path.join(tmp, "llm.sqlite"), name="test_completion_cache")
+        cache = CompletionCache(store=store, embed_fn=fake_embed, similarity_threshold=0.95)
+        system = {"role": "system", "content": "You are a test agent."}
+        messages = [system, {"role": "user", "content": "What are multi-agent systems?"}]
+
+        async def scenario():
+            assert await cache.get("m", messages, None) is None
+            await cache.put("m", messages, None, _fake_completion("answer"), semantic=True)
+
+            exact = await cache.get("m", list(messages), None)
+            assert exact["choices"][0]["message"]["content"] == "answer"
+            assert exact["usage"]["prompt_tokens"] == 12
+
+            # Different model or tool schema never matches
+            assert await cache.get("other", messages, None) is None
+
+            near = [system, {"role": "user", "content": "What are multi agent systems"}]
+            assert await cache.get("m", near, None) is None
+            assert (await cache.get("m", near, None, semantic=True)) is not None
+
+        asyncio.run(scenario())
+        store.close()
+
+    # Store reads and writes run off the event loop thread
+    import threading
+    store_threads = []
+
+    class RecordingStore:
+        def get(self, key):
+            store_threads.append(threading.get_ident())
+            return None
+
+        def set(self, key, value, ttl):
+            store_threads.append(threading.get_ident())
+
+    async def off_loop():
+        cache = CompletionCache(store=RecordingStore())
+        await cache.put("m", messages, None, _fake_completion("answer"))
+        await cache.get("m", messages, None)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(off_loop())
+    assert len(store_threads) == 2 and loop_thread not in store_threads
+
+    logger.info("Completion Cache Test Passed!")
+
+def _chunk(content=None, tool_calls=None, usage=None):
+    choices = [] if content is None and tool_calls is None else [
+        SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))
+    ]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+def _tool_delta(index, call_id=None, name=None, arguments=None):
+    return SimpleNamespace(
+        index=index, id=call_id,
+        function=SimpleNamespace(name=name, arguments=arguments),
+    )
+
+class _FakeStream:
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(0)
+            yield chunk
+
+def test_tool_call_assembler():
+    logger.info("Testing Tool Call Assembler...")
+    assembler = ToolCallAssembler()
+    assert assembler.add(_tool_delta(0, "c1", "search_web", '{"query": ')) == []
+    ready = assembler.add(_tool_delta(0, None, None, '"agents"}'))
+    assert [c.id for c in ready] == ["c1"]  # complete before the stream moves on
+    assert assembler.add(_tool_delta(1, "c2", "read_webpage", '{"url": "https://a.b"')) == []
+    assert [c.id for c in assembler.finish()] == ["c2"]
+    assert json.loads(assembler.tool_calls()[0].function.arguments) == {"query": "agents"}
+    logger.info("Tool Call Assembler Test Passed!")
+
+def test_agent_astream():
+    logger.info("Testing ObservableAgent.astream...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    import agent.observable_agent as observable_agent
+
+    started = []
+
+    async def lookup(term: str):
+        started.append(term)
+        return f"found {term}"
+
+    # The intermediate step's content ("Let me look.") is held back and dropped
+    streams = [
+        [_chunk("Let me "), _chunk("look."),
+         _chunk(tool_calls=[_tool_delta(0, "c1", "lookup", '{"term": "x"}')]),
+         _chunk(tool_calls=[_tool_delta(1, "c2", "lookup", '{"term": "y"}')]),
+         _chunk(usage=SimpleNamespace(prompt_tokens=10, completion_tokens=4))],
+        [_chunk("Hello "), _chunk("world"),
+         _chunk(usage=SimpleNamespace(prompt_tokens=20, completion_tokens=2))],
+    ]
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            assert kwargs["stream"] is True
+            return _FakeStream(streams.pop(0))
+
+    import contextlib
+    import io
+    from agent import completion_cache as completion_cache_module
+    original = observable_agent.client
+    original_cache = completion_cache_module.get_completion_cache()
+    observable_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    printed = io.StringIO()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PersistentCache(path=os.path.join(tmp, "llm.sqlite"), name="test_astream_cache")
+        completion_cache_module.set_completion_cache(CompletionCache(store=store))
+        try:
+            agent = observable_agent.ObservableAgent(
+                verbose=True, tools=[Tool("lookup", lookup, "lookup tool")], cache_completions=True,
+            )
+
+            async def collect():
+                return [delta async for delta in agent.astream("hi")]
+
+            with contextlib.redirect_stdout(printed):
+                deltas = asyncio.run(collect())
+            result = agent.last_result
+            # Streamed responses were cached: the same run again makes no LLM calls
+            cached_deltas = asyncio.run(collect())
+        finally:
+            observable_agent.client = original
+            completion_cache_module.set_completion_cache(original_cache)
+            store.close()
+
+    assert deltas == ["Hello ", "world"] and cached_deltas == ["Hello world"]
+    assert "Step 1]" not in printed.getvalue() and "Tool executed" not in printed.getvalue()
+    assert agent.last_result["cache_hits"] == 2 and agent.last_result["answer"] == "Hello world"
+    assert started == ["x", "y", "x", "y"]
+    assert result["answer"] == "Hello world"
+    assert result["total_input_tokens"] == 30
+    assert tracer.get_trace(result["trace_id"]).total_output_tokens == 6
+    logger.info("astream Test Passed!")
+
+def test_batch_runner():
+    logger.info("Testing batch runner...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    import agent.observable_agent as observable_agent
+    from batch import parse_queries, run_batch
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            await asyncio.sleep(0.05)
+            question = kwargs["messages"][-1]["content"]
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=f"re: {question}", tool_calls=None))],
+                usage=SimpleNamespace(prompt_tokens=3, completion_tokens=2),
+            )
+
+    items = parse_queries(['{"id": "a", "query": "first"}', '"second"', "", '{"query": "third"}'])
+    assert [i["id"] for i in items] == ["a", "2", "4"]
+
+    original = observable_agent.client
+    observable_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, "out.jsonl")
+            # Partial earlier run: "a" already done
+            with open(output, "w") as f:
+                f.write(json.dumps({"id": "a", "status": "ok"}) + "\n")
+
+            summary = asyncio.run(run_batch(items, output, concurrency=2, resume=True))
+            with open(output) as f:
+                records = [json.loads(line) for line in f]
+    finally:
+        observable_agent.client = original
+
+    assert summary["ok"] == 2 and summary["failed"] == 0
+    assert sorted(r["id"] for r in records) == ["2", "4", "a"]
+    done = {r["id"]: r for r in records}
+    assert done["2"]["answer"] == "re: re: re: second"
+    assert done["2"]["cost"]["total_input_tokens"] == 9
+    logger.info("Batch Runner Test Passed!")
+
+def _tool_messages(count, size, per_step=1):
+    """A transcript of `count` tool results, `per_step` parallel calls per assistant turn."""
+    messages = [{"role": "system", "content": "sys"}, {"role": "user", "content": "python agents"}]
+    for i in range(count):
+        if i % per_step == 0:
+            messages.append({"role": "assistant", "content": None, "tool_calls": []})
+        body = "\n".join(f"line {j} about {'python agents' if j % 7 == 0 else 'other'}" for j in range(size))
+        messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": body})
+    return messages
+
+def test_context_manager():
+    logger.info("Testing Context Manager...")
+    for strategy in ("truncate", "summarize", "evict"):
+        manager = ContextManager("test-model", token_budget=1500, strategy=strategy, keep_recent=1)
+        messages = _tool_messages(4, 200)
+        original_last = messages[-1]["content"]
+
+        report = manager.compact(messages, "python agents")
+        assert report.tokens_saved > 0, strategy
+        assert report.tokens_after <= manager.count(messages)
+        assert messages[-1]["content"] == original_last  # most recent result untouched
+        assert len(messages[3]["content"]) < len(original_last)
+
+        if strategy == "summarize":
+            assert "python agents" in messages[3]["content"]
+        if strategy == "evict":
+            assert manager.recall("call_0").startswith("line 0")
+
+        # Nothing left to do on the next step
+        assert manager.compact(messages, "python agents").compacted_messages == 0
+
+    # keep_recent counts steps: all parallel results of the current step stay whole, even over budget
+    manager = ContextManager("test-model", token_budget=1500, strategy="truncate", keep_recent=1)
+    messages = _tool_messages(1, 200)  # one older result, then a step with 4 parallel calls
+    for message in _tool_messages(4, 200, per_step=4)[2:]:
+        if message["role"] == "tool":
+            message = {**message, "tool_call_id": "current_" + message["tool_call_id"]}
+        messages.append(message)
+    current = [m["content"] for m in messages[-4:]]
+    report = manager.compact(messages, "python agents")
+    assert report.compacted_messages == 1 and [m["content"] for m in messages[-4:]] == current
+    assert report.tokens_after > manager.token_budget
+
+    logger.info("Context Manager Test Passed!")
+
+def test_url_safety():
+    logger.info("Testing URL safety...")
+    for ip in ["10.0.0.1", "192.168.1.1", "172.16.0.1", "127.0.0.1", "169.254.169.254",
+               "0.0.0.0", "::1", "fe80::1", "fc00::1", "::ffff:127.0.0.1",
+               "100.64.0.1", "::ffff:100.64.0.1", "198.18.0.1", "224.0.0.1", "ff02::1"]:
+        assert not url_safety.is_public_ip(ip), ip
+    assert url_safety.is_public_ip("93.184.216.34")
+    assert url_safety.is_public_ip("2606:2800:220:1:248:1893:25c8:1946")
+
+    lookups = []
+
+    async def fake_query(hostname):
+        lookups.append(hostname)
+        await asyncio.sleep(0.01)
+        if hostname == "internal.example":
+            return ["10.1.2.3"], 60
+        if hostname == "missing.example":
+            raise OSError("NXDOMAIN")
+        return ["93.184.216.34", "2606:2800:220:1:248:1893:25c8:1946"], 60
+
+    resolver = url_safety.AsyncResolver()
+    resolver._query = fake_query
+    original = url_safety.resolver
+    url_safety.resolver = resolver
+    try:
+        urls = ["https://public.example/a", "https://public.example/b", "http://internal.example/",
+                "https://missing.example/", "ftp://public.example/", "http://[::1]/", "https://8.8.8.8/x"]
+        results = asyncio.run(url_safety.validate_urls(urls))
+        again = asyncio.run(url_safety.validate_urls(urls))
+    finally:
+        url_safety.resolver = original
+
+    assert [r is not None for r in results] == [True, True, False, False, False, False, True]
+    assert results[0].ip == "93.184.216.34" and results[0].hostname == "public.example"
+    # One query per host: concurrent lookups coalesce, repeats (incl. failures) hit the cache
+    assert sorted(lookups) == ["internal.example", "missing.example", "public.example"]
+    assert [r is not None for r in again] == [r is not None for r in results]
+
+    # Cancelling the first waiter of a shared lookup does not cancel it for the others
+    lookups.clear()
+    resolver = url_safety.AsyncResolver()
+    resolver._query = fake_query
+
+    async def cancel_first():
+        first = asyncio.create_task(resolver.resolve("shared.example"))
+        second = asyncio.create_task(resolver.resolve("shared.example"))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    addresses, first_cancelled = asyncio.run(cancel_first())
+    assert first_cancelled and addresses == ["93.184.216.34", "2606:2800:220:1:248:1893:25c8:1946"]
+    assert lookups == ["shared.example"] and not resolver._inflight
+
+    from tools.http_client import http_client
+    import httpx
+    request = http_client._build_pinned_request(httpx.AsyncClient(), "GET", results[0])
+    assert str(request.url) == "https://93.184.216.34/a"
+    assert request.headers["Host"] == "public.example"
+    assert request.extensions["sni_hostname"] == "public.example"
+
+    # Pinned fetches get one pool per hostname, so hosts sharing an IP never share a TLS connection
+    from tools.http_client import AsyncHttpClient
+    pinned = AsyncHttpClient(pinned_pools=1)
+
+    async def pools():
+        a, b, a_again = [await pinned._pinned_client(h) for h in ("a.example", "b.example", "a.example")]
+        distinct, rebuilt = a is not b, a is not a_again  # b evicted the idle pool of a past the limit
+        closed = a.is_closed and not a_again.is_closed
+        await pinned.aclose()
+        return distinct, rebuilt, closed, b.is_closed
+
+    assert asyncio.run(pools()) == (True, True, True, True)
+
+    logger.info("URL Safety Test Passed!")
+
+def test_html_extract():
+    logger.info("Testing HTML extraction...")
+    html = (
+        "<html><head><title>Doc</title><script>var hidden = 1;</script><style>p{}</style></head>"
+        "<body><nav><a href='/'>Home</a></nav><header><ul><li>Menu</li></ul></header>"
+        "<article><h1>Agents</h1><p>First &amp; foremost.</p><p>Second   line<br/>third</p></article>"
+        "<footer>Copyright</footer></body></html>"
+    )
+    text = extract_text(html, backend="stdlib")
+    assert text.splitlines() == ["Doc", "Agents", "First & foremost.", "Second line", "third"]
+
+    # WebForms-style pages wrap the whole body in a <form>; an article's own header holds its title
+    form_page = "<html><body><form method='post'><div><p>Body inside a form.</p><button>Go</button></div></form></body></html>"
+    assert extract_text(form_page, backend="stdlib").splitlines() == ["Body inside a form.", "Go"]
+    article = (
+        "<body><header>Site chrome</header><main><article><header><h1>Title</h1></header>"
+        "<p>Story.</p><footer>By author</footer></article></main><aside>Ads</aside><footer>Site footer</footer></body>"
+    )
+    assert extract_text(article, backend="stdlib").splitlines() == ["Title", "Story.", "By author"]
+
+    import httpx
+    sent = []
+    body = "<html><body><p>" + "word " * 50 + "</p>" + "".join("<p>more text here</p>" for _ in range(50_000)) + "</body></html>"
+
+    async def chunks():
+        data = body.encode("utf-8")
+        for start in range(0, len(data), 4096):
+            sent.append(start)
+            yield data[start:start + 4096]
+
+    async def scenario():
+        response = httpx.Response(200, headers={"content-type": "text/html; charset=utf-8"}, content=chunks())
+        return await extract_text_from_response(response, max_chars=500, backend="stdlib")
+
+    text = asyncio.run(scenario())
+    assert len(text) <= 500 and text.startswith("word word")
+    assert len(sent) < 5, "extractor kept downloading after it had enough text"
+    logger.info("HTML Extraction Test Passed!")
+
+def test_segment_store():
+    logger.info("Testing segment store...")
+    import numpy as np
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SegmentStore(tmp, max_segments=2)
+        first = np.arange(8, dtype=np.float32).reshape(2, 4)
+        store.append(first, ["alpha", "βeta"])
+        store.append(np.ones((1, 4), dtype=np.float32), ["gamma"])
+        assert store.count == 3 and list(store.docs) == ["alpha", "βeta", "gamma"]
+
+        # An uncommitted (crashed) append is ignored and overwritten
+        with open(os.path.join(tmp, "docs.bin"), "ab") as f:
+            f.write(b"garbage")
+        reopened = SegmentStore(tmp, max_segments=2)
+        assert reopened.count == 3 and reopened.docs[2] == "gamma"
+        assert isinstance(reopened.segments()[0], np.memmap)
+        reopened.append(np.zeros((1, 4), dtype=np.float32), ["delta"])
+        assert reopened.docs[3] == "delta"
+
+        assert reopened.needs_compaction()
+        reopened.compact_in_background().join()
+        assert len(reopened.manifest["segments"]) == 1
+        merged = reopened.segments()[0]
+        assert merged.shape == (4, 4) and np.array_equal(merged[:2], first)
+        assert sorted(f for f in os.listdir(tmp) if f.endswith(".npy")) == [reopened.manifest["segments"][0]["name"]]
+        assert list(SegmentStore(tmp).docs) == ["alpha", "βeta", "gamma", "delta"]
+    logger.info("Segment Store Test Passed!")
+
+def test_vector_index():
+    logger.info("Testing vector index...")
+    import numpy as np
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((2000, 16)).astype(np.float32)
+    queries = data[:20] + 0.01
+
+    flat = VectorIndex(16, "flat")
+    flat.add(data)
+    _, truth = flat.search(queries, 5)
+    assert (truth[:, 0] == np.arange(20)).all()
+
+    ivf = VectorIndex(16, "ivf", nlist=16, nprobe=16, train_min=1000)
+    ivf.add(data[:600])
+    assert not ivf.trained
+    ivf.add(data[600:])
+    assert ivf.trained and ivf.ntotal == 2000
+    _, found = ivf.search(queries, 5)
+    assert (found == truth).all(), "nprobe == nlist must be exact"
+
+    hnsw = VectorIndex(16, "hnsw", ef_search=128)
+    hnsw.add(data)
+    _, found = hnsw.search(queries, 5)
+    assert (found[:, 0] == truth[:, 0]).all()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.faiss")
+        ivf.save(path)
+        loaded = VectorIndex.load(path, 16, "ivf", nprobe=16)
+        assert loaded.trained and loaded.ntotal == 2000
+        assert VectorIndex.load(path, 16, "hnsw") is None
+        assert VectorIndex.load(os.path.join(tmp, "missing.faiss"), 16) is None
+    logger.info("Vector Index Test Passed!")
+
+def test_embedding_pipeline():
+    logger.info("Testing embedding pipeline...")
+    import numpy as np
+    batches = []
+
+    def encode(texts):
+        batches.append(list(texts))
+        return np.array([[len(t), 1.0, 0.0] for t in texts], dtype=np.float32)
+
+    pipeline = EmbeddingPipeline(encode, batch_size=2, cache_size=10)
+    vectors = pipeline.encode(["aa", "bbb", "aa", "c", "dddd"])
+    assert batches == [["aa", "bbb"], ["c", "dddd"]], "duplicates must be encoded once, in batches"
+    assert vectors.shape == (5, 3) and np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    assert np.array_equal(vectors[0], vectors[2])
+
+    pipeline.encode(["bbb", "eeeee"])
+    assert batches[-1] == ["eeeee"] and pipeline.stats == {"hits": 1, "misses": 5}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SegmentStore(tmp)
+        store.append(vectors[:2], ["aa", "bbb"])
+        os.remove(os.path.join(tmp, "docs.hash"))  # store written before hashes existed
+        store.append(vectors[3:4], ["c"])
+        from tools.segment_store import content_hash
+        assert SegmentStore(tmp).hashes() == [content_hash(t) for t in ("aa", "bbb", "c")]
+    logger.info("Embedding Pipeline Test Passed!")
+
+def test_lazy_imports():
+    logger.info("Testing lazy imports...")
+    import subprocess
+    src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+    code = (
+        "import sys, pipeline, tools.vector_store\n"
+        "heavy = [m for m in ('openai', 'bs4', 'sentence_transformers') if m in sys.modules]\n"
+        "assert not heavy, heavy\n"
+        "from agent import observable_agent\n"
+        "observable_agent.client\n"
+        "assert 'openai' in sys.modules\n"
+    )
+    env = {**os.environ, "PYTHONPATH": src, "OPENAI_API_KEY": "test-key"}
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    logger.info("Lazy Imports Test Passed!")
+
+def test_loop_detector_bounded():
+    logger.info("Testing bounded loop detector...")
+    detector = AdvancedLoopDetector(exact_threshold=2, stagnation_window=3, max_history=50)
+    for i in range(500):
+        detector.check_tool_call("search", f"query {i}")
+        detector.check_output_stagnation(f"output number {i}")
+    assert len(detector.tool_history) == 50 and len(detector._call_counts) == 50
+    assert len(detector.output_history) == 3
+
+    # Exact matches are counted in O(1); whitespace-only differences still match
+    detector.reset()
+    assert not detector.check_tool_call("search", "same thing").is_looping
+    detector.check_tool_call("other", "unrelated words here")
+    detector.check_tool_call("other", "entirely different call")
+    assert not detector.check_tool_call("search", " same thing ").is_looping
+    result = detector.check_tool_call("search", "same thing")
+    assert result.is_looping and result.strategy == "exact"
+
+    detector.reset()
+    for text in ("alpha beta gamma", "alpha beta gamma delta", "alpha beta gamma"):
+        result = detector.check_output_stagnation(text)
+    assert result.is_looping and result.strategy == "stagnation"
+    logger.info("Bounded Loop Detector Test Passed!")
+
+def test_agent_loop_policies():
+    logger.info("Testing agent loop policies...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    import agent.observable_agent as observable_agent
+
+    executed = []
+
+    async def search(query: str):
+        executed.append(query)
+        return f"results for {query}"
+
+    class FakeCompletions:
+        def __init__(self):
+            self.calls = 0
+
+        async def create(self, **kwargs):
+            self.calls += 1
+            # Key order varies but the call is the same
+            args = '{"query": "agents"}' if self.calls % 2 else '{ "query":"agents" }'
+            call = SimpleNamespace(id=f"c{self.calls}", function=SimpleNamespace(name="search", arguments=args))
+            message = SimpleNamespace(content="Let me search again.", tool_calls=[call])
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=message)],
+                usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20),
+            )
+
+    def run(policy):
+        executed.clear()
+        completions = FakeCompletions()
+        original = observable_agent.client
+        observable_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+        try:
+            agent = observable_agent.ObservableAgent(
+                verbose=False, max_steps=6, tools=[Tool("search", search, "search tool")],
+                cache_completions=False, loop_policy=policy,
+            )
+            return agent, asyncio.run(agent.run("find agents")), completions.calls
+        finally:
+            observable_agent.client = original
+
+    # short_circuit: the third identical call is served from step 1, never executed
+    agent, result, calls = run("short_circuit")
+    assert calls == 6 and len(executed) == 2
+    third = agent.trace_log[2]["tools_called"][0]["search"]
+    assert third.startswith("[Loop detector]") and "results for agents" in third
+    actions = {(i["strategy"], i["action"]) for i in result["loop_interventions"]}
+    assert ("exact", "short_circuit") in actions and ("stagnation", "short_circuit") in actions
+
+    # abort: stops at step 3 and records the steps and tokens it saved
+    agent, result, calls = run("abort")
+    assert calls == 3 and result["answer"] is None
+    saved = result["loop_interventions"][-1]
+    assert saved["steps_saved"] == 3 and saved["tokens_saved"] == 360
+    trace = tracer.get_trace(result["trace_id"])
+    assert trace.counters["loop.steps_saved"] == 3
+    assert trace.steps[-1].loop_interventions
+
+    # inject: tools still run, the correction is appended to the conversation
+    agent, result, calls = run("inject")
+    assert len(executed) == 6 and result["loop_interventions"]
+    logger.info("Agent Loop Policies Test Passed!")
+
+def test_trace_store():
+    logger.info("Testing trace store...")
+    from dataclasses import asdict
+    from observability.tracer import trace_from_dict
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # An expired segment from an earlier process
+        stale = os.path.join(tmp, "traces-20000101-000000-1-0001.jsonl.gz")
+        open(stale, "wb").close()
+        os.utime(stale, (0, 0))
+
+        store = TraceStore(directory=tmp, capacity=2, segment_max_bytes=1, retention_seconds=3600,
+                           serialize=asdict, deserialize=trace_from_dict)
+        local = AgentTracer(store=store)
+        ids = []
+        for i in range(5):
+            trace_id = local.start_trace("StoreAgent", f"query {i}")
+            local.log_step(trace_id, AgentStep(
+                step_number=1, reasoning=f"step {i}",
+                tool_calls=[ToolCallRecord("search", {"q": i}, "out", 1.0)],
+            ))
+            if i != 1:  # trace 1 never finishes; it is never evicted
+                local.end_trace(trace_id, f"answer {i}")
+            ids.append(trace_id)
+        # Updates after end_trace do not reach the persisted snapshot
+        local.increment("late", trace_id=ids[4])
+        store.flush()
+
+        assert list(store._hot) == [ids[1], ids[4]] and store.stats["evicted"] == 3
+        assert local.current_trace_id() == ids[1]  # ended traces restore the one they started inside
+        assert not os.path.exists(stale), "retention should drop expired segments"
+
+        # A fresh store (new process) finds traces by scanning the segments
+        reopened = AgentTracer(store=TraceStore(directory=tmp, serialize=asdict, deserialize=trace_from_dict))
+        trace = reopened.get_trace(ids[0])
+        assert trace.final_output == "answer 0" and trace.steps[0].tool_calls[0].tool_input == {"q": 0}
+        assert reopened.get_trace(ids[1]) is None and local.get_trace(ids[1]).status == "running"
+        assert json.loads(reopened.get_trace_json(ids[4]))["final_output"] == "answer 4"
+        assert "late" not in reopened.get_trace(ids[4]).counters and local.get_trace(ids[4]).counters["late"] == 1
+        assert reopened.get_trace("missing") is None
+        store.close()
+
+    # Running traces past the timeout are evicted too, so abandoned runs cannot pile up
+    store = TraceStore(capacity=2, persist=False, running_timeout=0)
+    for i in range(5):
+        store.add(f"run{i}", {"status": "running"})
+    assert list(store._hot) == ["run3", "run4"] and store.stats["stale_evicted"] == 3
+
+    # A cancelled agent run ends its trace, and the hot tier stays bounded
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    import agent.observable_agent as observable_agent
+
+    class StalledCompletions:
+        async def create(self, **kwargs):
+            await asyncio.sleep(60)
+
+    original_client, original_store = observable_agent.client, tracer.store
+    observable_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=StalledCompletions()))
+    tracer.store = TraceStore(capacity=2, persist=False, serialize=asdict, deserialize=trace_from_dict)
+    try:
+        agent = observable_agent.ObservableAgent(verbose=False, cache_completions=False)
+
+        async def cancel_runs():
+            for i in range(5):
+                task = asyncio.create_task(agent.run(f"query {i}"))
+                await asyncio.sleep(0.01)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        asyncio.run(cancel_runs())
+        hot = list(tracer.store._hot.values())
+        assert len(hot) == 2 and all(t.status == "cancelled" for t in hot)
+        assert not tracer._context_tokens
+    finally:
+        observable_agent.client, tracer.store = original_client, original_store
+    logger.info("Trace Store Test Passed!")
+
+def test_spans():
+    logger.info("Testing span instrumentation...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    import agent.observable_agent as observable_agent
+    from observability import spans
+    from config import Config
+
+    def lookup(term: str):  # sync: runs in the thread pool
+        with spans.span("lookup.inner"):
+            return f"found {term}"
+
+    responses = [
+        _fake_completion(None).model_copy(update={"choices": [SimpleNamespace(
+            message=SimpleNamespace(content=None, tool_calls=[_fake_tool_call("c1", "lookup", {"term": "x"})])
+        )]}),
+        _fake_completion("done"),
+    ]
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            return responses.pop(0)
+
+    exporter = spans.InMemorySpanExporter()
+    spans.configure(exporter)
+    original = observable_agent.client
+    observable_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    try:
+        agent = observable_agent.ObservableAgent(
+            verbose=False, tools=[Tool("lookup", lookup, "lookup tool")], cache_completions=False,
+        )
+
+        async def scenario():
+            with spans.span("pipeline.run"):
+                await agent.run("hi")
+
+        asyncio.run(scenario())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spans.jsonl")
+            file_exporter = spans.OTLPJsonFileExporter(path)
+            spans.configure(file_exporter)
+            with spans.span("root", answer=42):
+                with spans.span("child", cached=True):
+                    pass
+            file_exporter.flush()  # written by the background thread
+            with open(path) as f:
+                exported = json.loads(f.readline())
+    finally:
+        observable_agent.client = original
+        spans.configure(enabled=Config.SPANS_ENABLED)
+
+    by_name = {}
+    for recorded in exporter.spans:
+        by_name.setdefault(recorded.name, []).append(recorded)
+    root = by_name["pipeline.run"][0]
+    run = by_name["agent.run"][0]
+    assert run.parent_span_id == root.span_id
+    assert {s.parent_span_id for s in by_name["llm.completion"]} == {run.span_id}
+    assert len(by_name["llm.completion"]) == 2
+    tool_span = by_name["tool.execute"][0]
+    assert tool_span.parent_span_id == run.span_id and tool_span.attributes["tool.name"] == "lookup"
+    assert by_name["lookup.inner"][0].parent_span_id == tool_span.span_id
+    assert len({s.trace_id for s in exporter.spans}) == 1
+
+    otlp_spans = exported["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in otlp_spans] == ["child", "root"]
+    assert otlp_spans[0]["parentSpanId"] == otlp_spans[1]["spanId"]
+    assert otlp_spans[1]["attributes"] == [{"key": "answer", "value": {"intValue": "42"}}]
+    logger.info("Span Instrumentation Test Passed!")
+
+def test_profiler():
+    logger.info("Testing on-demand profiling...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    import agent.observable_agent as observable_agent
+    from observability import profiler
+    from observability.tracer import tracer
+
+    def crunch(n: int):  # sync: profiled in the worker thread
+        return str(sum(i * i for i in range(n)))
+
+    def make_responses():
+        return [
+            _fake_completion(None).model_copy(update={"choices": [SimpleNamespace(
+                message=SimpleNamespace(content=None, tool_calls=[_fake_tool_call("c1", "crunch", {"n": 20000})])
+            )]}),
+            _fake_completion("done"),
+        ]
+
+    responses = []
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            return responses.pop(0)
+
+    original = observable_agent.client
+    observable_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    try:
+        agent = observable_agent.ObservableAgent(
+            verbose=False, tools=[Tool("crunch", crunch, "cpu tool")], cache_completions=False,
+        )
+        responses[:] = make_responses()
+        plain = asyncio.run(agent.run("hi"))
+        responses[:] = make_responses()
+        profiled = asyncio.run(agent.run("hi", profile=True))
+    finally:
+        observable_agent.client = original
+
+    assert tracer.get_trace(plain["trace_id"]).profile is None
+    stored = tracer.get_trace(profiled["trace_id"]).profile
+    assert stored["profiler"] == "cProfile" and stored["worker_threads"] == 1
+    names = {row["function"] for row in stored["functions"]}
+    assert "crunch" in names and "_run_loop" in names
+    json.dumps(stored)  # persisted with the trace
+
+    table = profiler.format_top(stored, top=5, sort="cumtime")
+    assert len(table.splitlines()) == 7
+    assert profiler.main([profiled["trace_id"], "--top", "3"]) == 0
+    assert profiler.main([plain["trace_id"]]) == 1
+    logger.info("Profiler Test Passed!")
+
+def test_pricing_and_budgets():
+    logger.info("Testing pricing and budgets...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    import agent.observable_agent as observable_agent
+    from observability import pricing
+    from observability.cost_tracker import CostTracker
+
+    # Price table: file overrides, provider prefixes, free variants, cached-token rate
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "pricing.json")
+        with open(path, "w") as f:
+            json.dump({"default": {"input": 1.0, "output": 2.0},
+                       "models": {"my/model": {"input": 4.0, "output": 8.0, "cached_input": 1.0}}}, f)
+        table = pricing.PriceTable.load(path)
+    assert table.price_for("openai/gpt-4o") == pricing.DEFAULT_PRICES["gpt-4o"]
+    assert table.price_for("z-ai/glm-4.5-air:free") == pricing.FREE
+    assert table.price_for("unknown") == pricing.ModelPrice(1.0, 2.0)
+    assert abs(table.cost("my/model", 1_000_000, 0, cached_input_tokens=500_000) - 2.5) < 1e-9
+    assert pricing.cached_prompt_tokens(SimpleNamespace(prompt_tokens_details={"cached_tokens": 5})) == 5
+    assert pricing.cached_prompt_tokens(SimpleNamespace(prompt_tokens_details=None)) == 0
+
+    calls = []
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            calls.append(kwargs)
+            if kwargs.get("tools") is None:
+                return _fake_completion("done")
+            return _fake_completion(None).model_copy(update={"choices": [SimpleNamespace(
+                message=SimpleNamespace(content="searching", tool_calls=[
+                    _fake_tool_call(f"c{len(calls)}", "lookup", {"term": f"t{len(calls)}"})
+                ])
+            )]})
+
+    original = observable_agent.client
+    observable_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    try:
+        def make_agent(**kwargs):
+            return observable_agent.ObservableAgent(
+                model="gpt-4o", verbose=False, max_steps=5, cache_completions=False,
+                tools=[Tool("lookup", lambda term: f"found {term}", "lookup tool")], **kwargs,
+            )
+
+        # Step 1's estimate (256 output tokens) fits 3 steps: the cap shrinks and step 3 must answer
+        query_budget = pricing.Budget(limit_usd=1.0)
+        result = asyncio.run(make_agent(budget_usd=0.01).run("hi", budget=query_budget))
+        assert [a["action"] for a in result["budget"]["actions"]] == [pricing.BUDGET_SHRINK, pricing.BUDGET_FINAL]
+        assert [a["step"] for a in result["budget"]["actions"]] == [1, 3]
+        assert len(calls) == 3 and calls[-1]["tools"] is None
+        assert result["answer"] == "done"
+        step_cost = pricing.DEFAULT_PRICES["gpt-4o"].cost(12, 7)
+        assert abs(result["run_cost_usd"] - 3 * step_cost) < 1e-9
+        assert abs(query_budget.spent_usd - 3 * step_cost) < 1e-9
+        assert result["trace_log"][-1]["budget_action"] == pricing.BUDGET_FINAL
+
+        # An exhausted query budget stops before any call
+        calls.clear()
+        spent = pricing.Budget(limit_usd=0.001, spent_usd=0.001)
+        result = asyncio.run(make_agent().run("hi", budget=spent))
+        assert calls == [] and result["answer"] is None and result["budget"]["exhausted"]
+
+        # No budget: the loop is unchanged (tools offered on every step)
+        calls.clear()
+        result = asyncio.run(make_agent().run("hi"))
+        assert len(calls) == 5 and all(c["tools"] for c in calls) and result["budget"]["actions"] == []
+    finally:
+        observable_agent.client = original
+
+    tracker = CostTracker(verbose=False, budget_usd=0.5)
+    tracker.start_query("q")
+    tracker.log_agent_usage("Researcher", "gpt-4o", 1000, 100)
+    tracker.end_query()
+    breakdown = json.loads(tracker.to_json())
+    assert breakdown["total_cost_usd"] == round(pricing.DEFAULT_PRICES["gpt-4o"].cost(1000, 100), 6)
+    assert breakdown["budget"]["limit_usd"] == 0.5
+    logger.info("Pricing and Budgets Test Passed!")
+
+def test_model_routing():
+    logger.info("Testing model cascade routing...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    import agent.observable_agent as observable_agent
+    from agent import routing
+    from config import Config
+    from observability.tracer import tracer
+
+    # Rules: off without a fast model; per-specialist overrides from a file
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "routing.json")
+        with open(path, "w") as f:
+            json.dump({"Analyst": {"fast_model": "fast/analyst", "escalate_final": False}}, f)
+        if not Config.ROUTING_FAST_MODEL:
+            assert routing.rule_for("Researcher", path) is None
+        analyst_rule = routing.rule_for("Analyst", path)
+        assert analyst_rule.fast_model == "fast/analyst" and not analyst_rule.escalate_final
+        assert routing.rule_for("Writer", path) is None
+
+    rule = routing.RoutingRule(fast_model="fast-model")
+    tools = {"lookup": None}
+    bad_json = SimpleNamespace(tool_calls=[SimpleNamespace(function=SimpleNamespace(name="lookup", arguments="{bad"))], content=None)
+    unknown = SimpleNamespace(tool_calls=[_fake_tool_call("c", "nope", {})], content=None)
+    good = SimpleNamespace(tool_calls=[_fake_tool_call("c", "lookup", {"term": "x"})], content=None)
+    assert rule.escalation(bad_json, tools) == routing.ESCALATE_INVALID_JSON
+    assert rule.escalation(unknown, tools) == routing.ESCALATE_UNKNOWN_TOOL
+    assert rule.escalation(good, tools) is None
+    assert rule.escalation(SimpleNamespace(tool_calls=None, content=" "), tools) == routing.ESCALATE_EMPTY
+    assert rule.escalation(SimpleNamespace(tool_calls=None, content="answer"), tools) == routing.ESCALATE_FINAL
+    assert rule.first_model("strong-model", final_only=True) == "strong-model"
+
+    def tool_step(call_id, term):
+        return _fake_completion(None).model_copy(update={"choices": [SimpleNamespace(
+            message=SimpleNamespace(content=None, tool_calls=[_fake_tool_call(call_id, "lookup", {"term": term})])
+        )]})
+
+    bad_step = _fake_completion(None).model_copy(update={"choices": [SimpleNamespace(
+        message=SimpleNamespace(content=None, tool_calls=[
+            SimpleNamespace(id="b1", function=SimpleNamespace(name="lookup", arguments="{bad"))
+        ])
+    )]})
+    scripts = {}
+    models_called = []
+
+    class FakeCompletions:
+        async def create(self, **kwargs):
+            models_called.append(kwargs["model"])
+            return scripts[kwargs["model"]].pop(0)
+
+    original = observable_agent.client
+    observable_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    try:
+        def make_agent():
+            return observable_agent.ObservableAgent(
+                model="gpt-4o", verbose=False, cache_completions=False, routing=rule,
+                tools=[Tool("lookup", lambda term: f"found {term}", "lookup tool")],
+            )
+
+        # step 1: fast tool call is malformed → redone on the strong model
+        # step 2: fast tool call is kept; step 3: fast answers → final answer from the strong model
+        scripts.update({
+            "fast-model": [bad_step, tool_step("f2", "y"), _fake_completion("draft")],
+            "gpt-4o": [tool_step("s1", "x"), _fake_completion("final")],
+        })
+        result = asyncio.run(make_agent().run("hi"))
+        assert models_called == ["fast-model", "gpt-4o", "fast-model", "fast-model", "gpt-4o"]
+        assert result["answer"] == "final"
+        assert [r["model"] for r in result["trace_log"]] == ["gpt-4o", "fast-model", "gpt-4o"]
+        assert [r["escalation"] for r in result["trace_log"]] == ["invalid_tool_json", None, "final_answer"]
+        assert result["cost_by_model"]["fast-model"]["calls"] == 3
+        assert result["cost_by_model"]["gpt-4o"]["calls"] == 2
+        steps = tracer.get_trace(result["trace_id"]).steps
+        assert [s.model for s in steps] == ["gpt-4o", "fast-model", "gpt-4o"]
+        assert abs(sum(s.cost_usd for s in steps) - result["run_cost_usd"]) < 1e-9
+
+        # Streaming: the discarded fast draft never reaches the caller
+        models_called.clear()
+        scripts.update({
+            "fast-model": [_fake_completion("draft")],
+            "gpt-4o": [_FakeStream([_chunk("final "), _chunk("answer"),
+                                    _chunk(usage=SimpleNamespace(prompt_tokens=5, completion_tokens=2))])],
+        })
+        agent = make_agent()
+
+        async def collect():
+            return [delta async for delta in agent.astream("hi")]
+
+        assert asyncio.run(collect()) == ["final ", "answer"]
+        assert models_called == ["fast-model", "gpt-4o"]
+
+        # Under a budget, a step is priced at the model routing tries first
+        scripts.update({"fast-model": [tool_step("f1", "x")], "gpt-4o": [_fake_completion("final")]})
+        agent = observable_agent.ObservableAgent(
+            model="gpt-4o", verbose=False, cache_completions=False, routing=rule, budget_usd=1.0, max_steps=2,
+            tools=[Tool("lookup", lambda term: f"found {term}", "lookup tool")],
+        )
+        priced = []
+        estimate_cost = agent._estimate_cost
+
+        def recording_estimate(*args, **kwargs):
+            if "model" in kwargs:  # the budget pre-check; usage is priced positionally
+                priced.append(kwargs["model"])
+            return estimate_cost(*args, **kwargs)
+
+        agent._estimate_cost = recording_estimate
+        asyncio.run(agent.run("hi"))
+        assert priced[:2] == ["fast-model", "gpt-4o"]  # step 2 must answer: straight to the strong model
+    finally:
+        observable_agent.client = original
+    logger.info("Model Routing Test Passed!")
+
+class _FakeOpenAIServer:
+    """
+    Minimal OpenAI-compatible /v1/chat/completions server on localhost.
+    Each request takes the next scripted reply: {"status", "headers", "delay", "content" or "stream"}.
+    """
+
+    def __init__(self, replies):
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.replies = list(replies)
+        self.requests = 0
+        self.in_flight = self.max_in_flight = 0
+        lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with lock:
+                    reply = server.replies.pop(0) if len(server.replies) > 1 else server.replies[0]
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(reply.get("delay", 0))
+                    self._reply(reply, body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout)
+                finally:
+                    with lock:
+                        server.in_flight -= 1
+
+            def _reply(self, reply, body):
+                status = reply.get("status", 200)
+                if "stream" in reply:
+                    chunks = [{"choices": [{"index": 0, "delta": {"content": part}, "finish_reason": None}]}
+                              for part in reply["stream"]]
+                    chunks.append({"choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}})
+                    payload = "".join(
+                        "data: " + json.dumps({"id": "c", "object": "chat.completion.chunk", "created": 0,
+                                               "model": body["model"], **chunk}) + "\n\n"
+                        for chunk in chunks
+                    ) + "data: [DONE]\n\n"
+                    content_type = "text/event-stream"
+                elif status == 200:
+                    payload = json.dumps({
+                        "id": "c", "object": "chat.completion", "created": 0, "model": body["model"],
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": reply.get("content", "ok")}}],
+                        "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7},
+                    })
+                    content_type = "application/json"
+                else:
+                    payload = json.dumps({"error": {"message": f"status {status}", "type": "test"}})
+                    content_type = "application/json"
+                data = payload.encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in reply.get("headers", {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+def test_llm_gateway():
+    logger.info("Testing LLM gateway against a fake server...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    from openai import AsyncOpenAI
+    import agent.observable_agent as observable_agent
+    from agent.llm_gateway import LLMGateway, retry_after_seconds
+
+    def run(server, gateway, calls=1, **kwargs):
+        async def main():
+            client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+            try:
+                return await asyncio.gather(*(
+                    gateway.create(client, model="m", messages=[{"role": "user", "content": "hi"}], **kwargs)
+                    for _ in range(calls)
+                ))
+            finally:
+                await client.close()
+        return asyncio.run(main())
+
+    # 429 with Retry-After: waited for, then retried
+    gateway = LLMGateway(backoff_base=0.01, backoff_max=2, max_retries=3)
+    with _FakeOpenAIServer([{"status": 429, "headers": {"Retry-After": "0.3"}}, {"content": "after 429"}]) as server:
+        start = time.perf_counter()
+        response, = run(server, gateway)
+        assert time.perf_counter() - start >= 0.3
+    assert response.choices[0].message.content == "after 429" and server.requests == 2
+    assert gateway.stats["rate_limited"] == 1 and gateway.stats["retries"] == 1
+
+    # Per-attempt timeout, then success; client errors are not retried
+    gateway = LLMGateway(backoff_base=0.01, timeout=0.3, max_retries=2)
+    with _FakeOpenAIServer([{"delay": 1.0}, {"content": "fast"}]) as server:
+        response, = run(server, gateway)
+    assert response.choices[0].message.content == "fast" and gateway.stats["timeouts"] == 1
+    with _FakeOpenAIServer([{"status": 400}]) as server:
+        try:
+            run(server, gateway)
+            assert False, "400 should raise"
+        except Exception as e:
+            assert getattr(e, "status_code", None) == 400
+        assert server.requests == 1
+
+    # Concurrency cap: requests beyond it queue, and the delay is measured
+    gateway = LLMGateway(max_concurrency=2)
+    with _FakeOpenAIServer([{"delay": 0.1}]) as server:
+        run(server, gateway, calls=6)
+    assert server.max_in_flight == 2 and gateway.stats["in_flight"] == 0
+    assert gateway.stats["queue_ms_max"] >= 150
+
+    assert retry_after_seconds(SimpleNamespace(response=SimpleNamespace(headers={"retry-after-ms": "250"}))) == 0.25
+    assert retry_after_seconds(SimpleNamespace(response=None)) is None
+
+    # End to end: a streamed agent run recovers from a 503
+    gateway = LLMGateway(backoff_base=0.01)
+    with _FakeOpenAIServer([{"status": 503}, {"stream": ["Hello ", "world"]}]) as server:
+        original = observable_agent.client
+
+        async def stream_run():
+            observable_agent.client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+            try:
+                agent = observable_agent.ObservableAgent(verbose=False, cache_completions=False, gateway=gateway)
+                return [delta async for delta in agent.astream("hi")], agent.last_result
+            finally:
+                await observable_agent.client.close()
+
+        try:
+            deltas, result = asyncio.run(stream_run())
+        finally:
+            observable_agent.client = original
+    assert deltas == ["Hello ", "world"] and result["answer"] == "Hello world"
+    assert result["total_input_tokens"] == 5 and gateway.stats["retries"] == 1 and gateway.stats["in_flight"] == 0
+
+    class LocalCompletions:
+        async def create(self, **kwargs):
+            return _FakeStream([]) if kwargs.get("stream") else _fake_completion("ok")
+
+    local_client = SimpleNamespace(chat=SimpleNamespace(completions=LocalCompletions()))
+
+    # Usage is settled against what was taken from the bucket: an estimate capped at its capacity
+    gateway = LLMGateway(tokens_per_minute=600)
+
+    async def settle():
+        await gateway.create(local_client, model="m", messages=[{"role": "user", "content": "x" * 10000}])
+        return gateway._state().tokens._tokens
+
+    assert 580 < asyncio.run(settle()) < 590  # 600 acquired, 19 used
+
+    # A stream dropped without being drained or closed still frees its slot
+    import gc
+    gateway = LLMGateway(max_concurrency=1)
+
+    async def abandon():
+        stream = await gateway.create(local_client, model="m", messages=[], stream=True)
+        del stream
+        gc.collect()
+        return await asyncio.wait_for(gateway.create(local_client, model="m", messages=[]), 1)
+
+    assert asyncio.run(abandon()).choices[0].message.content == "ok" and gateway.stats["in_flight"] == 0
+    logger.info("LLM Gateway Test Passed!")
+
+def test_hedging_and_deadlines():
+    logger.info("Testing hedged LLM calls and deadlines...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    from openai import AsyncOpenAI
+    import agent.observable_agent as observable_agent
+    from agent.deadline import DeadlineExceeded, deadline, remaining_time
+    from agent.llm_gateway import LLMGateway
+
+    def run(server, gateway, calls, seconds=None):
+        async def main():
+            client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+            try:
+                with deadline(seconds):
+                    return [
+                        await gateway.create(client, model="m", messages=[{"role": "user", "content": "hi"}])
+                        for _ in range(calls)
+                    ]
+            finally:
+                await client.close()
+        return asyncio.run(main())
+
+    # Nested deadlines only tighten
+    with deadline(10):
+        with deadline(60):
+            assert remaining_time() <= 10
+        with deadline(None):
+            assert 0 < remaining_time() <= 10
+    assert remaining_time() is None
+
+    # A slow primary is hedged after the p50 of recent latency; the hedge answers first
+    gateway = LLMGateway(hedge_percentile=50, hedge_min_samples=3)
+    replies = [{"content": "warm"}] * 3 + [{"delay": 1.5, "content": "slow"}, {"content": "hedge"}]
+    with _FakeOpenAIServer(replies) as server:
+        start = time.perf_counter()
+        responses = run(server, gateway, calls=4)
+        assert time.perf_counter() - start < 1.0
+        assert server.requests == 5
+        for _ in range(40):
+            if server.in_flight == 0:
+                break
+            time.sleep(0.05)
+        assert server.in_flight == 0
+    assert responses[-1].choices[0].message.content == "hedge"
+    assert gateway.stats["hedged"] == 1 and gateway.stats["hedge_won"] == 1
+    assert gateway.stats["hedge_extra_tokens"] > 0 and gateway.stats["in_flight"] == 0
+
+    # The deadline cuts retries short instead of waiting out the backoff
+    gateway = LLMGateway(backoff_base=0.01, backoff_max=5, max_retries=5)
+    with _FakeOpenAIServer([{"status": 503, "headers": {"Retry-After": "2"}}]) as server:
+        start = time.perf_counter()
+        try:
+            run(server, gateway, calls=1, seconds=0.5)
+            assert False, "503 should raise"
+        except Exception as e:
+            assert getattr(e, "status_code", None) == 503
+        assert time.perf_counter() - start < 1.0 and server.requests == 1
+
+    # An attempt still running at the deadline is cut off and not retried
+    gateway = LLMGateway(timeout=30, max_retries=3)
+    with _FakeOpenAIServer([{"delay": 1.0}]) as server:
+        try:
+            run(server, gateway, calls=1, seconds=0.3)
+            assert False, "the deadline should have been exceeded"
+        except DeadlineExceeded:
+            pass
+        assert server.requests == 1
+    assert gateway.stats["deadline_exceeded"] == 1 and gateway.stats["retries"] == 0
+
+    # Agent: a stalled step ends the run at the deadline instead of failing it
+    gateway = LLMGateway(timeout=30)
+    with _FakeOpenAIServer([{"delay": 2.0}]) as server:
+        original = observable_agent.client
+
+        async def agent_run():
+            observable_agent.client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+            try:
+                agent = observable_agent.ObservableAgent(verbose=False, cache_completions=False, gateway=gateway)
+                with deadline(0.5):
+                    return await agent.run("hi")
+            finally:
+                await observable_agent.client.close()
+
+        try:
+            start = time.perf_counter()
+            result = asyncio.run(agent_run())
+            elapsed = time.perf_counter() - start
+        finally:
+            observable_agent.client = original
+    assert elapsed < 1.5 and result["answer"] is None
+    assert result["budget"]["deadline_exceeded"]
+    assert result["budget"]["actions"][-1]["kind"] == "deadline"
+
+    # Agent: slow tools are cut off at the step deadline and the last content is returned as partial
+    async def slow_lookup(term: str):
+        await asyncio.sleep(5)
+        return "too late"
+
+    class ToolCallCompletions:
+        async def create(self, **kwargs):
+            message = SimpleNamespace(content="Looking it up.", tool_calls=[
+                _fake_tool_call(f"c{i}", "slow_lookup", {"term": str(i)}) for i in range(3)
+            ])
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)],
+                                   usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5))
+
+    original = observable_agent.client
+    observable_agent.client = SimpleNamespace(chat=SimpleNamespace(completions=ToolCallCompletions()))
+    try:
+        agent = observable_agent.ObservableAgent(
+            verbose=False, max_steps=1, cache_completions=False, tools=[Tool("slow_lookup", slow_lookup, "slow tool")],
+        )
+
+        async def tool_run():
+            with deadline(0.5):
+                return await agent.run("hi")
+
+        start = time.perf_counter()
+        result = asyncio.run(tool_run())
+        elapsed = time.perf_counter() - start
+    finally:
+        observable_agent.client = original
+    assert elapsed < 1.5 and result["partial"] and result["budget"]["deadline_exceeded"]
+    assert result["answer"].startswith("[Partial result") and result["answer"].endswith("Looking it up.")
+    assert result["budget"]["actions"][-1]["action"] == "exceeded"
+    logger.info("Hedging And Deadlines Test Passed!")
+
+def test_tool_dispatch():
+    logger.info("Testing tool dispatch fast path...")
+    from typing import List
+    from tools.registry import ToolRegistry
+    from agent.observable_agent import ObservableAgent
+
+    local = ToolRegistry()
+
+    @local.register("lookup", "Look something up", category="search")
+    def lookup(query: str, limit: int = 3, exact: bool = False):
+        return f"{query}|{limit}|{exact}"
+
+    @local.register("tag", "Tag items")
+    def tag(items: List[str], label: str = "x"):
+        return f"{label}:{','.join(items)}"
+
+    fast, slow = local.get_tool("lookup"), local.get_tool("tag")
+    assert fast._fast_params is not None and slow._fast_params is None
+
+    # Exact primitive types skip pydantic; anything else coerces or fails the same way as before
+    assert fast.validate_arguments({"query": "q", "extra": 1}) == {"query": "q", "limit": 3, "exact": False}
+    assert fast.execute(query="q", limit="7") == "q|7|False"
+    assert fast.execute(query="q", limit=2.0) == "q|2|False"
+    assert fast.execute(limit=1).startswith("Validation error")
+    assert fast.execute(query="q", limit="many").startswith("Validation error")
+    assert slow.execute(items=["a", "b"]) == "x:a,b"
+
+    # Schemas are built once per tool
+    assert fast.to_openai_schema() is fast.to_openai_schema()
+
+    # Agent: index and schemas follow assignments to .tools
+    agent = ObservableAgent(verbose=False, tools=[fast])
+    assert agent._tool_index == {"lookup": fast} and agent._openai_tools == [fast.to_openai_schema()]
+    agent.tools = [fast, slow]
+    assert set(agent._tool_index) == {"lookup", "tag"} and len(agent._openai_tools) == 2
+    logger.info("Tool Dispatch Test Passed!")
+
+def test_focused_excerpts():
+    logger.info("Testing focused page excerpts...")
+    from config import Config
+    from tools.excerpt import PageCache, PageIndex, chunk_text, page_cache
+    from agent.specialists import read_webpage
+
+    nav = "\n".join(f"Home | Products | Pricing | Blog | Careers | Contact {i}" for i in range(60))
+    section = (
+        "Retrieval-augmented generation grounds the model on retrieved documents.\n"
+        "BM25 ranking scores each passage by term frequency and inverse document frequency."
+    )
+    filler = "\n".join(f"Unrelated paragraph {i} about company history and office locations." for i in range(80))
+    text = f"{nav}\n{filler}\n{section}\n{filler}"
+
+    chunks = chunk_text(text, 300)
+    assert all(len(chunk) <= 300 for chunk in chunks) and "".join(chunks).replace("\n", "") == text.replace("\n", "")
+    assert all(len(chunk) <= 50 for chunk in chunk_text("x" * 120 + " tail", 50))
+
+    page = PageIndex(text, chunk_chars=300)
+    excerpt = page.excerpt("how does BM25 passage ranking work", max_chars=600)
+    assert "BM25 ranking scores each passage" in excerpt and len(excerpt) <= 600
+    assert "Home | Products" not in excerpt
+    # No focus, or no matching term: the leading text, as before
+    assert page.excerpt("", max_chars=100) == text[:100]
+    assert page.excerpt("zzzz", max_chars=100) == text[:100]
+
+    # Short-lived cache keyed by the normalized URL
+    cache = PageCache(ttl=0.2, max_pages=2)
+    cache.put("https://Example.com/a#top", "first")
+    assert cache.get("https://example.com/a").text == "first"
+    cache.put("https://example.com/b", "b")
+    cache.put("https://example.com/c", "c")
+    assert cache.get("https://example.com/a") is None  # evicted (LRU)
+    time.sleep(0.25)
+    assert cache.get("https://example.com/c") is None  # expired
+
+    # A cached page is re-excerpted for a new focus without being downloaded again
+    page_cache.put("https://docs.example.org/guide", text)
+    try:
+        focused = asyncio.run(read_webpage("https://docs.example.org/guide", focus="BM25 ranking"))
+        unfocused = asyncio.run(read_webpage("https://docs.example.org/guide"))
+    finally:
+        page_cache.clear()
+    assert "BM25 ranking scores each passage" in focused and len(focused) <= Config.EXCERPT_MAX_CHARS
+    assert unfocused.startswith("Home | Products")
+    logger.info("Focused Excerpts Test Passed!")
+
+def test_fanout_researcher():
+    logger.info("Testing fan-out researcher against a fake server...")
+    os.environ.setdefault("OPENAI_API_KEY", "test-key")
+    from openai import AsyncOpenAI
+    import agent.observable_agent as observable_agent
+    from agent.fanout import FanOutResearcher, dedupe_sources, parse_subquestions
+    from agent.llm_gateway import LLMGateway
+
+    assert parse_subquestions('Sure: ["What is A?", "what is  a?", "How does B work?"]', 5) == ["What is A?", "How does B work?"]
+    assert parse_subquestions("1. First\n- Second\n\n3) Third", 2) == ["First", "Second"]
+    assert dedupe_sources(["https://Example.com/a#x", "https://example.com/a.", "https://b.org"]) == \
+        ["https://Example.com/a#x", "https://b.org"]
+
+    plan = json.dumps(["Sub A?", "Sub B?", "Sub C?"])
+    finding = "Finding with sources https://example.com/a and https://EXAMPLE.com/a#top plus https://b.org/x."
+    gateway = LLMGateway()
+    with _FakeOpenAIServer([{"content": plan}, {"delay": 0.3, "content": finding}]) as server:
+        original = observable_agent.client
+
+        async def fanout_run():
+            observable_agent.client = AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+            try:
+                researcher = FanOutResearcher(
+                    width=3, worker_steps=2, max_concurrency=3, compare_serial=True,
+                    verbose=False, cache_completions=False, gateway=gateway, routing=None,
+                )
+                return await researcher.run("Broad question")
+            finally:
+                await observable_agent.client.close()
+
+        try:
+            result = asyncio.run(fanout_run())
+        finally:
+            observable_agent.client = original
+
+    fanout = result["fanout"]
+    assert fanout["sub_questions"] == ["Sub A?", "Sub B?", "Sub C?"]
+    assert server.max_in_flight >= 2 and fanout["wall_ms"] < fanout["serial_estimate_ms"]
+    assert fanout["sources"] == ["https://example.com/a", "https://b.org/x"]
+    assert result["answer"].count("### ") == 4 and "Sub B?" in result["answer"]
+    # Plan + 3 workers, 5 prompt tokens each
+    assert result["total_input_tokens"] == 20 and result["cost_by_model"]
+    assert fanout["serial"]["wall_ms"] >= 300 and fanout["serial"]["input_tokens"] == 5
+
+    trace = tracer.get_trace(result["trace_id"])
+    assert len(trace.steps) == 4 and trace.counters["fanout.sub_questions"] == 3
+    assert trace.counters["fanout.sources_deduplicated"] == 4
+    assert "fanout.serial_wall_ms" in trace.counters and "fanout.wall_ms" in trace.counters
+    logger.info("Fan-out Researcher Test Passed!")
+
 if __name__ == "__main__":
     test_registry()
     test_loop_detector()
     test_tracer()
+    test_tool_executor()
+    test_async_tool_registration()
+    test_persistent_cache()
+    test_completion_cache()
+    test_tool_call_assembler()
+    test_agent_astream()
+    test_batch_runner()
+    test_context_manager()
+    test_url_safety()
+    test_html_extract()
+    test_segment_store()
+    test_vector_index()
+    test_embedding_pipeline()
+    test_lazy_imports()
+    test_loop_detector_bounded()
+    test_agent_loop_policies()
+    test_trace_store()
+    test_spans()
+    test_profiler()
+    test_pricing_and_budgets()
+    test_model_routing()
+    test_llm_gateway()
+    test_hedging_and_deadlines()
+    test_tool_dispatch()
+    test_focused_excerpts()
+    test_fanout_researcher()